@@ -1,17 +1,98 @@
-from flask import Flask, request, jsonify
+from contextlib import ExitStack
+from flask import Flask, request, jsonify, Response, stream_with_context
+from pydantic import BaseModel
 from services.ai_service import AIService
+from services.cache import response_cache, extraction_cache, translation_cache
+from services.batch import BatchProcessor
+from services.scheduler import PriorityScheduler, SchedulerSaturated
+from services.incident_store import get_incident_store
+from services.incident_feed import FEED_HEARTBEAT_SECONDS, FeedFilter, format_sse, get_incident_feed, parse_last_event_id
+from services.spatial_index import active_incidents
+from services.tools import guidance_catalog
+from services.resilience import breaker_stats
+from services.metrics import registry, render_prometheus, render_samples
+from services.logging_config import configure_logging, log_payload
 from flask_cors import CORS  # Import CORS to handle cross-origin requests
-from dotenv import load_dotenv
+import datetime
+import json
+import logging
 import os
 
+configure_logging()
+logger = logging.getLogger(__name__)
+
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
 ai_service = AIService()
+scheduler = PriorityScheduler()
+batch_processor = BatchProcessor(ai_service, scheduler=scheduler)
+
+MAX_BATCH_SIZE = int(os.getenv("BATCH_MAX_ITEMS", "500"))
+
+
+def _collect_service_metrics():
+    """Cache, scheduler and session gauges, read from their stats at scrape time"""
+    caches = {
+        "response": response_cache.stats(),
+        "extraction": extraction_cache.stats(),
+        "translation": translation_cache.stats()
+    }
+    lines = []
+    for field, metric_type, help_text in (
+        ("hits", "counter", "Cache hits"),
+        ("misses", "counter", "Cache misses"),
+        ("evictions", "counter", "Entries evicted to stay within max size"),
+        ("size", "gauge", "Entries currently cached"),
+    ):
+        lines += render_samples(
+            f"emergency_cache_{field}" + ("_total" if metric_type == "counter" else ""),
+            help_text, metric_type,
+            [({"cache": name}, stats[field]) for name, stats in caches.items()]
+        )
+
+    priorities = scheduler.stats()["priorities"]
+    for field, metric_type, help_text in (
+        ("queue_depth", "gauge", "Requests waiting for a scheduler slot"),
+        ("in_flight", "gauge", "Requests currently running"),
+        ("rejected", "counter", "Requests shed because the queue was full or the wait too long"),
+    ):
+        lines += render_samples(
+            f"emergency_scheduler_{field}" + ("_total" if metric_type == "counter" else ""),
+            help_text, metric_type,
+            [({"priority": name}, stats[field]) for name, stats in priorities.items()]
+        )
+
+    lines += render_samples(
+        "emergency_sessions", "Active conversation sessions", "gauge",
+        [({}, ai_service.sessions.stats()["sessions"])]
+    )
+    lines += render_samples(
+        "emergency_active_incidents", "Incidents in the duplicate-matching window", "gauge",
+        [({}, len(active_incidents))]
+    )
+    feed = get_incident_feed().stats()
+    lines += render_samples(
+        "emergency_feed_subscribers", "Open incident feed connections", "gauge",
+        [({}, feed["subscribers"])]
+    )
+    lines += render_samples(
+        "emergency_feed_lagging_subscribers", "Feed subscribers with their buffer at least half full", "gauge",
+        [({}, feed["lagging_subscribers"])]
+    )
+    breakers = breaker_stats()
+    lines += render_samples(
+        "emergency_llm_circuit_open", "1 while the model's circuit breaker is open or half-open", "gauge",
+        [({"model": model}, int(stats["state"] != "closed")) for model, stats in breakers.items()]
+    )
+    lines += render_samples(
+        "emergency_llm_circuit_opened_total", "Times the model's circuit breaker opened", "counter",
+        [({"model": model}, stats["times_opened"]) for model, stats in breakers.items()]
+    )
+    return lines
 
-secret_key = os.getenv("OPEN_AI_KEY")
 
-print(secret_key)
+registry.register_collector(_collect_service_metrics)
 
 
 
@@ -50,26 +131,250 @@ print(secret_key)
 @app.route('/api/query', methods=['POST'])
 def process_user_query():
     try:
-        print("Received request to process user query")
         data = request.get_json()
-        print(f"Received data: {data}")
+        log_payload(logger, "Received query", data)
         
         if not data or 'query' not in data:
             return jsonify({'error': 'Query is required'}), 400
         
         user_query = data['query']
         
-        # Process the query using the AI service
-        response = ai_service.get_response(user_query)
+        # Process the query using the AI service once the scheduler admits it
+        response = scheduler.run(user_query, ai_service.get_response, user_query)
         
         return jsonify({
             'query': user_query,
             'response': response
         })
         
+    except SchedulerSaturated as e:
+        return _saturated_response(e)
+    except Exception as e:
+        logger.exception("Error processing query")
+        return jsonify({'error': str(e)}), 500
+
+def _saturated_response(e):
+    """503 response for a request shed by the scheduler"""
+    response = jsonify({'error': str(e), 'status': 'rejected', 'priority': e.priority, 'retry_after': e.retry_after})
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, 503
+
+@app.route('/api/query/batch', methods=['POST'])
+def process_user_query_batch():
+    try:
+        data = request.get_json(silent=True)
+        
+        if not data or not isinstance(data.get('queries'), list) or not data['queries']:
+            return jsonify({'error': 'A non-empty list of queries is required'}), 400
+        
+        queries = data['queries']
+        if len(queries) > MAX_BATCH_SIZE:
+            return jsonify({'error': f'At most {MAX_BATCH_SIZE} queries are allowed per batch'}), 400
+        
+        results = batch_processor.process(queries, batch_extraction=bool(data.get('batch_extraction')))
+        
+        return jsonify({'results': results})
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def _json_default(value):
+    if isinstance(value, BaseModel):
+        return value.model_dump()
+    return str(value)
+
+def _sse_event(event, data):
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, default=_json_default)}\n\n"
+
+@app.route('/api/query/stream', methods=['POST'])
+def stream_user_query():
+    data = request.get_json(silent=True)
+    
+    if not data or 'query' not in data:
+        return jsonify({'error': 'Query is required'}), 400
+    
+    user_query = data['query']
+    
+    # Admitted before the response starts, so a shed stream still gets a 503;
+    # the slot is held until the stream is closed
+    admission = ExitStack()
+    try:
+        admission.enter_context(scheduler.slot(user_query))
+    except SchedulerSaturated as e:
+        return _saturated_response(e)
+    
+    def generate():
+        try:
+            for event, event_data in ai_service.stream_response(user_query):
+                yield _sse_event(event, event_data)
+        except Exception as e:
+            yield _sse_event('error', {'error': str(e)})
+    
+    response = Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    response.call_on_close(admission.close)
+    return response
+
+def _parse_time(value):
+    """Parse an ISO 8601 or UNIX timestamp query parameter"""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.datetime.fromisoformat(value).timestamp()
+
+def _parse_bbox(value):
+    """Parse a min_lat,min_lon,max_lat,max_lon query parameter"""
+    if not value:
+        return None
+    bbox = tuple(float(v) for v in value.split(','))
+    if len(bbox) != 4:
+        raise ValueError('bbox must be min_lat,min_lon,max_lat,max_lon')
+    return bbox
+
+@app.route('/api/incidents', methods=['GET'])
+def list_incidents():
+    try:
+        args = request.args
+        bbox = _parse_bbox(args.get('bbox'))
+        limit = min(int(args.get('limit', 50)), 500)
+        
+        page = get_incident_store().list(
+            service_type=args.get('service_type'),
+            severity=args.get('severity'),
+            status=args.get('status'),
+            since=_parse_time(args.get('since')),
+            until=_parse_time(args.get('until')),
+            bbox=bbox,
+            limit=limit,
+            cursor=args.get('cursor')
+        )
+        return jsonify(page)
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/incidents/active', methods=['GET'])
+def list_active_incidents():
+    # Imported on first use; numpy is not needed to start the app
+    from services.incident_table import get_active_incident_table
+    try:
+        args = request.args
+        bbox = _parse_bbox(args.get('bbox'))
+        limit = min(int(args.get('limit', 50)), 500)
+        
+        table = get_active_incident_table()
+        table.refresh()
+        return jsonify(table.query(
+            limit,
+            service_type=args.get('service_type'),
+            severity=args.get('severity'),
+            status=args.get('status'),
+            since=_parse_time(args.get('since')),
+            until=_parse_time(args.get('until')),
+            bbox=bbox
+        ))
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/incidents/<incident_id>', methods=['GET'])
+def get_incident(incident_id):
+    incident = get_incident_store().get(incident_id)
+    if incident is None:
+        return jsonify({'error': 'Incident not found'}), 404
+    return jsonify(incident)
+
+@app.route('/api/incidents/<incident_id>', methods=['PATCH'])
+def update_incident(incident_id):
+    data = request.get_json(silent=True)
+    if not data or not data.get('status'):
+        return jsonify({'error': 'Status is required'}), 400
+    if not get_incident_store().update_status(incident_id, data['status']):
+        return jsonify({'error': 'Incident not found'}), 404
+    incident = get_incident_store().get(incident_id)
+    # Closed incidents no longer absorb nearby reports. Attached reports carry
+    # their primary incident's alert ID, so closing one leaves the primary indexed
+    response_details = (incident.get('report') or {}).get('response_details') or {}
+    if data['status'] != 'open' and incident.get('alert_id') and not response_details.get('duplicate_of'):
+        active_incidents.remove(incident['alert_id'])
+    get_incident_feed().publish_status(incident)
+    return jsonify(incident)
+
+@app.route('/api/incidents/feed', methods=['GET'])
+def stream_incident_feed():
+    try:
+        feed_filter = FeedFilter.from_params(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    last_event_id = parse_last_event_id(request.headers.get('Last-Event-ID') or request.args.get('last_event_id'))
+    
+    def generate():
+        # Subscribed once streaming starts; the finally block runs when the client disconnects
+        feed = get_incident_feed()
+        subscription = feed.subscribe(feed_filter, last_event_id)
+        try:
+            yield ': connected\n\n'
+            while True:
+                messages = subscription.get(FEED_HEARTBEAT_SECONDS)
+                # The heartbeat keeps proxies from closing an idle stream
+                yield ''.join(format_sse(m) for m in messages) or ': keepalive\n\n'
+        finally:
+            feed.unsubscribe(subscription)
+    
+    return Response(
+        generate(),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/cache/stats', methods=['GET'])
+def get_cache_stats():
+    return jsonify({
+        'response': response_cache.stats(),
+        'extraction': extraction_cache.stats(),
+        'translation': translation_cache.stats()
+    })
+
+@app.route('/api/scheduler/stats', methods=['GET'])
+def get_scheduler_stats():
+    return jsonify(scheduler.stats())
+
+@app.route('/api/llm/circuits', methods=['GET'])
+def get_circuit_stats():
+    return jsonify(breaker_stats())
+
+@app.route('/api/guidance/reload', methods=['POST'])
+def reload_guidance():
+    try:
+        reloaded = guidance_catalog.reload(force=True)
+    except (OSError, ValueError) as e:
+        logger.error("Could not reload guidance catalog: %s", e)
+        return jsonify({'error': str(e), 'reloaded': False, **guidance_catalog.stats()}), 500
+    return jsonify({'reloaded': reloaded, **guidance_catalog.stats()})
+
+@app.route('/ready', methods=['GET'])
+def get_readiness():
+    # Cache and fast-path requests are served before this; agent and hybrid
+    # requests wait for the warm-up, so route traffic here only once ready
+    return jsonify({
+        'ready': ai_service.is_ready,
+        'warm_up_seconds': ai_service.warm_up_seconds
+    }), 200 if ai_service.is_ready else 503
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(render_prometheus(), mimetype='text/plain; version=0.0.4')
+
 if __name__ == '__main__':
     app.run(debug=True)
 
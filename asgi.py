@@ -0,0 +1,220 @@
+import asyncio
+import json
+import logging
+from urllib.parse import parse_qs
+from services.ai_service import AIService
+from services.incident_feed import FEED_HEARTBEAT_SECONDS, FeedFilter, format_sse, get_incident_feed, parse_last_event_id
+from services.logging_config import configure_logging
+from services.scheduler import PriorityScheduler, SchedulerSaturated
+
+# Async serving mode for /api/query.
+# Each request is a coroutine on the event loop instead of a blocked worker
+# thread, so one process can hold hundreds of in-flight emergencies while the
+# agent waits on OpenAI. The dispatcher incident feed is served here as SSE
+# and WebSocket; each subscriber is a coroutine rather than a thread, so a
+# process holds thousands of them.
+#
+# Run with:
+#     uvicorn asgi:app --host 0.0.0.0 --port 5000
+
+configure_logging()
+logger = logging.getLogger(__name__)
+
+ai_service = AIService()
+scheduler = PriorityScheduler()
+
+
+async def _read_body(receive):
+    """Read the full request body from the ASGI receive channel"""
+    body = b""
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get("body", b"")
+        more_body = message.get("more_body", False)
+    return body
+
+
+async def _send_json(send, payload, status=200, headers=()):
+    """Send a JSON response on the ASGI send channel"""
+    body = json.dumps(payload).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode("ascii")),
+            (b"access-control-allow-origin", b"*"),
+            *headers,
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def process_user_query(scope, receive, send):
+    try:
+        try:
+            data = json.loads(await _read_body(receive) or b"null")
+        except ValueError:
+            data = None
+
+        if not data or 'query' not in data:
+            return await _send_json(send, {'error': 'Query is required'}, 400)
+
+        user_query = data['query']
+
+        # Process the query once the scheduler admits it, without blocking the loop
+        response = await scheduler.arun(user_query, ai_service.aget_response, user_query)
+
+        return await _send_json(send, {
+            'query': user_query,
+            'response': response
+        })
+
+    except SchedulerSaturated as e:
+        return await _send_json(
+            send,
+            {'error': str(e), 'status': 'rejected', 'priority': e.priority, 'retry_after': e.retry_after},
+            503,
+            [(b"retry-after", str(e.retry_after).encode("ascii"))]
+        )
+    except Exception as e:
+        logger.exception("Error processing query")
+        return await _send_json(send, {'error': str(e)}, 500)
+
+
+async def readiness(scope, receive, send):
+    return await _send_json(send, {
+        'ready': ai_service.is_ready,
+        'warm_up_seconds': ai_service.warm_up_seconds
+    }, 200 if ai_service.is_ready else 503)
+
+
+def _feed_params(scope):
+    """Feed filter and Last-Event-ID of a feed request"""
+    params = {k: ",".join(v) for k, v in parse_qs(scope.get("query_string", b"").decode("latin-1")).items()}
+    headers = dict(scope.get("headers", []))
+    last_event_id = headers.get(b"last-event-id", b"").decode("latin-1") or params.get("last_event_id")
+    return FeedFilter.from_params(params), parse_last_event_id(last_event_id)
+
+
+async def _run_until_first(*coroutines):
+    """Run coroutines until one returns, e.g. the client disconnecting, then cancel the rest"""
+    tasks = [asyncio.ensure_future(c) for c in coroutines]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+    for task in done:
+        if not task.cancelled() and task.exception() is not None and not isinstance(task.exception(), OSError):
+            raise task.exception()
+
+
+async def stream_incident_feed(scope, receive, send):
+    try:
+        feed_filter, last_event_id = _feed_params(scope)
+    except ValueError as e:
+        return await _send_json(send, {'error': str(e)}, 400)
+
+    feed = get_incident_feed()
+    subscription = feed.subscribe(feed_filter, last_event_id, loop=asyncio.get_running_loop())
+
+    async def pump():
+        await send({"type": "http.response.body", "body": b": connected\n\n", "more_body": True})
+        while True:
+            messages = await subscription.aget(FEED_HEARTBEAT_SECONDS)
+            # The heartbeat keeps proxies from closing an idle stream
+            body = "".join(format_sse(m) for m in messages) or ": keepalive\n\n"
+            await send({"type": "http.response.body", "body": body.encode("utf-8"), "more_body": True})
+
+    async def disconnected():
+        while (await receive())["type"] != "http.disconnect":
+            pass
+
+    try:
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/event-stream"),
+                (b"cache-control", b"no-cache"),
+                (b"x-accel-buffering", b"no"),
+                (b"access-control-allow-origin", b"*"),
+            ],
+        })
+        await _run_until_first(pump(), disconnected())
+    finally:
+        feed.unsubscribe(subscription)
+
+
+async def incident_feed_socket(scope, receive, send):
+    if (await receive())["type"] != "websocket.connect":
+        return
+    try:
+        feed_filter, last_event_id = _feed_params(scope)
+    except ValueError:
+        return await send({"type": "websocket.close", "code": 1008})
+    await send({"type": "websocket.accept"})
+
+    feed = get_incident_feed()
+    subscription = feed.subscribe(feed_filter, last_event_id, loop=asyncio.get_running_loop())
+
+    async def pump():
+        while True:
+            for message in await subscription.aget():
+                await send({"type": "websocket.send", "text": json.dumps(message, default=str)})
+
+    async def listen():
+        # A text message with service_type, severity and bbox replaces the filter
+        while True:
+            message = await receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            if not message.get("text"):
+                continue
+            try:
+                feed.update_filter(subscription, FeedFilter.from_params(json.loads(message["text"])))
+            except ValueError as e:
+                await send({"type": "websocket.send", "text": json.dumps({"type": "feed.error", "error": str(e)})})
+
+    try:
+        await _run_until_first(pump(), listen())
+    finally:
+        feed.unsubscribe(subscription)
+
+
+ROUTES = {
+    ('POST', '/api/query'): process_user_query,
+    ('GET', '/api/incidents/feed'): stream_incident_feed,
+    ('GET', '/ready'): readiness,
+}
+
+WEBSOCKET_ROUTES = {
+    '/api/incidents/feed': incident_feed_socket,
+}
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    if scope["type"] == "websocket":
+        handler = WEBSOCKET_ROUTES.get(scope["path"])
+        if handler is None:
+            return await send({"type": "websocket.close", "code": 1000})
+        return await handler(scope, receive, send)
+
+    if scope["type"] != "http":
+        return
+
+    handler = ROUTES.get((scope["method"], scope["path"]))
+    if handler is None:
+        return await _send_json(send, {'error': 'Not found'}, 404)
+    return await handler(scope, receive, send)
@@ -0,0 +1,47 @@
+"""
+Micro-benchmark for the per-request agent setup cost in AIService.
+
+Compares building the prompt, agent and AgentExecutor on every request
+(the previous behaviour of get_response) against reusing the executor
+compiled once in AIService.__init__. No network calls are made.
+
+Run with:
+    python -m benchmarks.agent_setup_benchmark
+"""
+import os
+import time
+import tracemalloc
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+from services.ai_service import AIService
+
+ITERATIONS = 200
+
+
+def _measure(label, setup):
+    """Time and trace allocations for ITERATIONS calls of setup()"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        setup()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    per_call_us = elapsed / ITERATIONS * 1_000_000
+    print(f"{label:<28} {per_call_us:>12.1f} us/request {peak / 1024:>12.1f} KiB peak")
+    return per_call_us
+
+
+def main():
+    service = AIService()
+
+    print(f"Agent setup cost over {ITERATIONS} requests")
+    before = _measure("per-request build (before)", service._create_agent_executor)
+    after = _measure("precompiled reuse (after)", lambda: service.agent_executor)
+    print(f"Setup time saved per request: {before - after:.1f} us")
+
+
+if __name__ == "__main__":
+    main()
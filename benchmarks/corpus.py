@@ -0,0 +1,81 @@
+"""
+Transcript corpus for offline benchmarks and load tests.
+
+Covers every EmergencyServiceType in English and te reo Māori, with the
+extraction the fake OpenAI server returns for each transcript. Locations
+are spread around the Wellington region.
+"""
+from typing import Dict, List, Optional
+
+CORPUS: List[Dict] = [
+    # ambulance
+    {"transcript": "My dad collapsed in the kitchen and he is not breathing, please hurry",
+     "language": "en", "emergency_type": "ambulance", "severity": "critical", "location": (-41.2865, 174.7762)},
+    {"transcript": "Kua hinga tōku pāpā, kāore ia e hā ana, tukuna mai he waka tūroro",
+     "language": "mi", "emergency_type": "ambulance", "severity": "critical", "location": (-41.2206, 174.8050)},
+    # fire
+    {"transcript": "There is smoke and flames coming out of the house next door",
+     "language": "en", "emergency_type": "fire", "severity": "high", "location": (-41.2920, 174.7790)},
+    {"transcript": "Kei te wera te whare, he nui te auahi, āwhina mai",
+     "language": "mi", "emergency_type": "fire", "severity": "high", "location": (-41.1390, 174.8390)},
+    # police
+    {"transcript": "Someone is trying to break into my house right now, I can hear them at the back door",
+     "language": "en", "emergency_type": "police", "severity": "high", "location": (-41.3000, 174.7800)},
+    {"transcript": "He tangata e whawhai ana i waho, he naihi tāna, tukuna mai ngā pirihimana",
+     "language": "mi", "emergency_type": "police", "severity": "critical", "location": (-41.2100, 174.9000)},
+    # medevac
+    {"transcript": "We are on a remote farm road, my friend fell off the quad bike and can't move his legs",
+     "language": "en", "emergency_type": "medevac", "severity": "critical", "location": (-41.0500, 175.2000)},
+    # coastguard
+    {"transcript": "Our boat has lost power and we are drifting towards the rocks near the harbour entrance",
+     "language": "en", "emergency_type": "coastguard", "severity": "high", "location": (-41.3500, 174.8300)},
+    {"transcript": "Kua tahuri tō mātou waka i te moana, e toru ngā tāngata kei roto i te wai",
+     "language": "mi", "emergency_type": "coastguard", "severity": "critical", "location": (-41.3300, 174.7000)},
+    # mountain_rescue
+    {"transcript": "I'm a tramper lost on the ridge above the hut, it is getting dark and my ankle is broken",
+     "language": "en", "emergency_type": "mountain_rescue", "severity": "high", "location": (-40.9500, 175.3000)},
+    # hazmat
+    {"transcript": "A truck has spilled some chemical on the motorway and people are coughing",
+     "language": "en", "emergency_type": "hazmat", "severity": "high", "location": (-41.2300, 174.8100)},
+    # mentalhealth
+    {"transcript": "My flatmate says he wants to end his life and won't come out of his room",
+     "language": "en", "emergency_type": "mentalhealth", "severity": "critical", "location": (-41.2950, 174.7750)},
+    {"transcript": "Kei te pōuri rawa tōku hoa, e kōrero ana ia mō te whakamomori",
+     "language": "mi", "emergency_type": "mentalhealth", "severity": "critical", "location": (-41.1300, 174.8500)},
+    # animal_control
+    {"transcript": "There is an aggressive dog loose in the playground chasing children",
+     "language": "en", "emergency_type": "animal_control", "severity": "medium", "location": (-41.2400, 174.7900)},
+    # disaster_response
+    {"transcript": "The river has flooded and water is coming through the walls on Main Rd",
+     "language": "en", "emergency_type": "disaster_response", "severity": "high", "location": (-41.1200, 175.0700)},
+    {"transcript": "Kua horo te whenua ki runga i ngā whare, kua kati te huarahi",
+     "language": "mi", "emergency_type": "disaster_response", "severity": "high", "location": (-41.2000, 174.9500)},
+    # foodbank
+    {"transcript": "We have run out of food and my kids haven't eaten since yesterday",
+     "language": "en", "emergency_type": "foodbank", "severity": "medium", "location": (-41.1400, 174.8400)},
+    {"transcript": "Kāore he kai i te whare, kei te hiakai aku tamariki",
+     "language": "mi", "emergency_type": "foodbank", "severity": "medium", "location": (-41.2150, 174.8950)},
+    # shelter
+    {"transcript": "I have been evicted and have nowhere to sleep tonight with my baby",
+     "language": "en", "emergency_type": "shelter", "severity": "medium", "location": (-41.2880, 174.7700)},
+    # other
+    {"transcript": "A power line is down across the footpath outside the school",
+     "language": "en", "emergency_type": "other", "severity": "medium", "location": (-41.2700, 174.7850)},
+    {"transcript": "Kua pakaru te paipa wai, kei te waipuke te huarahi",
+     "language": "mi", "emergency_type": "other", "severity": "low", "location": (-41.3100, 174.7950)},
+]
+
+
+def extraction_for(text: str) -> Optional[Dict]:
+    """The triage extraction for the corpus transcript contained in text, if any"""
+    for entry in CORPUS:
+        if entry["transcript"] in text:
+            latitude, longitude = entry["location"]
+            return {
+                "emergency_type": entry["emergency_type"],
+                "severity": entry["severity"],
+                "location": {"coordinates": f"{latitude}, {longitude}"},
+                "people_affected": 1,
+                "additional_notes": entry["transcript"],
+            }
+    return None
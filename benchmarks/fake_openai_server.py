@@ -0,0 +1,279 @@
+"""
+Local stand-in for the OpenAI chat completions API.
+
+Answers /v1/chat/completions the way the service uses it:
+- function calls (triage_emergency, triage_emergencies) return the corpus
+  extraction for the transcript;
+- tool-calling requests from the agent replay the canned sequence
+  extract -> alert -> report -> next steps -> final EmergencyResponse
+  (a submit_response call when the agent offers that tool, else JSON text);
+- plain chat requests (response wording, translation) return short text.
+
+Every call sleeps for a configurable latency and can fail with a
+configurable rate of 429 responses; both can be overridden per model, e.g.
+to make gpt-4o slow while gpt-4o-mini stays fast. Streaming requests are
+answered as a single SSE chunk. Point the service at it with OPENAI_BASE_URL.
+
+Run standalone with:
+    python -m benchmarks.fake_openai_server --port 8001 --latency 0.2
+    python -m benchmarks.fake_openai_server --model-latency gpt-4o=15 --model-error-rate gpt-4o-mini=0.5
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+from benchmarks.corpus import extraction_for
+
+FALLBACK_EXTRACTION = {"emergency_type": "other", "severity": "medium", "location": {}}
+
+
+def _estimate_tokens(value) -> int:
+    return len(json.dumps(value)) // 4 + 1
+
+
+def _tool_call(name: str, arguments: Dict) -> Dict:
+    return {
+        "id": f"call_{uuid.uuid4().hex[:12]}",
+        "type": "function",
+        "function": {"name": name, "arguments": json.dumps(arguments)},
+    }
+
+
+def _parse_tool_result(content) -> Dict:
+    try:
+        value = json.loads(content)
+        return value if isinstance(value, dict) else {}
+    except (TypeError, ValueError):
+        return {}
+
+
+class FakeOpenAIServer:
+    """Threaded fake OpenAI server with latency and 429 injection"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.05,
+                 jitter: float = 0.0, error_rate: float = 0.0, model_latency: Optional[Dict[str, float]] = None,
+                 model_error_rate: Optional[Dict[str, float]] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.model_latency = dict(model_latency or {})
+        self.model_error_rate = dict(model_error_rate or {})
+        self._lock = threading.Lock()
+        self.counts: Dict[str, int] = {}
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    @property
+    def total_requests(self) -> int:
+        with self._lock:
+            return sum(count for kind, count in self.counts.items() if kind != "rate_limited")
+
+    def reset(self):
+        with self._lock:
+            self.counts = {}
+
+    def start(self) -> "FakeOpenAIServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-openai", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _count(self, kind: str):
+        with self._lock:
+            self.counts[kind] = self.counts.get(kind, 0) + 1
+
+    def complete(self, body: Dict) -> Optional[Dict]:
+        """Build the assistant message for a chat completion request, or None to rate limit"""
+        model = body.get("model")
+        latency = self.model_latency.get(model, self.latency)
+        error_rate = self.model_error_rate.get(model, self.error_rate)
+        time.sleep(max(0.0, latency + random.uniform(-self.jitter, self.jitter)))
+        if error_rate and random.random() < error_rate:
+            self._count("rate_limited")
+            return None
+
+        messages: List[Dict] = body.get("messages", [])
+        user_text = next((m.get("content") or "" for m in reversed(messages) if m.get("role") == "user"), "")
+        if not isinstance(user_text, str):
+            user_text = json.dumps(user_text)
+
+        if body.get("functions"):
+            self._count("function_call")
+            name = body["functions"][0]["name"]
+            if name == "triage_emergencies":
+                emergencies = []
+                for line in user_text.splitlines():
+                    index, _, text = line.partition(". ")
+                    if index.isdigit():
+                        emergencies.append({"index": int(index), **(extraction_for(text) or FALLBACK_EXTRACTION)})
+                arguments = {"emergencies": emergencies}
+            else:
+                arguments = extraction_for(user_text) or FALLBACK_EXTRACTION
+            return {"role": "assistant", "content": None,
+                    "function_call": {"name": name, "arguments": json.dumps(arguments)}}
+
+        if body.get("tools"):
+            self._count("agent_turn")
+            tool_names = {tool.get("function", {}).get("name") for tool in body["tools"]}
+            return self._agent_turn(messages, user_text, "submit_response" in tool_names)
+
+        self._count("chat")
+        return {"role": "assistant", "content": "Help is on the way. Stay where you are and keep your phone with you."}
+
+    def _agent_turn(self, messages: List[Dict], user_text: str, structured_response: bool) -> Dict:
+        """Next step of the canned tool-calling sequence"""
+        tool_results = [m for m in messages if m.get("role") == "tool"]
+        emergency_data = extraction_for(user_text) or FALLBACK_EXTRACTION
+        alert = _parse_tool_result(tool_results[1]["content"]) if len(tool_results) > 1 else {}
+        if not alert.get("service_alerted"):
+            alert = {"alert_sent": True, "service_alerted": emergency_data["emergency_type"]}
+
+        step = len(tool_results)
+        if step == 0:
+            call = _tool_call("extract_emergency_data", {"transcript": user_text})
+        elif step == 1:
+            call = _tool_call("alert_emergency_services", {"emergency_data": emergency_data})
+        elif step == 2:
+            call = _tool_call("generate_report", {"emergency_data": emergency_data, "response_data": alert})
+        elif step == 3:
+            call = _tool_call("find_next_steps", {"emergency_data": emergency_data, "services_response": alert})
+        else:
+            response = {
+                "response_message": f"{emergency_data['emergency_type']} services have been alerted.",
+                "emergency_type": emergency_data["emergency_type"],
+                "resources_alerted": [emergency_data["emergency_type"]],
+            }
+            if not structured_response:
+                return {"role": "assistant", "content": json.dumps(response)}
+            call = _tool_call("submit_response", response)
+        return {"role": "assistant", "content": None, "tool_calls": [call]}
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status: int, payload: Dict, headers: Optional[Dict] = None):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    return self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+                message = server.complete(body)
+                if message is None:
+                    return self._send_json(
+                        429, {"error": {"message": "Rate limit reached", "type": "rate_limit_error"}},
+                        {"Retry-After": "0"}
+                    )
+
+                model = body.get("model", "gpt-4o")
+                usage = {
+                    "prompt_tokens": _estimate_tokens(body.get("messages", [])),
+                    "completion_tokens": _estimate_tokens(message),
+                }
+                usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+                finish_reason = "tool_calls" if message.get("tool_calls") else (
+                    "function_call" if message.get("function_call") else "stop"
+                )
+                completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+
+                if body.get("stream"):
+                    return self._stream(completion_id, model, message, finish_reason, usage)
+                self._send_json(200, {
+                    "id": completion_id,
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+                    "usage": usage,
+                })
+
+            def _stream(self, completion_id, model, message, finish_reason, usage):
+                delta = dict(message)
+                if delta.get("tool_calls"):
+                    delta["tool_calls"] = [{"index": i, **call} for i, call in enumerate(delta["tool_calls"])]
+                chunks = [
+                    {"index": 0, "delta": delta, "finish_reason": None},
+                    {"index": 0, "delta": {}, "finish_reason": finish_reason},
+                ]
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                for choice in chunks:
+                    chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                             "model": model, "choices": [choice]}
+                    if choice["finish_reason"]:
+                        chunk["usage"] = usage
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.close_connection = True
+
+        return Handler
+
+
+def parse_model_values(values: Optional[List[str]]) -> Dict[str, float]:
+    """Parse repeated MODEL=VALUE command line options"""
+    result = {}
+    for value in values or []:
+        model, _, number = value.partition("=")
+        if not model or not number:
+            raise argparse.ArgumentTypeError(f"Expected MODEL=VALUE, got '{value}'")
+        result[model] = float(number)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds per completion")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Uniform +/- seconds added to the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--model-latency", action="append", metavar="MODEL=SECONDS",
+                        help="Latency for one model, overriding --latency; repeatable")
+    parser.add_argument("--model-error-rate", action="append", metavar="MODEL=RATE",
+                        help="429 rate for one model, overriding --error-rate; repeatable")
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(
+        args.host, args.port, args.latency, args.jitter, args.error_rate,
+        parse_model_values(args.model_latency), parse_model_values(args.model_error_rate)
+    )
+    print(f"Fake OpenAI API listening on {server.url}")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
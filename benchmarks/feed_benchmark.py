@@ -0,0 +1,119 @@
+"""
+Incident feed fan-out benchmark.
+
+Subscribes --subscribers asyncio subscribers to an in-process feed, as the
+ASGI endpoints do, with a --slow-fraction of them never reading, and
+publishes --events incidents from a separate thread, as the tools do on a
+request thread. Reports:
+- publish_ms: time spent in publish() on the publishing thread
+- delivery_ms: from publish to a reading subscriber receiving the event
+- dropped: events dropped from the slow subscribers' buffers; reading
+  subscribers must receive every event
+
+Run with:
+    python -m benchmarks.feed_benchmark --subscribers 5000 --events 500
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import threading
+import time
+
+from services.incident_feed import CREATED, FeedFilter, IncidentFeed
+
+SERVICE_TYPES = ["ambulance", "fire", "police"]
+SEVERITIES = ["low", "medium", "high", "critical"]
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+
+def _filter(i: int) -> FeedFilter:
+    # A mix of consoles: everything, one service type, critical only
+    if i % 3 == 0:
+        return FeedFilter()
+    if i % 3 == 1:
+        return FeedFilter(service_types=frozenset([SERVICE_TYPES[i % len(SERVICE_TYPES)]]))
+    return FeedFilter(severities=frozenset(["critical"]))
+
+
+async def run(subscribers: int, events: int, slow_fraction: float, rate: float, buffer_size: int) -> dict:
+    feed = IncidentFeed(buffer_size=buffer_size)
+    loop = asyncio.get_running_loop()
+    slow_count = int(subscribers * slow_fraction)
+    readers = [feed.subscribe(_filter(i), loop=loop) for i in range(subscribers - slow_count)]
+    slow = [feed.subscribe(loop=loop) for _ in range(slow_count)]
+    expected = [sum(1 for n in range(events) if s.filter.matches(_event(n))) for s in readers]
+
+    publish_times, delivery = [], []
+
+    def publish():
+        for n in range(events):
+            started = time.perf_counter()
+            event = _event(n)
+            feed.publish(CREATED, event["incident_id"], event["service_type"], event["severity"], None,
+                         published_at=time.perf_counter())
+            publish_times.append(time.perf_counter() - started)
+            if rate:
+                time.sleep(1 / rate)
+
+    async def read(subscription, count):
+        received = 0
+        while received < count:
+            for message in await subscription.aget(5):
+                if message["type"] == CREATED:
+                    received += 1
+                    delivery.append(time.perf_counter() - message["changes"]["published_at"])
+        return received
+
+    started = time.perf_counter()
+    publisher = threading.Thread(target=publish)
+    publisher.start()
+    received = await asyncio.gather(*[read(s, count) for s, count in zip(readers, expected)])
+    publisher.join()
+    elapsed = time.perf_counter() - started
+
+    return {
+        "subscribers": subscribers,
+        "slow_subscribers": slow_count,
+        "events": events,
+        "deliveries": sum(received),
+        "missing_deliveries": sum(expected) - sum(received),
+        "dropped": sum(s.dropped for s in slow),
+        "deliveries_per_second": round(sum(received) / elapsed),
+        "publish_ms": {"p50": round(_percentile(publish_times, 0.5) * 1000, 3),
+                       "p99": round(_percentile(publish_times, 0.99) * 1000, 3)},
+        "delivery_ms": {"p50": round(_percentile(delivery, 0.5) * 1000, 2),
+                        "p99": round(_percentile(delivery, 0.99) * 1000, 2),
+                        "mean": round(statistics.fmean(delivery) * 1000, 2) if delivery else 0.0},
+    }
+
+
+def _event(n: int) -> dict:
+    return {
+        "incident_id": f"EM-BENCH-{n}",
+        "service_type": SERVICE_TYPES[n % len(SERVICE_TYPES)],
+        "severity": SEVERITIES[n % len(SEVERITIES)],
+        "latitude": None,
+        "longitude": None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--subscribers", type=int, default=2000)
+    parser.add_argument("--events", type=int, default=200)
+    parser.add_argument("--slow-fraction", type=float, default=0.05, help="Subscribers that never read")
+    parser.add_argument("--rate", type=float, default=100, help="Events published per second; 0 for as fast as possible")
+    parser.add_argument("--buffer-size", type=int, default=64, help="Per-subscriber buffer")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args.subscribers, args.events, args.slow_fraction, args.rate, args.buffer_size))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Memory and filter benchmark for the columnar incident table.
+
+Loads --incidents synthetic reports (1M by default) into an IncidentTable
+and measures:
+- table_bytes_per_incident: growth of resident memory while loading: the
+  table's columns, interned strings, ID index and compressed report blobs
+- pydantic_bytes_per_incident: the same reports held as an
+  ExtractedEmergencyData and a ReportResponse each
+- dict_bytes_per_incident: the same reports held as parsed JSON dicts
+The two baselines are measured with tracemalloc on --sample reports and
+scaled up, since a million of them would not fit in memory on most
+machines. tracemalloc would slow the 1M-row load tenfold, hence resident
+memory for the table.
+
+Filter timings are medians over --repeats of vectorised selects on the full
+table, against a list comprehension over the dict sample scaled to the
+same size.
+
+Run with:
+    python -m benchmarks.incident_table_benchmark --incidents 1000000
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import statistics
+import time
+import tracemalloc
+import uuid
+
+from services.incident_store import incident_record
+from services.incident_table import IncidentTable
+from services.tools import EmergencyServiceType, ExtractedEmergencyData, ReportResponse
+
+# Roughly the Wellington region
+MIN_LAT, MAX_LAT = -41.6, -40.9
+MIN_LON, MAX_LON = 174.6, 175.3
+
+SERVICE_TYPES = [t.value for t in EmergencyServiceType]
+SEVERITIES = ["low", "medium", "high", "critical"]
+RISKS = ["smoke", "fire spreading", "traffic", "weapons", "unconscious person", "flooding", "gas leak"]
+RESOURCES = ["fire truck", "ambulance", "police unit", "rescue boat", "paramedics"]
+STREETS = [f"{n} {name} Street" for n in range(1, 200) for name in ("Cuba", "Willis", "Lambton", "Victoria", "Taranaki")]
+
+
+def _report(rng: random.Random, now: float):
+    service_type = rng.choice(SERVICE_TYPES)
+    severity = rng.choice(SEVERITIES)
+    latitude, longitude = rng.uniform(MIN_LAT, MAX_LAT), rng.uniform(MIN_LON, MAX_LON)
+    stamp = time.strftime("%Y%m%d%H%M%S", time.gmtime(now))
+    report = {
+        "report_id": f"RPT-{stamp}-{uuid.UUID(int=rng.getrandbits(128)).hex[:12]}",
+        "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(now)),
+        "emergency_details": {
+            "emergency_type": service_type,
+            "person_profile": {"age": str(rng.randint(5, 90)), "gender": None, "medical_conditions": None},
+            "location": {"address": rng.choice(STREETS), "landmarks": None, "coordinates": f"{latitude:.5f}, {longitude:.5f}"},
+            "time_of_incident": None,
+            "people_affected": rng.randint(1, 6),
+            "immediate_risks": rng.sample(RISKS, 2),
+            "resources_needed": rng.sample(RESOURCES, 1),
+            "additional_notes": None,
+            "severity": severity,
+        },
+        "response_details": {
+            "alert_sent": True,
+            "service_alerted": service_type,
+            "severity_reported": severity,
+            "estimated_response_time": "5-10 minutes",
+            "alert_time": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(now)),
+            "alert_id": f"EM-{stamp}-{uuid.UUID(int=rng.getrandbits(128)).hex[:12]}",
+            "duplicate_of": None,
+            "reports": None,
+            "error": None,
+        },
+        "status": "open",
+    }
+    return report, (latitude, longitude)
+
+
+def _rss_bytes() -> int:
+    """Resident memory of this process"""
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def _traced_bytes(build):
+    """Bytes still allocated by build() once it returns, and its result"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return after - before, result
+
+
+def _median_ms(func, repeats: int) -> float:
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return round(statistics.median(timings) * 1000, 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--incidents", type=int, default=1_000_000)
+    parser.add_argument("--sample", type=int, default=20_000, help="Reports held as models and dicts for the baselines")
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    now = time.time()
+
+    def build_table():
+        rng = random.Random(42)
+        table = IncidentTable(capacity=args.incidents)
+        for i in range(args.incidents):
+            report, coordinates = _report(rng, now - i * 0.5)
+            table.upsert(incident_record(report, coordinates, now - i * 0.5))
+        return table
+
+    gc.collect()
+    before = _rss_bytes()
+    started = time.perf_counter()
+    table = build_table()
+    load_seconds = time.perf_counter() - started
+    gc.collect()
+    table_bytes = _rss_bytes() - before
+
+    rng = random.Random(42)
+    sample = [_report(rng, now - i * 0.5) for i in range(args.sample)]
+    texts = [json.dumps(report) for report, _ in sample]
+    dict_bytes, dicts = _traced_bytes(lambda: [json.loads(text) for text in texts])
+    pydantic_bytes, _ = _traced_bytes(lambda: [
+        (ExtractedEmergencyData.model_validate(report["emergency_details"]), ReportResponse.model_validate(report))
+        for report in dicts
+    ])
+
+    bbox = (-41.35, 174.7, -41.2, 174.85)
+    since = now - 3600
+    scale = args.incidents / args.sample
+
+    def select_dicts():
+        return [
+            report for report in dicts
+            if report["emergency_details"]["emergency_type"] == "fire"
+            and report["emergency_details"]["severity"] in ("high", "critical")
+        ]
+
+    rows = table.select(service_type="fire", severity="high,critical")
+    results = {
+        "incidents": args.incidents,
+        "load_seconds": round(load_seconds, 1),
+        "table_bytes_per_incident": round(table_bytes / args.incidents, 1),
+        "table_mb": round(table_bytes / 1e6, 1),
+        "pydantic_bytes_per_incident": round(pydantic_bytes / args.sample, 1),
+        "pydantic_mb_estimated": round(pydantic_bytes * scale / 1e6, 1),
+        "dict_bytes_per_incident": round(dict_bytes / args.sample, 1),
+        "dict_mb_estimated": round(dict_bytes * scale / 1e6, 1),
+        "table_stats": table.stats(),
+        "matches_type_severity": len(rows),
+        "select_type_severity_ms": _median_ms(lambda: table.select(service_type="fire", severity="high,critical"), args.repeats),
+        "select_bbox_since_ms": _median_ms(lambda: table.select(since=since, bbox=bbox), args.repeats),
+        "counts_ms": _median_ms(lambda: table.counts(), args.repeats),
+        "to_dicts_50_ms": _median_ms(lambda: table.to_dicts(rows, 50), args.repeats),
+        "dict_scan_type_severity_ms_estimated": round(_median_ms(select_dicts, args.repeats) * scale, 3),
+    }
+    print(json.dumps(results, indent=2))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+Record-and-replay proxy for the OpenAI chat completions API.
+
+Forwards /v1/chat/completions to --upstream on a miss and stores the
+response in a SQLite file; an identical request later is answered from the
+file without a network call. Requests are keyed on their JSON body with
+alert IDs, report IDs and ISO timestamps masked, since those change on
+every run and reach the model through tool results. With --offline a miss
+is answered with 503, which the service treats like an unavailable model.
+
+Point the service at it with OPENAI_BASE_URL, e.g. to replay recorded
+traffic twice against the same prompts for the cost of one run.
+
+Run standalone with:
+    python -m benchmarks.llm_response_cache --port 8002 --path llm_responses.db
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_responses (
+    key TEXT PRIMARY KEY,
+    model TEXT,
+    content_type TEXT NOT NULL,
+    body BLOB NOT NULL
+)
+"""
+
+# EM-20250812070000-9c81d02e7a55, RPT-..., 2025-08-12T07:00:00.120000+00:00
+VOLATILE = re.compile(
+    r"\b(?:EM|RPT)-\d{14}-[0-9a-f]+\b"
+    r"|\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:\.\d+)?(?:Z|[+-]\d{2}:?\d{2})?"
+)
+
+
+def request_key(body: Dict) -> str:
+    """Cache key of a chat completion request"""
+    text = VOLATILE.sub("*", json.dumps(body, sort_keys=True, ensure_ascii=False))
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class CachedOpenAIServer:
+    """Threaded caching proxy in front of an OpenAI-compatible API"""
+
+    def __init__(self, path: str, upstream: str = "https://api.openai.com/v1", api_key: Optional[str] = None,
+                 offline: bool = False, host: str = "127.0.0.1", port: int = 0, timeout: float = 120.0):
+        self.upstream = upstream.rstrip("/")
+        self.api_key = api_key if api_key is not None else os.getenv("OPENAI_API_KEY", "")
+        self.offline = offline
+        self.timeout = timeout
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(SCHEMA)
+        self._connection.commit()
+        self._lock = threading.Lock()
+        self.counts: Dict[str, int] = {}
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def stats(self) -> Dict:
+        with self._lock:
+            hits, misses = self.counts.get("hit", 0), self.counts.get("miss", 0)
+            return {**self.counts, "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0}
+
+    def start(self) -> "CachedOpenAIServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="llm-response-cache", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        with self._lock:
+            self._connection.close()
+
+    def _count(self, kind: str):
+        with self._lock:
+            self.counts[kind] = self.counts.get(kind, 0) + 1
+
+    def lookup(self, key: str) -> Optional[Tuple[str, bytes]]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT content_type, body FROM llm_responses WHERE key = ?", (key,)
+            ).fetchone()
+        return (row[0], bytes(row[1])) if row else None
+
+    def store(self, key: str, model: Optional[str], content_type: str, body: bytes):
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO llm_responses (key, model, content_type, body) VALUES (?, ?, ?, ?)",
+                (key, model, content_type, body)
+            )
+            self._connection.commit()
+
+    def forward(self, path: str, data: bytes) -> Tuple[int, str, bytes]:
+        """Send a request upstream and return its status, content type and body"""
+        request = urllib.request.Request(
+            self.upstream + path, data=data,
+            headers={"Content-Type": "application/json", "Authorization": f"Bearer {self.api_key}"}
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return response.status, response.headers.get("Content-Type", "application/json"), response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.headers.get("Content-Type", "application/json"), e.read()
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status: int, content_type: str, data: bytes):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                data = self.rfile.read(length) or b"{}"
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    return self._send(404, "application/json", json.dumps(
+                        {"error": {"message": f"Unknown path {self.path}"}}
+                    ).encode("utf-8"))
+
+                body = json.loads(data)
+                key = request_key(body)
+                cached = server.lookup(key)
+                if cached is not None:
+                    server._count("hit")
+                    return self._send(200, *cached)
+
+                server._count("miss")
+                if server.offline:
+                    return self._send(503, "application/json", json.dumps(
+                        {"error": {"message": "No recorded response for this request", "type": "cache_miss"}}
+                    ).encode("utf-8"))
+
+                status, content_type, response = server.forward("/chat/completions", data)
+                if status == 200:
+                    server.store(key, body.get("model"), content_type, response)
+                else:
+                    server._count("upstream_error")
+                self._send(status, content_type, response)
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8002)
+    parser.add_argument("--path", default="llm_responses.db", help="SQLite file holding recorded responses")
+    parser.add_argument("--upstream", default="https://api.openai.com/v1")
+    parser.add_argument("--offline", action="store_true", help="Answer misses with 503 instead of calling upstream")
+    args = parser.parse_args()
+
+    server = CachedOpenAIServer(args.path, args.upstream, offline=args.offline, host=args.host, port=args.port)
+    print(f"Caching OpenAI proxy listening on {server.url}")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+"""
+Offline load test of /api/query against the fake OpenAI server.
+
+Starts benchmarks.fake_openai_server, serves app.py on a local port and
+sends the transcript corpus (English and te reo Māori, every
+EmergencyServiceType) at a fixed concurrency. Reports throughput,
+p50/p95/p99 latency, LLM turns per request, the answering paths and memory
+per request. Nothing leaves the machine.
+
+With --workers N the app runs under gunicorn (gunicorn.conf.py) with N
+pre-forked worker processes sharing state through STATE_BACKEND=sqlite,
+to measure how throughput scales with workers. Memory per request is only
+measured in-process.
+
+--error-rate, --model-latency and --model-error-rate degrade the fake
+OpenAI API to exercise deadlines, circuit breakers and the fallback chain;
+"degraded" counts the responses that came from a fallback.
+
+Save a run with --output and compare later runs against it with
+--baseline; the command exits with status 1 when throughput, p95 latency
+or LLM turns per request regress by more than --tolerance.
+
+Run with:
+    python -m benchmarks.load_test --requests 400 --concurrency 16 --mode agent
+"""
+import argparse
+import collections
+import json
+import logging
+import os
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.corpus import CORPUS
+from benchmarks.fake_openai_server import FakeOpenAIServer, parse_model_values
+
+
+def _percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def _query(i: int):
+    """The i-th request body; a caller reference keeps repeated transcripts out of the response cache"""
+    entry = CORPUS[i % len(CORPUS)]
+    latitude, longitude = entry["location"]
+    return {"query": {
+        "transcript": f"{entry['transcript']} (caller ref {i})",
+        "location": {"latitude": latitude, "longitude": longitude},
+    }}
+
+
+def _post(url: str, body: dict):
+    request = urllib.request.Request(
+        url, data=json.dumps(body).encode("utf-8"), headers={"Content-Type": "application/json"}
+    )
+    start = time.perf_counter()
+    with urllib.request.urlopen(request, timeout=120) as response:
+        payload = json.loads(response.read())
+    return time.perf_counter() - start, payload
+
+
+def _serve_app(directory: str, openai_url: str, mode: str, fast_path: bool):
+    """Import app.py against the fake server and serve it on a free local port"""
+    os.environ["OPENAI_API_KEY"] = "sk-load-test"
+    os.environ["OPENAI_BASE_URL"] = openai_url
+    os.environ["AI_ORCHESTRATION_MODE"] = mode
+    os.environ["INCIDENT_DB_PATH"] = os.path.join(directory, "incidents.db")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    if not fast_path:
+        os.environ["FAST_TRIAGE_THRESHOLD"] = "2"
+
+    from werkzeug.serving import make_server
+    import app as flask_app
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+
+    server = make_server("127.0.0.1", 0, flask_app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="app-server", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/api/query"
+
+
+def _serve_workers(directory: str, openai_url: str, mode: str, fast_path: bool, workers: int):
+    """Serve app.py under gunicorn with the given number of worker processes"""
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    env = dict(
+        os.environ,
+        OPENAI_API_KEY="sk-load-test",
+        OPENAI_BASE_URL=openai_url,
+        AI_ORCHESTRATION_MODE=mode,
+        INCIDENT_DB_PATH=os.path.join(directory, "incidents.db"),
+        SHARED_STATE_PATH=os.path.join(directory, "shared_state.db"),
+        STATE_BACKEND="sqlite",
+        WEB_CONCURRENCY=str(workers),
+        BIND=f"127.0.0.1:{port}",
+    )
+    env.setdefault("LOG_LEVEL", "WARNING")
+    if not fast_path:
+        env["FAST_TRIAGE_THRESHOLD"] = "2"
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "--log-level", "warning", "app:app"],
+        cwd=root, env=env
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while True:
+        try:
+            urllib.request.urlopen(f"{base_url}/api/scheduler/stats", timeout=1).close()
+            break
+        except OSError:
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.kill()
+                raise RuntimeError("gunicorn did not start")
+            time.sleep(0.2)
+    return process, f"{base_url}/api/query"
+
+
+def run(args) -> dict:
+    fake = FakeOpenAIServer(
+        latency=args.llm_latency, jitter=args.llm_jitter, error_rate=args.error_rate,
+        model_latency=parse_model_values(args.model_latency), model_error_rate=parse_model_values(args.model_error_rate)
+    ).start()
+    with tempfile.TemporaryDirectory() as directory:
+        if args.workers:
+            process, url = _serve_workers(directory, fake.url, args.mode, not args.no_fast_path, args.workers)
+
+            def stop_server():
+                process.terminate()
+                process.wait(timeout=30)
+        else:
+            server, url = _serve_app(directory, fake.url, args.mode, not args.no_fast_path)
+            stop_server = server.shutdown
+        try:
+            # Warm up connection pools and lazy imports outside the measurement
+            for i in range(min(len(CORPUS), args.requests)):
+                _post(url, _query(-1 - i))
+            fake.reset()
+
+            rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            latencies, paths, errors, degraded = [], collections.Counter(), 0, 0
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+                for result in pool.map(lambda i: _safe_post(url, _query(i)), range(args.requests)):
+                    if result is None:
+                        errors += 1
+                        continue
+                    latency, payload = result
+                    latencies.append(latency)
+                    metadata = payload.get("response", {}).get("metadata", {})
+                    paths[metadata.get("path", "unknown")] += 1
+                    errors += bool(metadata.get("error"))
+                    degraded += bool(metadata.get("degraded"))
+            elapsed = time.perf_counter() - start
+            rss_growth = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before
+            llm_calls = fake.total_requests
+
+            # Peak Python allocations of a single request, measured sequentially
+            tracemalloc.start()
+            peaks = []
+            for i in range(0 if args.workers else args.memory_samples):
+                tracemalloc.reset_peak()
+                baseline = tracemalloc.get_traced_memory()[0]
+                _post(url, _query(args.requests + i))
+                peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+            tracemalloc.stop()
+        finally:
+            stop_server()
+            fake.stop()
+
+    latencies.sort()
+    return {
+        "mode": args.mode,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "workers": args.workers,
+        "llm_latency": args.llm_latency,
+        "errors": errors,
+        "degraded": degraded,
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "p95_ms": round(_percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms": round(_percentile(latencies, 0.99) * 1000, 1),
+        "llm_turns_per_request": round(llm_calls / args.requests, 2),
+        "paths": dict(paths),
+        "peak_kib_per_request": round(statistics.fmean(peaks) / 1024, 1) if peaks else None,
+        "rss_growth_kib_per_request": None if args.workers else round(rss_growth / args.requests, 2),
+    }
+
+
+def _safe_post(url, body):
+    try:
+        return _post(url, body)
+    except Exception as e:
+        print(f"Request failed: {e}", file=sys.stderr)
+        return None
+
+
+# (metric, True when higher is better)
+REGRESSION_CHECKS = [("throughput_rps", True), ("p95_ms", False), ("llm_turns_per_request", False)]
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list:
+    """Metrics that are worse than the baseline by more than tolerance"""
+    regressions = []
+    for metric, higher_is_better in REGRESSION_CHECKS:
+        old, new = baseline.get(metric), result.get(metric)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        if (change < -tolerance) if higher_is_better else (change > tolerance):
+            regressions.append(f"{metric}: {old} -> {new} ({change:+.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--mode", choices=["agent", "hybrid"], default="agent")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Serve with gunicorn and this many worker processes (0 serves in-process)")
+    parser.add_argument("--no-fast-path", action="store_true", help="Send every request to the LLM path")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Seconds per fake LLM call")
+    parser.add_argument("--llm-jitter", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of LLM calls answered with 429")
+    parser.add_argument("--model-latency", action="append", metavar="MODEL=SECONDS",
+                        help="Fake latency for one model, e.g. gpt-4o=15 to push the agent past its deadline")
+    parser.add_argument("--model-error-rate", action="append", metavar="MODEL=RATE",
+                        help="429 rate for one model, e.g. gpt-4o=1 to open its circuit")
+    parser.add_argument("--memory-samples", type=int, default=10)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--baseline", help="Results JSON from an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression")
+    args = parser.parse_args()
+
+    result = run(args)
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Benchmark per-request logging overhead on the request thread.
+
+Compares the previous print() calls of a typical request (query body,
+extracted data, a raw OpenAI response and the agent output) with the
+queue-backed structured logging, at INFO and at DEBUG with payload
+sampling. Output goes to a line-buffered temporary file, as it would to
+a terminal or container log pipe.
+
+Run with:
+    python -m benchmarks.logging_benchmark
+"""
+import contextlib
+import logging
+import os
+import statistics
+import tempfile
+import time
+
+from services.logging_config import configure_logging, log_payload, shutdown_logging
+
+REQUESTS = 5_000
+
+QUERY = {
+    "transcript": "My neighbour collapsed in the kitchen and is not breathing, please hurry",
+    "location": {"latitude": -41.2865, "longitude": 174.7762},
+    "time_submitted": "2025-08-12T07:00:00+00:00",
+    "chat_history": [
+        {"timestamp": "2025-08-12T06:50:00+00:00", "role": "assistant", "message": "Are you okay?"},
+        {"timestamp": "2025-08-12T06:55:00+00:00", "role": "user", "message": "No, please send help"},
+    ],
+    "profile_data": {"fName": "John", "sName": "Doe", "bloodType": "AB", "knownMedicalIssues": ["asthma"]},
+}
+EXTRACTED = {
+    "emergency_type": "medical",
+    "severity": "critical",
+    "location": {"address": "12 Cuba Street", "coordinates": "-41.2865, 174.7762"},
+    "people_affected": 1,
+    "immediate_risks": ["not breathing"],
+    "additional_notes": QUERY["transcript"],
+}
+OPENAI_RESPONSE = {"id": "chatcmpl-1", "model": "gpt-4o-mini", "choices": [{"message": {"content": "x" * 1500}}]}
+AGENT_OUTPUT = {"output": "y" * 2000, "intermediate_steps": [["extract_emergency_data", EXTRACTED]] * 4}
+
+
+def print_request():
+    print("Received request to process user query")
+    print(f"Received data: {QUERY}")
+    print(f"Processing query: {QUERY}")
+    print(f"OpenAI response: {OPENAI_RESPONSE}")
+    print(f"Extracted emergency data: {EXTRACTED}")
+    print(f"Finding next steps for: {EXTRACTED}")
+    print(AGENT_OUTPUT)
+
+
+def structured_request(logger):
+    log_payload(logger, "Received query", QUERY)
+    log_payload(logger, "Processing query", QUERY)
+    log_payload(logger, "OpenAI response", OPENAI_RESPONSE)
+    log_payload(logger, "Extracted emergency data", EXTRACTED)
+    log_payload(logger, "Finding next steps", EXTRACTED)
+    log_payload(logger, "Agent run finished", AGENT_OUTPUT)
+    logger.info("Query processed", extra={
+        "path": "agent", "latency_ms": 812.4, "emergency_type": "medical", "alert_id": "EM-1", "error": False
+    })
+
+
+def measure(fn) -> list:
+    timings = []
+    for _ in range(REQUESTS):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1_000_000)
+    return timings
+
+
+def report(name: str, timings: list):
+    timings = sorted(timings)
+    print(
+        f"{name:<28} p50 {statistics.median(timings):8.1f}µs"
+        f"  p99 {timings[int(len(timings) * 0.99)]:8.1f}µs"
+        f"  mean {statistics.fmean(timings):8.1f}µs"
+    )
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        with open(os.path.join(directory, "stdout.log"), "w", buffering=1) as out:
+            with contextlib.redirect_stdout(out):
+                before = measure(print_request)
+
+        with open(os.path.join(directory, "structured.log"), "w", buffering=1) as out:
+            configure_logging(level="INFO", stream=out)
+            logger = logging.getLogger("benchmark")
+            info = measure(lambda: structured_request(logger))
+
+            os.environ.setdefault("LOG_PAYLOAD_SAMPLE_RATE", "0.01")
+            logging.getLogger().setLevel(logging.DEBUG)
+            debug = measure(lambda: structured_request(logger))
+            shutdown_logging()
+
+    print(f"Per-request logging cost on the request thread ({REQUESTS} requests)")
+    report("print() full payloads", before)
+    report("structured, INFO", info)
+    report("structured, DEBUG 1% sample", debug)
+    print(f"Mean overhead reduced by {1 - statistics.fmean(info) / statistics.fmean(before):.0%} at INFO")
+
+
+if __name__ == "__main__":
+    main()
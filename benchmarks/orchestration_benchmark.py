@@ -0,0 +1,81 @@
+"""
+Benchmark agent vs hybrid orchestration with a stubbed LLM.
+
+The agent mode spends one LLM turn per tool call plus the final answer;
+the hybrid mode uses the LLM only for extraction and response wording and
+runs the deterministic tools locally. Each stubbed LLM call sleeps for
+LLM_LATENCY seconds, so wall time reflects the number of round trips.
+
+Run with:
+    python -m benchmarks.orchestration_benchmark
+"""
+import os
+import statistics
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+# Keep every request off the local fast path
+os.environ["FAST_TRIAGE_THRESHOLD"] = "2"
+
+from langchain_core.messages import AIMessage
+import services.resilience
+from services.ai_service import AIService
+from services.cache import response_cache, extraction_cache
+from benchmarks.stubs import TurnCounter, StubChatModel, StubOpenAIClient, agent_script
+
+LLM_LATENCY = float(os.getenv("LLM_LATENCY", "0.05"))
+REQUESTS = int(os.getenv("BENCHMARK_REQUESTS", "20"))
+
+EMERGENCY_DATA = {
+    "emergency_type": "disaster_response",
+    "severity": "high",
+    "location": {"address": "Main Rd"},
+    "people_affected": 3
+}
+FINAL_RESPONSE = {
+    "response_message": "Disaster response has been alerted.",
+    "emergency_type": "disaster_response",
+    "resources_alerted": ["disaster_response"]
+}
+
+
+def _run(mode, counter):
+    service = AIService(mode=mode, warm_up="sync")
+    script = agent_script(EMERGENCY_DATA, FINAL_RESPONSE) if mode == "agent" else [AIMessage(content="Help is on the way.")]
+    service.llm = StubChatModel(script=script, latency=LLM_LATENCY, counter=counter)
+    service._agent_executor = service._create_agent_executor()
+    service.agent_executor.verbose = False
+    service.pipeline.llm = service.llm
+
+    latencies = []
+    counter.reset()
+    for i in range(REQUESTS):
+        response_cache.clear()
+        extraction_cache.clear()
+        start = time.perf_counter()
+        response = service.get_response(f"water coming through the walls on Main Rd, request {i}")
+        latencies.append(time.perf_counter() - start)
+        assert response["metadata"]["path"] == mode, response
+    return counter.turns / REQUESTS, latencies
+
+
+def main():
+    counter = TurnCounter()
+    services.resilience.get_openai_client = lambda: StubOpenAIClient(EMERGENCY_DATA, LLM_LATENCY, counter)
+
+    print(f"{REQUESTS} requests, {LLM_LATENCY * 1000:.0f} ms per stubbed LLM call")
+    print(f"{'mode':<8} {'LLM turns/request':>18} {'p50 ms':>10} {'max ms':>10}")
+    results = {}
+    for mode in ("agent", "hybrid"):
+        turns, latencies = _run(mode, counter)
+        results[mode] = (turns, statistics.median(latencies))
+        print(f"{mode:<8} {turns:>18.1f} {statistics.median(latencies) * 1000:>10.1f} {max(latencies) * 1000:>10.1f}")
+
+    agent_turns, agent_p50 = results["agent"]
+    hybrid_turns, hybrid_p50 = results["hybrid"]
+    print(f"Turns saved per request: {agent_turns - hybrid_turns:.1f}; "
+          f"median latency reduced by {(1 - hybrid_p50 / agent_p50) * 100:.0f}%")
+
+
+if __name__ == "__main__":
+    main()
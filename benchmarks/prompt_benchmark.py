@@ -0,0 +1,123 @@
+"""
+Prompt token benchmark: full vs compact agent prompt layout.
+
+Builds the agent's prompt for the transcript corpus, with the location,
+profile data and client chat history of the documented /api/query body,
+and counts tokens per section:
+- tools: the tool schemas sent with every turn
+- system_prompt, output_instructions: the static system message
+- chat_history, query: the per-request part
+
+Every agent turn resends the whole prompt, so tokens per request are the
+per-turn prompt times --turns (the fake OpenAI server's canned run takes
+six). The stable prefix is what a provider-side prompt cache can reuse
+across requests; OpenAI only caches prefixes of 1024 tokens or more.
+
+Tokens are counted with tiktoken when its encoding is available locally
+and estimated at four characters per token otherwise. No network calls
+are made.
+
+Run with:
+    python -m benchmarks.prompt_benchmark --turns 6
+"""
+import argparse
+import json
+import os
+import statistics
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+from benchmarks.corpus import CORPUS
+from services.ai_service import AIService, EmergencyResponse
+from services.prompt_compiler import COMPACT, FULL, PromptCompiler, count_tokens, section_tokens, PromptSection
+from services.sessions import SessionStore
+
+PROFILE = {"fName": "John", "sName": "Doe", "bloodType": "AB", "knownMedicalIssues": ["asthma"], "nhi": "", "notes": None}
+PROVIDER_CACHE_MIN_TOKENS = 1024
+
+
+def _query(i: int, history_turns: int) -> dict:
+    entry = CORPUS[i % len(CORPUS)]
+    latitude, longitude = entry["location"]
+    history = []
+    for n in range(history_turns):
+        earlier = CORPUS[(i + n + 1) % len(CORPUS)]["transcript"]
+        history.append({"timestamp": "2025-08-12T06:50:00+00:00", "role": "user", "message": earlier})
+        history.append({"timestamp": "2025-08-12T06:51:00+00:00", "role": "assistant", "message": "Help is on the way. Where exactly are you?"})
+    return {
+        "transcript": entry["transcript"],
+        "location": {"latitude": latitude, "longitude": longitude},
+        "time_submitted": "2025-08-12T07:00:00+00:00",
+        "chat_history": history,
+        "profile_data": PROFILE,
+    }
+
+
+def _tool_schemas(service: AIService, compiler: PromptCompiler) -> str:
+    from langchain_core.utils.function_calling import convert_to_openai_tool
+    schemas = [convert_to_openai_tool(tool) for tool in compiler.tool_schemas(service.tools)]
+    return json.dumps(schemas, separators=(",", ":"))
+
+
+def measure(service: AIService, layout: str, queries, turns: int) -> dict:
+    compiler = PromptCompiler(layout)
+    sessions = SessionStore()
+    stable = [PromptSection("tools", _tool_schemas(service, compiler), True)] + compiler.system_sections(
+        service.structured_response, EmergencyResponse, service.parser.get_format_instructions()
+    )
+    prompt = service.prompt_template.partial(
+        system_prompt=compiler.system_prompt(service.structured_response, EmergencyResponse,
+                                             service.parser.get_format_instructions())
+    )
+
+    sections = {row["section"]: row["tokens"] for row in section_tokens(stable)}
+    variable = {"chat_history": [], "query": []}
+    per_turn = []
+    for query in queries:
+        history = sessions.begin(query, None).chat_history
+        for row in section_tokens(compiler.request_sections(query, history)):
+            variable[row["section"]].append(row["tokens"])
+        # Total from the messages actually sent, rendered by the agent's prompt template
+        messages = prompt.format_messages(**compiler.agent_inputs(query, history), agent_scratchpad=[])
+        per_turn.append(sections["tools"] + sum(count_tokens(str(m.content)) for m in messages))
+    sections.update({name: round(statistics.fmean(values), 1) for name, values in variable.items()})
+
+    stable_prefix = sum(count_tokens(s.text) for s in stable)
+    return {
+        "layout": layout,
+        "sections": sections,
+        "stable_prefix_tokens": stable_prefix,
+        "prefix_cacheable": stable_prefix >= PROVIDER_CACHE_MIN_TOKENS,
+        "tokens_per_turn": round(statistics.fmean(per_turn), 1),
+        "tokens_per_request": round(statistics.fmean(per_turn) * turns, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=6, help="Agent turns per request")
+    parser.add_argument("--history-turns", type=int, default=3, help="Earlier caller/assistant exchanges in each query")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    service = AIService(warm_up="sync")
+    queries = [_query(i, args.history_turns) for i in range(len(CORPUS))]
+    results = {layout: measure(service, layout, queries, args.turns) for layout in (FULL, COMPACT)}
+    full, compact = results[FULL], results[COMPACT]
+
+    print(f"{len(queries)} queries, {args.turns} agent turns per request")
+    print(f"{'section':<22} {'full':>10} {'compact':>10}")
+    for name in full["sections"]:
+        print(f"{name:<22} {full['sections'][name]:>10} {compact['sections'][name]:>10}")
+    for field in ("stable_prefix_tokens", "tokens_per_turn", "tokens_per_request"):
+        print(f"{field:<22} {full[field]:>10} {compact[field]:>10}")
+    saved = full["tokens_per_request"] - compact["tokens_per_request"]
+    print(f"Prompt tokens saved per request: {saved:.0f} ({saved / full['tokens_per_request']:.0%})")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"turns": args.turns, "results": results, "tokens_saved_per_request": round(saved, 1)}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+"""
+Replay recorded /api/query traffic through AIService to see what a change
+to prompts, models or tool logic would have done to past incidents.
+
+Reads JSON lines in a single streaming pass. Each line is an /api/query
+request body, {"query": ...}, optionally with the "response" that was
+returned; /api/query responses themselves contain both and can be replayed
+as they are. Lines are sent in chunks to a pool of worker processes, each
+with its own AIService, incident database and caches, so replays never
+touch the live incident store.
+
+--backend picks what answers in place of OpenAI:
+- local: AI_ORCHESTRATION_MODE=local, local triage only; no LLM calls
+- stub: benchmarks.fake_openai_server with --latency per call
+- cached: benchmarks.llm_response_cache in front of --upstream, so a
+  second run of unchanged prompts makes no network calls; with --offline
+  a request that was never recorded falls back as if the model were down
+
+For every line that has a recorded response, emergency_type, severity
+(metadata.severity) and resources_alerted are compared with the replayed
+response. Lines that changed, or failed, are written to --output; add
+--all to write every line. A summary with throughput, answering paths,
+change counts and the most common transitions is printed at the end.
+
+Follow-up messages are replayed with their recorded chat_history; session
+state only carries over when earlier turns land on the same worker.
+
+Run with:
+    python -m benchmarks.replay --input queries.jsonl --backend local --output diffs.jsonl
+    python -m benchmarks.replay --input queries.jsonl --backend cached --mode hybrid --workers 8
+"""
+import argparse
+import collections
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+COMPARED_FIELDS = ("emergency_type", "severity", "resources_alerted")
+
+# Built once per worker process by _init_worker
+_service = None
+
+
+def _value(value):
+    return getattr(value, "value", value)
+
+
+def outcome(response) -> Optional[Dict]:
+    """The compared fields of an /api/query response"""
+    if not isinstance(response, dict):
+        return None
+    metadata = response.get("metadata") or {}
+    return {
+        "emergency_type": _value(response.get("emergency_type")),
+        "severity": metadata.get("severity", response.get("severity")),
+        "resources_alerted": sorted(_value(r) for r in response.get("resources_alerted") or []),
+    }
+
+
+def diff(recorded: Dict, replayed: Dict) -> Dict:
+    """Fields whose value changed; severity is skipped when it was not recorded"""
+    changes = {}
+    for field in COMPARED_FIELDS:
+        if field == "severity" and recorded[field] is None:
+            continue
+        if recorded[field] != replayed[field]:
+            changes[field] = {"recorded": recorded[field], "replayed": replayed[field]}
+    return changes
+
+
+def _init_worker(directory: str):
+    global _service
+    os.environ["INCIDENT_DB_PATH"] = os.path.join(directory, f"incidents-{os.getpid()}.db")
+    # Imported here so each worker builds its caches and stores from the replay environment
+    from services.ai_service import AIService
+    _service = AIService(warm_up="lazy")
+
+
+def _replay_line(line_number: int, text: str) -> Dict:
+    result = {"line": line_number}
+    try:
+        record = json.loads(text)
+        query = record["query"]
+    except (ValueError, TypeError, KeyError) as e:
+        result["error"] = f"Invalid record: {e}"
+        return result
+
+    started = time.perf_counter()
+    try:
+        response = _service.get_response(query)
+    except Exception as e:
+        result["error"] = str(e)
+        return result
+    result["latency_ms"] = round((time.perf_counter() - started) * 1000, 2)
+
+    metadata = response.get("metadata") or {}
+    result["path"] = metadata.get("path", "unknown")
+    result["degraded"] = bool(metadata.get("degraded"))
+    result["replayed"] = outcome(response)
+    recorded = outcome(record.get("response"))
+    if recorded is not None:
+        result["recorded"] = recorded
+        result["changes"] = diff(recorded, result["replayed"])
+    return result
+
+
+def _replay_chunk(lines: List[Tuple[int, str]]) -> List[Dict]:
+    return [_replay_line(line_number, text) for line_number, text in lines]
+
+
+def _chunks(lines: Iterator[str], size: int, limit: Optional[int]) -> Iterator[List[Tuple[int, str]]]:
+    chunk, count = [], 0
+    for line_number, text in enumerate(lines, 1):
+        if not text.strip():
+            continue
+        if limit is not None and count >= limit:
+            break
+        chunk.append((line_number, text))
+        count += 1
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class Summary:
+    """Running totals over replayed lines"""
+
+    def __init__(self):
+        self.lines = 0
+        self.errors = 0
+        self.compared = 0
+        self.changed = 0
+        self.degraded = 0
+        self.paths = collections.Counter()
+        self.changes = collections.Counter()
+        self.transitions = collections.Counter()
+        self.latencies: List[float] = []
+
+    def add(self, result: Dict):
+        self.lines += 1
+        if "error" in result:
+            self.errors += 1
+            return
+        self.paths[result["path"]] += 1
+        self.degraded += result["degraded"]
+        self.latencies.append(result["latency_ms"])
+        if "changes" in result:
+            self.compared += 1
+            self.changed += bool(result["changes"])
+            for field, change in result["changes"].items():
+                self.changes[field] += 1
+                self.transitions[f"{field}: {change['recorded']} -> {change['replayed']}"] += 1
+
+    def report(self, elapsed: float, top: int) -> Dict:
+        latencies = sorted(self.latencies)
+        return {
+            "lines": self.lines,
+            "errors": self.errors,
+            "seconds": round(elapsed, 2),
+            "lines_per_second": round(self.lines / elapsed, 1) if elapsed else 0.0,
+            "latency_ms": {
+                "p50": latencies[len(latencies) // 2] if latencies else 0.0,
+                "p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] if latencies else 0.0,
+                "mean": round(statistics.fmean(latencies), 2) if latencies else 0.0,
+            },
+            "paths": dict(self.paths.most_common()),
+            "degraded": self.degraded,
+            "compared": self.compared,
+            "changed": self.changed,
+            "changed_fraction": round(self.changed / self.compared, 4) if self.compared else 0.0,
+            "changes": dict(self.changes.most_common()),
+            "top_transitions": dict(self.transitions.most_common(top)),
+        }
+
+
+def _start_backend(args):
+    """Start the LLM stand-in for --backend and return it, or None for local"""
+    os.environ.setdefault("OPENAI_API_KEY", "sk-replay")
+    if args.backend == "local":
+        os.environ["AI_ORCHESTRATION_MODE"] = "local"
+        return None
+    os.environ["AI_ORCHESTRATION_MODE"] = args.mode
+    if args.backend == "stub":
+        from benchmarks.fake_openai_server import FakeOpenAIServer
+        server = FakeOpenAIServer(latency=args.latency).start()
+    else:
+        from benchmarks.llm_response_cache import CachedOpenAIServer
+        server = CachedOpenAIServer(args.llm_cache, args.upstream, offline=args.offline).start()
+    os.environ["OPENAI_BASE_URL"] = server.url
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input", required=True, help="JSON lines file of recorded queries; - for stdin")
+    parser.add_argument("--output", help="Write changed and failed lines here as JSON lines")
+    parser.add_argument("--all", action="store_true", help="Write every line to --output, not only changes")
+    parser.add_argument("--summary", help="Also write the summary as JSON to this file")
+    parser.add_argument("--backend", choices=["local", "stub", "cached"], default="local")
+    parser.add_argument("--mode", choices=["agent", "hybrid"], default="agent",
+                        help="Orchestration mode for the stub and cached backends")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds per call for the stub backend")
+    parser.add_argument("--llm-cache", default="llm_responses.db", help="Recorded responses for the cached backend")
+    parser.add_argument("--upstream", default=os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1"),
+                        help="API the cached backend forwards misses to")
+    parser.add_argument("--offline", action="store_true", help="Cached backend: never call --upstream")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=50, help="Lines sent to a worker at a time")
+    parser.add_argument("--limit", type=int, help="Replay at most this many lines")
+    parser.add_argument("--top", type=int, default=10, help="Transitions listed in the summary")
+    args = parser.parse_args()
+
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ["STATE_BACKEND"] = "memory"
+    server = _start_backend(args)
+
+    summary = Summary()
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    output = open(args.output, "w", encoding="utf-8") if args.output else None
+
+    def write(results):
+        for result in results:
+            summary.add(result)
+            if output and (args.all or result.get("changes") or "error" in result):
+                output.write(json.dumps(result) + "\n")
+        if summary.lines // 10000 != (summary.lines - len(results)) // 10000:
+            print(f"{summary.lines} lines replayed", file=sys.stderr)
+
+    started = time.perf_counter()
+    try:
+        with tempfile.TemporaryDirectory() as directory, ProcessPoolExecutor(
+            args.workers, initializer=_init_worker, initargs=(directory,)
+        ) as pool:
+            # A bounded window of chunks in flight keeps memory flat however
+            # long the input is, and results are written in input order
+            pending = collections.deque()
+            for chunk in _chunks(source, args.chunk_size, args.limit):
+                pending.append(pool.submit(_replay_chunk, chunk))
+                if len(pending) >= args.workers * 2:
+                    write(pending.popleft().result())
+            while pending:
+                write(pending.popleft().result())
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output:
+            output.close()
+    elapsed = time.perf_counter() - started
+
+    report = summary.report(elapsed, args.top)
+    report["backend"] = args.backend
+    report["workers"] = args.workers
+    if args.backend == "stub":
+        report["llm_requests"] = server.total_requests
+    elif args.backend == "cached":
+        report["llm_cache"] = server.stats()
+    if server is not None:
+        server.stop()
+
+    print(json.dumps(report, indent=2))
+    if args.summary:
+        with open(args.summary, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
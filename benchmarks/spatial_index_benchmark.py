@@ -0,0 +1,66 @@
+"""
+Benchmark nearby-incident lookups in the spatial index.
+
+Loads 100k active incidents spread over a metropolitan-sized area and
+times radius/time-window lookups for random callers. Lookups should
+stay sub-millisecond.
+
+Run with:
+    python -m benchmarks.spatial_index_benchmark
+"""
+import random
+import statistics
+import time
+
+from services.spatial_index import SpatialIndex
+from services.tools import EmergencyServiceType
+
+ACTIVE_INCIDENTS = 100_000
+LOOKUPS = 20_000
+
+# Roughly the Wellington region
+MIN_LAT, MAX_LAT = -41.6, -40.9
+MIN_LON, MAX_LON = 174.6, 175.3
+
+SERVICE_TYPES = list(EmergencyServiceType)
+
+
+def main():
+    rng = random.Random(42)
+    index = SpatialIndex(radius_meters=500, window_seconds=3600)
+    now = time.time()
+
+    start = time.perf_counter()
+    for i in range(ACTIVE_INCIDENTS):
+        index.add(
+            f"EM-{i}",
+            rng.choice(SERVICE_TYPES),
+            rng.uniform(MIN_LAT, MAX_LAT),
+            rng.uniform(MIN_LON, MAX_LON),
+            "5-10 minutes",
+            now=now - rng.uniform(0, 3000)
+        )
+    insert_seconds = time.perf_counter() - start
+
+    latencies = []
+    matches = 0
+    for _ in range(LOOKUPS):
+        service_type = rng.choice(SERVICE_TYPES)
+        latitude = rng.uniform(MIN_LAT, MAX_LAT)
+        longitude = rng.uniform(MIN_LON, MAX_LON)
+        start = time.perf_counter()
+        match = index.find_nearby(service_type, latitude, longitude, now=now)
+        latencies.append(time.perf_counter() - start)
+        matches += match is not None
+
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99)]
+    print(f"{len(index)} active incidents indexed in {insert_seconds:.2f}s "
+          f"({insert_seconds / ACTIVE_INCIDENTS * 1_000_000:.1f} us/insert)")
+    print(f"{LOOKUPS} lookups: p50 {statistics.median(latencies) * 1_000_000:.1f} us, "
+          f"p99 {p99 * 1_000_000:.1f} us, max {latencies[-1] * 1_000_000:.1f} us, "
+          f"{matches / LOOKUPS:.0%} matched an incident within 500m")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Cold-start benchmark: import time and time to first request of app.py.
+
+Each run starts a fresh interpreter against the fake OpenAI server and
+measures, from process start:
+- import_s: `import app`
+- first_request_s: the first /api/query answered by the fast path
+- ready_s: /ready reports the agent built (AI_WARMUP decides when)
+- first_agent_request_s: the first /api/query that needs the agent
+
+Medians over --runs are compared with the budgets; the command exits with
+status 1 when one is exceeded.
+
+Run with:
+    python -m benchmarks.startup_benchmark --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.fake_openai_server import FakeOpenAIServer
+
+CHILD = """
+import json, os, time
+started = time.perf_counter()
+import app
+timings = {"import_s": time.perf_counter() - started}
+client = app.app.test_client()
+location = {"latitude": -41.2865, "longitude": 174.7762}
+client.post("/api/query", json={"query": {"transcript": "There is a house fire, smoke everywhere", "location": location}})
+timings["first_request_s"] = time.perf_counter() - started
+# With AI_WARMUP=lazy the agent request itself does the warm-up
+if os.environ["AI_WARMUP"] != "lazy":
+    while client.get("/ready").status_code != 200:
+        time.sleep(0.01)
+    timings["ready_s"] = time.perf_counter() - started
+client.post("/api/query", json={"query": {"transcript": "Something is not right with my neighbour", "location": location}})
+timings["first_agent_request_s"] = time.perf_counter() - started
+timings.setdefault("ready_s", timings["first_agent_request_s"])
+print(json.dumps(timings))
+"""
+
+METRICS = ["import_s", "first_request_s", "ready_s", "first_agent_request_s"]
+
+
+def run_once(openai_url: str, warm_up: str, directory: str) -> dict:
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(
+        os.environ,
+        OPENAI_API_KEY="sk-startup-benchmark",
+        OPENAI_BASE_URL=openai_url,
+        AI_WARMUP=warm_up,
+        INCIDENT_DB_PATH=os.path.join(directory, "incidents.db"),
+        LOG_LEVEL="WARNING",
+        PYTHONPATH=root,
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD], cwd=directory, env=env, capture_output=True, text=True, timeout=300
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Benchmark child failed:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--warm-up", choices=["background", "lazy", "sync"], default="background",
+                        help="AI_WARMUP for the measured process")
+    parser.add_argument("--import-budget", type=float, default=1.0, help="Seconds allowed for import app")
+    parser.add_argument("--first-request-budget", type=float, default=1.5,
+                        help="Seconds allowed until the first fast-path response")
+    args = parser.parse_args()
+
+    fake = FakeOpenAIServer(latency=0).start()
+    try:
+        runs = []
+        for _ in range(args.runs):
+            with tempfile.TemporaryDirectory() as directory:
+                runs.append(run_once(fake.url, args.warm_up, directory))
+    finally:
+        fake.stop()
+
+    result = {"warm_up": args.warm_up, "runs": args.runs}
+    result.update({metric: round(statistics.median(run[metric] for run in runs), 3) for metric in METRICS})
+    print(json.dumps(result, indent=2))
+
+    over_budget = [
+        f"{metric}: {result[metric]}s > {budget}s"
+        for metric, budget in (("import_s", args.import_budget), ("first_request_s", args.first_request_budget))
+        if result[metric] > budget
+    ]
+    for line in over_budget:
+        print(f"OVER BUDGET {line}")
+    if over_budget:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Stubbed LLM backends for offline benchmarks.
+
+StubChatModel replays scripted AIMessages (with tool calls) for the agent
+and the hybrid pipeline's wording step; StubOpenAIClient answers the tools'
+function-calling requests. Both sleep for a fixed latency per call and count
+turns, so benchmarks measure orchestration cost without network calls.
+"""
+import json
+import threading
+import time
+from types import SimpleNamespace
+from typing import List
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+
+class TurnCounter:
+    """Thread-safe count of LLM round trips"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.turns = 0
+
+    def increment(self):
+        with self._lock:
+            self.turns += 1
+
+    def reset(self):
+        with self._lock:
+            self.turns = 0
+
+
+class StubChatModel(BaseChatModel):
+    """Chat model that replays a fixed script of responses, one per call"""
+
+    script: List[AIMessage]
+    latency: float = 0.0
+    counter: TurnCounter
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        self.counter.increment()
+        # Position in the script is the number of tool results seen so far
+        step = sum(1 for message in messages if message.type == "tool")
+        message = self.script[min(step, len(self.script) - 1)]
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+class StubOpenAIClient:
+    """Stand-in for openai.OpenAI answering the triage function call"""
+
+    def __init__(self, arguments: dict, latency: float, counter: TurnCounter):
+        self._arguments = json.dumps(arguments)
+        self._latency = latency
+        self._counter = counter
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def with_options(self, **kwargs):
+        return self
+
+    def _create(self, **kwargs):
+        time.sleep(self._latency)
+        self._counter.increment()
+        message = SimpleNamespace(
+            function_call=SimpleNamespace(arguments=self._arguments),
+            content="Stub reply"
+        )
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], model=kwargs.get("model"), usage=None)
+
+
+def agent_script(emergency_data: dict, response: dict) -> List[AIMessage]:
+    """The tool-calling sequence the agent follows for one emergency"""
+
+    def tool_call(name, args, call_id):
+        return AIMessage(content="", tool_calls=[{"name": name, "args": args, "id": call_id}])
+
+    alert = {"alert_sent": True, "service_alerted": emergency_data["emergency_type"]}
+    return [
+        tool_call("extract_emergency_data", {"transcript": "stub"}, "call-1"),
+        tool_call("alert_emergency_services", {"emergency_data": emergency_data}, "call-2"),
+        tool_call("generate_report", {"emergency_data": emergency_data, "response_data": alert}, "call-3"),
+        tool_call("find_next_steps", {"emergency_data": emergency_data, "services_response": alert}, "call-4"),
+        AIMessage(content=json.dumps(response)),
+    ]
@@ -0,0 +1,37 @@
+import multiprocessing
+import os
+
+# Production serving: a pre-fork gunicorn server running app.py.
+# The app (AIService, the agent, tool schemas and the guidance catalog) is
+# imported once in the master and shared copy-on-write by the workers.
+# Request handling is I/O bound on the OpenAI API, so each worker also
+# runs a pool of threads.
+#
+# Run with:
+#     gunicorn -c gunicorn.conf.py app:app
+
+bind = os.getenv("BIND", f"0.0.0.0:{os.getenv('PORT', '5000')}")
+workers = int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+worker_class = "gthread"
+threads = int(os.getenv("WORKER_THREADS", "8"))
+preload_app = True
+timeout = int(os.getenv("WORKER_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+
+# Build the agent in the master before forking, so workers start ready and
+# share it; a warm-up thread must not be running when the master forks
+os.environ.setdefault("AI_WARMUP", "sync")
+
+# Caches, sessions and the duplicate-incident index must be shared for a
+# follow-up or repeat report to be recognised by whichever worker gets it
+if workers > 1:
+    os.environ.setdefault("STATE_BACKEND", "sqlite")
+
+
+def post_fork(server, worker):
+    # Workers open their own SQLite connections, incident writer and log
+    # listener thread after the fork (see os.register_at_fork in services/).
+    # The master never calls the OpenAI API, so the preloaded HTTP pools are
+    # still empty when they are inherited.
+    server.log.info("Worker %s ready (state backend: %s)", worker.pid, os.getenv("STATE_BACKEND", "memory"))
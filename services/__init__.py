@@ -1 +1,5 @@
 # This file makes the services directory a Python package
+from dotenv import load_dotenv
+
+# Read .env once, before any service module reads its settings
+load_dotenv()
@@ -1,17 +1,30 @@
-from dotenv import load_dotenv
 from pydantic import BaseModel, Field
 from typing import Optional, List, Dict
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import PydanticOutputParser
-from langchain.agents import create_tool_calling_agent, AgentExecutor
-from langchain.tools import StructuredTool
-from lib.constants import SYSTEM_PROMPT_DATA_EXTRACT
 from services.tools import EmergencyTools
+from services.openai_client import get_chat_model
+import asyncio
+import logging
 import os
-from services.tools import EmergencyServiceType
+import threading
+import time
+from services.tools import EmergencyServiceType, ExtractedEmergencyData, Location
+from services.triage import FastTriage
+from services.queries import get_transcript, get_coordinates, get_session_id
+from services.sessions import create_session_store, merge_emergency_data
+from services.cache import response_cache, response_cache_key
+from services.request_context import RequestDispatches, query_context, get_current_query
+from services.metrics import REQUEST_DURATION, PARSE_FAILURES, PARSE_REPAIRS, get_metrics_callback
+from services.structured_output import parse_model
+from services.logging_config import log_payload
+from services.translation import MAORI, detect_language
+from services.prompt_compiler import PromptCompiler
+from services.pipeline import HybridPipeline, PipelineResult, run_local_tools, compose_response_message, coerce_emergency_data
+from services.resilience import (
+    LLMUnavailable, FALLBACK_RESERVE_SECONDS, LLM_CALL_TIMEOUT, LLM_RETRIES, REQUEST_DEADLINE_SECONDS,
+    budget_seconds, get_breaker, has_time, iterate_with_deadline, remaining, request_deadline, run_with_deadline
+)
 
-load_dotenv()
+logger = logging.getLogger(__name__)
 
 class EmergencyResponse(BaseModel):
     response_message: str
@@ -19,42 +32,128 @@ class EmergencyResponse(BaseModel):
     resources_alerted: Optional[List[EmergencyServiceType]] = None
     additional_notes: Optional[str] = None
     
+# Tool results streamed to the caller as their own event as soon as they return
+STREAMED_TOOL_EVENTS = {
+    "extract_emergency_data": "extracted_data",
+    "alert_emergency_services": "alert",
+    "find_next_steps": "next_steps",
+}
+    
 class AIService:
     """
     Service to handle AI-related operations.
     This is a placeholder for the actual AI library integration.
     """
     
-    def __init__(self):
-            
-        self.llm = ChatOpenAI(
-            model="gpt-4o",
-            temperature=0.7,
-            openai_api_key=os.getenv("OPENAI_API_KEY")
-        )
+    def __init__(self, mode=None, warm_up=None):
         
-        self.prompt_template = ChatPromptTemplate.from_messages(
-         [
-        ("system", 
-         """{system_prompt} \n {format_instructions}"""),
-        ("placeholder", "{chat_history}"),
-        ("human", "{query}"),
-        ("placeholder", "{agent_scratchpad}"),
-        ] 
-        )
+        # "agent" runs the full tool-calling agent; "hybrid" uses the LLM only
+        # for extraction and wording and runs the other tools locally;
+        # "local" answers every query from local triage without the LLM
+        self.mode = mode or os.getenv("AI_ORCHESTRATION_MODE", "agent")
+        
+        # Have the agent return its final answer through the submit_response
+        # tool, whose schema is EmergencyResponse, rather than as free text
+        self.structured_response = os.getenv("AGENT_STRUCTURED_RESPONSE", "true").lower() == "true"
+        
+        # Local pre-classifier for unambiguous emergencies
+        self.triage = FastTriage()
         
-        # Initialize the parser
-        self.parser = PydanticOutputParser(pydantic_object=EmergencyResponse)
+        # System prompt and per-request prompt inputs (PROMPT_LAYOUT)
+        self.prompt_compiler = PromptCompiler()
         
-        # Initialize tools
-        self.tools = self._create_tools()
+        # Per-caller conversation state for follow-up messages
+        self.sessions = create_session_store()
+        
+        # Extraction plus template wording, used when the agent or the
+        # wording LLM is unavailable or too slow
+        self.fallback_pipeline = HybridPipeline(llm_wording=False)
+        
+        # The LLM, tools and agent need the langchain stack, which takes
+        # seconds to import. They are built once by warm_up: at start-up
+        # ("sync"), on a background thread while cache and fast-path
+        # requests are already served ("background"), or by the first
+        # request that needs them ("lazy").
+        self._ready = threading.Event()
+        self._warm_up_lock = threading.Lock()
+        self.warm_up_seconds = None
+        warm_up = warm_up or os.getenv("AI_WARMUP", "background")
+        if warm_up == "sync":
+            self.warm_up()
+        elif warm_up == "background":
+            threading.Thread(target=self._warm_up_in_background, name="ai-warm-up", daemon=True).start()
+    
+    @property
+    def is_ready(self) -> bool:
+        """True once the LLM, tools and agent have been built"""
+        return self._ready.is_set()
+    
+    def warm_up(self):
+        """Build the LLM, tools, hybrid pipeline and agent executor once"""
+        if self._ready.is_set():
+            return
+        with self._warm_up_lock:
+            if self._ready.is_set():
+                return
+            started = time.perf_counter()
+            from langchain_core.prompts import ChatPromptTemplate
+            from langchain_core.output_parsers import PydanticOutputParser
+            
+            # Shares the pooled HTTP clients used by the tools. Each turn is
+            # capped at LLM_CALL_TIMEOUT; the request deadline bounds the run
+            self.llm = get_chat_model("gpt-4o", temperature=0.7, timeout=LLM_CALL_TIMEOUT, max_retries=LLM_RETRIES)
+            
+            self.prompt_template = ChatPromptTemplate.from_messages(
+             [
+            ("system", "{system_prompt}"),
+            ("placeholder", "{chat_history}"),
+            ("human", "{query}"),
+            ("placeholder", "{agent_scratchpad}"),
+            ] 
+            )
+            
+            # Initialize the parser
+            self.parser = PydanticOutputParser(pydantic_object=EmergencyResponse)
+            
+            # Initialize tools
+            self.tools = self._create_tools()
+            
+            # Fixed local tool pipeline used in hybrid mode
+            self._pipeline = HybridPipeline(llm=self.llm)
+            
+            # Build the agent pipeline once; it does not depend on the query and
+            # AgentExecutor keeps no per-run state, so it is shared across threads
+            self._agent_executor = self._create_agent_executor()
+            
+            self.warm_up_seconds = time.perf_counter() - started
+            self._ready.set()
+        logger.info("AI service ready", extra={"warm_up_ms": round(self.warm_up_seconds * 1000, 1)})
+    
+    def _warm_up_in_background(self):
+        try:
+            self.warm_up()
+        except Exception:
+            # The first request that needs the agent will try again
+            logger.exception("Background warm-up failed")
+    
+    @property
+    def agent_executor(self):
+        self.warm_up()
+        return self._agent_executor
+    
+    @property
+    def pipeline(self):
+        self.warm_up()
+        return self._pipeline
         
     def _create_tools(self):
         """Create and return the tools for the agent to use"""
+        from langchain.tools import StructuredTool
         
         # 1. Data extraction tool
         extract_data_tool = StructuredTool.from_function(
             func=EmergencyTools.extract_emergency_data,
+            coroutine=EmergencyTools.aextract_emergency_data,
             name="extract_emergency_data",
             description="Extract structured data from an emergency transcript or message",
             return_direct=False
@@ -87,12 +186,13 @@ class AIService:
         # 5. Translation tool
         translation_tool = StructuredTool.from_function(
             func=EmergencyTools.translate_to_language,
+            coroutine=EmergencyTools.atranslate_to_language,
             name="translate_to_language",
             description="Translate text to the specified language",
             return_direct=False
         )
         
-        return [
+        tools = [
             extract_data_tool,
             alert_services_tool,
             generate_report_tool,
@@ -100,6 +200,52 @@ class AIService:
             translation_tool
         ]
         
+        # 6. Final response tool; its arguments are validated against EmergencyResponse
+        if self.structured_response:
+            tools.append(StructuredTool.from_function(
+                func=self._submit_response,
+                name="submit_response",
+                description="Submit the final response to the caller. Call this once, as the last step",
+                args_schema=EmergencyResponse,
+                return_direct=True
+            ))
+        
+        return tools
+    
+    @staticmethod
+    def _submit_response(**response):
+        """Final answer of a structured-response agent run"""
+        return EmergencyResponse(**response).model_dump()
+        
+    def _create_agent_executor(self):
+        """Compile the prompt, agent and executor used for every query"""
+        from langchain.agents import create_tool_calling_agent, AgentExecutor
+        
+        # The system prompt is the same for every request and comes first,
+        # ahead of the per-request history and query
+        prompt = self.prompt_template.partial(
+            system_prompt=self.prompt_compiler.system_prompt(
+                self.structured_response, EmergencyResponse, self.parser.get_format_instructions()
+            )
+        )
+        
+        # Create agent with the LLM instance variable and tools
+        agent = create_tool_calling_agent(
+            llm=self.llm,
+            prompt=prompt,
+            tools=self.prompt_compiler.tool_schemas(self.tools)
+        )
+ 
+        return AgentExecutor(
+            agent=agent,
+            tools=self.tools,
+            # Step-by-step console output; off by default as it is written on the request thread
+            verbose=os.getenv("AGENT_VERBOSE", "false").lower() == "true",
+            return_intermediate_steps=True,
+            # Stops runs abandoned at their deadline from carrying on
+            max_execution_time=REQUEST_DEADLINE_SECONDS
+        )
+        
     def get_response(self, query):
         """
         Process a user query and return a response.
@@ -111,54 +257,535 @@ class AIService:
         Returns:
             str: Response to the user's query
         """
-        print(f"Processing query: {query}")
-        # Create prompt template with correct parser reference
-        prompt = self.prompt_template.partial(
-            system_prompt=SYSTEM_PROMPT_DATA_EXTRACT,
-            format_instructions=self.parser.get_format_instructions()
+        started = time.perf_counter()
+        with query_context(query):
+            return self._observe(self._get_response(query), started)
+    
+    def _get_response(self, query):
+        log_payload(logger, "Processing query", query)
+        conversation = self.sessions.begin(query, get_session_id(query))
+        
+        cached_response = self._cached_response(query, conversation)
+        if cached_response is not None:
+            return cached_response
+        
+        triage = self.triage.classify(get_transcript(query))
+        result = self._fast_path_response(query, conversation, triage, force=self.mode == "local")
+        if result is None:
+            with request_deadline(critical=triage.severity == "critical"):
+                try:
+                    result = self._llm_response(query, conversation)
+                except Exception as e:
+                    result = self._degraded_response(query, conversation, triage, e)
+        
+        return self._finish(query, conversation, *result)
+    
+    def _llm_response(self, query, conversation):
+        """
+        Answer with the hybrid pipeline or the agent, leaving
+        FALLBACK_RESERVE_SECONDS of the request deadline for the fallbacks
+        
+        Raises:
+            LLMUnavailable, TimeoutError: If the model's circuit is open or the run overran
+        """
+        with request_deadline(remaining() - FALLBACK_RESERVE_SECONDS):
+            if self.mode == "hybrid":
+                return self._pipeline_response(run_with_deadline(
+                    self.pipeline.run, query, conversation.previous_data, conversation.previous_alert
+                ))
+            
+            executor = self._agent_executor_if_available()
+            try:
+                raw_response = run_with_deadline(
+                    executor.invoke,
+                    self.prompt_compiler.agent_inputs(query, conversation.chat_history),
+                    config={"callbacks": [get_metrics_callback()]}
+                )
+            finally:
+                self._agent_breaker().release()
+            log_payload(logger, "Agent run finished", raw_response)
+            return self._agent_response(raw_response)
+    
+    def _agent_executor_if_available(self):
+        """
+        The agent executor, unless its model's circuit is open. Callers
+        release the breaker once the run ends, so a probe whose run recorded
+        no turn (abandoned or cancelled) does not hold the slot.
+        """
+        executor = self.agent_executor
+        if not self._agent_breaker().allow():
+            raise LLMUnavailable(f"Circuit for {self._agent_breaker().name} is open")
+        return executor
+    
+    def _agent_breaker(self):
+        return get_breaker(getattr(self.llm, "model_name", "unknown"))
+    
+    async def aget_response(self, query):
+        """
+        Async version of get_response for the ASGI serving mode.
+        The agent run and LLM-backed tools await the async OpenAI client
+        instead of blocking a worker thread.
+        
+        Args:
+            query (str): User's query text
+            
+        Returns:
+            dict: Response to the user's query
+        """
+        started = time.perf_counter()
+        with query_context(query):
+            return self._observe(await self._aget_response(query), started)
+    
+    async def _aget_response(self, query):
+        log_payload(logger, "Processing query", query)
+        conversation = self.sessions.begin(query, get_session_id(query))
+        
+        cached_response = self._cached_response(query, conversation)
+        if cached_response is not None:
+            return cached_response
+        
+        triage = self.triage.classify(get_transcript(query))
+        # The local tools block on locks and SQLite, so keep them off the event loop
+        result = await asyncio.to_thread(self._fast_path_response, query, conversation, triage, force=self.mode == "local")
+        if result is None:
+            with request_deadline(critical=triage.severity == "critical"):
+                try:
+                    result = await self._allm_response(query, conversation)
+                except Exception as e:
+                    result = await self._adegraded_response(query, conversation, triage, e)
+        
+        return self._finish(query, conversation, *result)
+    
+    async def _allm_response(self, query, conversation):
+        """Async twin of _llm_response; an overrunning run is cancelled"""
+        with request_deadline(remaining() - FALLBACK_RESERVE_SECONDS):
+            if self.mode == "hybrid":
+                return self._pipeline_response(await asyncio.wait_for(
+                    self.pipeline.arun(query, conversation.previous_data, conversation.previous_alert),
+                    max(0.0, remaining())
+                ))
+            
+            executor = self._agent_executor_if_available()
+            try:
+                raw_response = await asyncio.wait_for(
+                    executor.ainvoke(
+                        self.prompt_compiler.agent_inputs(query, conversation.chat_history),
+                        config={"callbacks": [get_metrics_callback()]}
+                    ),
+                    max(0.0, remaining())
+                )
+            finally:
+                self._agent_breaker().release()
+            log_payload(logger, "Agent run finished", raw_response)
+            return self._agent_response(raw_response)
+    
+    def stream_response(self, query):
+        """
+        Process a user query, yielding progress events as the work happens
+        so callers get guidance before the whole agent run finishes.
+        
+        Args:
+            query: User's query, a transcript string or query object
+            
+        Yields:
+            tuple: (event name, event data). Events are "status", "triage",
+            "tool_start", "tool_end", "extracted_data", "alert", "next_steps"
+            and finally "response" with the EmergencyResponse dictionary
+        """
+        # Set the query context around each step rather than the whole
+        # generator, since the consumer may resume it in a different context
+        started = time.perf_counter()
+        events = self._stream_response(query)
+        dispatches = RequestDispatches()
+        while True:
+            with query_context(query, dispatches):
+                try:
+                    event = next(events)
+                except StopIteration:
+                    return
+            if event[0] == "response":
+                self._observe(event[1], started)
+            yield event
+    
+    def _stream_response(self, query):
+        log_payload(logger, "Streaming query", query)
+        yield "status", {"stage": "received"}
+        conversation = self.sessions.begin(query, get_session_id(query))
+        
+        cached_response = self._cached_response(query, conversation)
+        if cached_response is not None:
+            yield "response", cached_response
+            return
+        
+        triage = self.triage.classify(get_transcript(query))
+        result = self._fast_path_response(query, conversation, triage, force=self.mode == "local")
+        if result is not None:
+            response = self._finish(query, conversation, *result)
+            yield "triage", response["metadata"]
+            yield "response", response
+            return
+        
+        # Generators cannot hold a context variable across yields, so the
+        # deadline is re-entered around each step like the query context
+        critical = triage.severity == "critical"
+        deadline = time.monotonic() + budget_seconds(critical)
+        try:
+            events = self._stream_llm_response(query, conversation)
+            yield from self._within_deadline(events, deadline - FALLBACK_RESERVE_SECONDS, critical)
+        except Exception as e:
+            yield "status", {"stage": "fallback"}
+            with request_deadline(deadline - time.monotonic(), critical):
+                result = self._degraded_response(query, conversation, triage, e)
+            yield "response", self._finish(query, conversation, *result)
+    
+    @staticmethod
+    def _within_deadline(events, deadline, critical):
+        """Run each step of a generator under the request deadline"""
+        while True:
+            with request_deadline(deadline - time.monotonic(), critical):
+                try:
+                    event = next(events)
+                except StopIteration:
+                    return
+            yield event
+    
+    def _stream_llm_response(self, query, conversation):
+        """Stream the hybrid pipeline or the agent run; raises to hand over to the fallbacks"""
+        if self.mode == "hybrid":
+            yield "status", {"stage": "hybrid"}
+            events = self.pipeline.stream(query, conversation.previous_data, conversation.previous_alert)
+            for event, data in events:
+                if event == "result":
+                    yield "response", self._finish(query, conversation, *self._pipeline_response(data))
+                else:
+                    yield event, data
+            return
+        
+        executor = self._agent_executor_if_available()
+        yield "status", {"stage": "agent"}
+        steps = []
+        output = ""
+        try:
+            for chunk in iterate_with_deadline(executor.stream(
+                self.prompt_compiler.agent_inputs(query, conversation.chat_history),
+                config={"callbacks": [get_metrics_callback()]}
+            )):
+                for action in chunk.get("actions", []):
+                    yield "tool_start", {"tool": action.tool, "input": action.tool_input}
+                for step in chunk.get("steps", []):
+                    steps.append((step.action, step.observation))
+                    yield "tool_end", {"tool": step.action.tool, "output": step.observation}
+                    if step.action.tool in STREAMED_TOOL_EVENTS:
+                        yield STREAMED_TOOL_EVENTS[step.action.tool], step.observation
+                if "output" in chunk:
+                    output = chunk["output"]
+        finally:
+            self._agent_breaker().release()
+        
+        result = self._agent_response({"output": output, "intermediate_steps": steps})
+        yield "response", self._finish(query, conversation, *result)
+    
+    def _cached_response(self, query, conversation):
+        """
+        Look up a previous response to the same (normalized) transcript near
+        the same location. Alerts are re-issued so alert_time and alert_id
+        are always fresh on a hit. Follow-up messages depend on the
+        conversation so they are never answered from the cache.
+        
+        Returns:
+            dict: Cached response dictionary, or None on a miss
+        """
+        if conversation.is_follow_up:
+            return None
+        
+        entry = response_cache.get(response_cache_key(get_transcript(query), get_coordinates(query)))
+        if entry is None:
+            return None
+        
+        response = entry["response"]
+        alert = None
+        if entry["alerted_data"] is not None:
+            alert = EmergencyTools.alert_emergency_services(ExtractedEmergencyData(**entry["alerted_data"]))
+            self._with_metadata(
+                response,
+                alert_id=alert.get("alert_id"),
+                alert_time=alert.get("alert_time"),
+                duplicate_of=alert.get("duplicate_of")
+            )
+        self.sessions.complete(conversation, query, response, entry["alerted_data"], alert)
+        return self._with_metadata(response, cache="hit")
+    
+    def _finish(self, query, conversation, response, emergency_data, alert):
+        """
+        Record the exchange in the caller's session and cache the response
+        
+        Args:
+            query: User's query, a transcript string or query object
+            conversation (Conversation): Session context for this request
+            response (dict): Response dictionary to return to the caller
+            emergency_data (ExtractedEmergencyData): Emergency data the response is based on, if any
+            alert (dict): Result of alert_emergency_services, if called
+            
+        Returns:
+            dict: The response
+        """
+        self.sessions.complete(
+            conversation, query, response,
+            emergency_data.model_dump() if emergency_data is not None else None,
+            alert
         )
+        if emergency_data is not None:
+            self._with_metadata(response, severity=emergency_data.severity)
+        if conversation.is_follow_up:
+            return self._with_metadata(response, cache="bypass")
+        alerted_data = emergency_data if alert and alert.get("alert_sent") else None
+        return self._cache_response(query, response, alerted_data)
+    
+    def _cache_response(self, query, response, alerted_data):
+        """
+        Store a successful response in the response cache
         
-        # Create agent with the LLM instance variable and tools
-        agent = create_tool_calling_agent(
-            llm=self.llm,
-            prompt=prompt,
-            tools=self.tools
+        Args:
+            query: User's query, a transcript string or query object
+            response (dict): Response dictionary to return to the caller
+            alerted_data (ExtractedEmergencyData): Data services were alerted with, if any
+            
+        Returns:
+            dict: The response, marked as a cache miss
+        """
+        self._with_metadata(response, cache="miss")
+        metadata = response["metadata"]
+        if not metadata.get("error") and not metadata.get("parse_error") and not metadata.get("degraded"):
+            response_cache.set(
+                response_cache_key(get_transcript(query), get_coordinates(query)),
+                {
+                    "response": response,
+                    "alerted_data": alerted_data.model_dump() if alerted_data is not None else None
+                }
+            )
+        return response
+    
+    def _agent_response(self, raw_response):
+        """
+        Build the response from an agent run
+        
+        Returns:
+            tuple: (response dictionary, ExtractedEmergencyData, alert dictionary)
+        """
+        response = self._with_metadata(self._parse_output(raw_response.get("output", "")), path="agent")
+        self._localize_message(response, get_transcript(get_current_query()))
+        
+        emergency_data = None
+        alert = None
+        for action, observation in raw_response.get("intermediate_steps", []):
+            try:
+                if action.tool == "extract_emergency_data" and emergency_data is None and "error" not in observation:
+                    emergency_data = coerce_emergency_data(observation, get_transcript(get_current_query()))
+                elif action.tool == "alert_emergency_services":
+                    emergency_data = ExtractedEmergencyData(**action.tool_input["emergency_data"])
+                    alert = observation if isinstance(observation, dict) else None
+            except Exception as e:
+                logger.warning("Could not read %s step: %s", action.tool, e)
+        if alert is not None:
+            self._with_metadata(
+                response,
+                alert_id=alert.get("alert_id"),
+                alert_time=alert.get("alert_time"),
+                duplicate_of=alert.get("duplicate_of")
+            )
+        return response, emergency_data, alert
+    
+    def _localize_message(self, response, transcript):
+        """Translate the agent's English response_message to Maori for Maori callers"""
+        message = response.get("response_message")
+        if not message or detect_language(transcript) != MAORI:
+            return
+        translation = EmergencyTools.translate_to_language(message, "Maori")
+        if translation.get("translation_successful"):
+            response["response_message"] = translation["translated_text"]
+            self._with_metadata(response, translation_source=translation.get("translation_source"))
+    
+    def _fast_path_response(self, query, conversation, triage=None, force=False):
+        """
+        Answer unambiguous emergencies locally without running the agent.
+        Runs the deterministic tools directly on the triage result.
+        
+        Args:
+            query: User's query, a transcript string or query object
+            conversation (Conversation): Session context for this request
+            triage (TriageResult, optional): Triage of the transcript, if already done
+            force (bool): Answer from triage even when it is not confident,
+                as the last step of the fallback chain
+            
+        Returns:
+            tuple: (response dictionary, ExtractedEmergencyData, alert
+            dictionary), or None to fall back to the agent
+        """
+        transcript = get_transcript(query)
+        if triage is None:
+            triage = self.triage.classify(transcript)
+        if not force and not self.triage.is_confident(triage):
+            return None
+        
+        logger.info("Fast-path triage", extra={
+            "emergency_type": triage.emergency_type.value,
+            "severity": triage.severity,
+            "triage_confidence": triage.confidence
+        })
+        coordinates = get_coordinates(query)
+        emergency_data = ExtractedEmergencyData(
+            emergency_type=triage.emergency_type,
+            severity=triage.severity,
+            location=Location(
+                coordinates=f"{coordinates[0]}, {coordinates[1]}" if coordinates else None
+            ),
+            additional_notes=transcript
         )
- 
-        agent_executor = AgentExecutor(
-            agent=agent,
-            tools=self.tools,
-            verbose=True
+        if conversation.previous_data:
+            merged = merge_emergency_data(conversation.previous_data, emergency_data.model_dump(exclude_none=True))
+            emergency_data = coerce_emergency_data(merged, transcript)
+        
+        alert, next_steps, report = run_local_tools(emergency_data, conversation.previous_alert)
+        
+        response_message = compose_response_message(emergency_data, alert, next_steps, detect_language(transcript))
+        response = self._build_response(emergency_data, alert, next_steps, response_message)
+        response = self._with_metadata(
+            response,
+            path="fast_path",
+            triage_confidence=triage.confidence,
+            matched_keywords=triage.matched_keywords,
+            alert_id=alert.get("alert_id"),
+            alert_time=alert.get("alert_time"),
+            duplicate_of=alert.get("duplicate_of")
         )
-
-        try:
-            raw_response = agent_executor.invoke({"query": query, "chat_history": []})
-            print(raw_response)
-            output = raw_response.get("output", "")
-            print(f"Raw output: {output}")
+        return response, emergency_data, alert
+    
+    def _degraded_response(self, query, conversation, triage, error):
+        """
+        Answer when the agent or hybrid run failed, was skipped or overran:
+        extraction on the fallback chain with template wording while the
+        deadline allows, then local triage
+        
+        Args:
+            query: User's query, a transcript string or query object
+            conversation (Conversation): Session context for this request
+            triage (TriageResult): Local triage of the transcript
+            error (Exception): Why the LLM-backed run did not answer
             
+        Returns:
+            tuple: (response dictionary, ExtractedEmergencyData, alert dictionary)
+        """
+        reason = str(error) or f"{type(error).__name__}: no answer within the deadline"
+        logger.warning("Answering from the fallback chain: %s", reason)
+        # Hybrid mode has already tried extraction
+        if self.mode != "hybrid" and has_time():
             try:
-                structured_response = self.parser.parse(output)
-                # Return the model as a dictionary instead of a JSON string
+                result = self._pipeline_response(run_with_deadline(
+                    self.fallback_pipeline.run, query, conversation.previous_data, conversation.previous_alert
+                ))
+                return self._with_fallback(result, "extraction", reason)
+            except Exception as e:
+                logger.warning("Fallback extraction failed: %s", e)
+        return self._with_fallback(self._fast_path_response(query, conversation, triage, force=True), "local_triage", reason)
+    
+    async def _adegraded_response(self, query, conversation, triage, error):
+        """Async twin of _degraded_response"""
+        reason = str(error) or f"{type(error).__name__}: no answer within the deadline"
+        logger.warning("Answering from the fallback chain: %s", reason)
+        if self.mode != "hybrid" and has_time():
+            try:
+                result = self._pipeline_response(await asyncio.wait_for(
+                    self.fallback_pipeline.arun(query, conversation.previous_data, conversation.previous_alert),
+                    max(0.0, remaining())
+                ))
+                return self._with_fallback(result, "extraction", reason)
+            except Exception as e:
+                logger.warning("Fallback extraction failed: %s", e)
+        result = await asyncio.to_thread(self._fast_path_response, query, conversation, triage, force=True)
+        return self._with_fallback(result, "local_triage", reason)
+    
+    def _with_fallback(self, result, fallback, reason):
+        """Mark a fallback-chain result as degraded"""
+        self._with_metadata(result[0], path="fallback", fallback=fallback, fallback_reason=reason, degraded=True)
+        return result
+    
+    def _pipeline_response(self, result: PipelineResult):
+        """
+        Build the response from a hybrid pipeline run
+        
+        Returns:
+            tuple: (response dictionary, ExtractedEmergencyData, alert dictionary)
+        """
+        alert = result.alert
+        response = self._build_response(result.emergency_data, alert, result.next_steps, result.response_message)
+        response = self._with_metadata(
+            response,
+            path="hybrid",
+            llm_turns=result.llm_turns,
+            alert_id=alert.get("alert_id"),
+            alert_time=alert.get("alert_time"),
+            duplicate_of=alert.get("duplicate_of")
+        )
+        return response, result.emergency_data, alert
+    
+    @staticmethod
+    def _build_response(emergency_data, alert, next_steps, response_message):
+        """Build an EmergencyResponse dictionary from locally run tool outputs"""
+        return EmergencyResponse(
+            response_message=response_message,
+            emergency_type=emergency_data.emergency_type,
+            resources_alerted=[emergency_data.emergency_type] if alert.get("alert_sent") or alert.get("duplicate_of") else [],
+            additional_notes=next_steps.get("additional_notes")
+        ).model_dump()
+    
+    def _observe(self, response, started):
+        """Record end-to-end latency by answering path and attach it to the response"""
+        elapsed = time.perf_counter() - started
+        metadata = response.get("metadata", {})
+        path = "cache" if metadata.get("cache") == "hit" else metadata.get("path", "unknown")
+        REQUEST_DURATION.observe(elapsed, path=path)
+        logger.info("Query processed", extra={
+            "path": path,
+            "latency_ms": round(elapsed * 1000, 1),
+            "emergency_type": response.get("emergency_type"),
+            "alert_id": metadata.get("alert_id"),
+            "error": bool(metadata.get("error") or metadata.get("parse_error"))
+        })
+        return self._with_metadata(response, latency_ms=round(elapsed * 1000, 1))
+    
+    @staticmethod
+    def _with_metadata(response, **metadata):
+        """Attach processing metadata, such as which path answered, to a response"""
+        response["metadata"] = {**response.get("metadata", {}), **metadata}
+        return response
+    
+    def _parse_output(self, output):
+        """Parse the agent's final output into an EmergencyResponse dictionary"""
+        log_payload(logger, "Agent output", output)
+        
+        # Structured-response runs end with the already validated submit_response result
+        if isinstance(output, dict):
+            structured_response = parse_model(EmergencyResponse, output)
+            if structured_response is not None:
+                return structured_response.model_dump()
+        
+        try:
+            structured_response = self.parser.parse(output)
+            # Return the model as a dictionary instead of a JSON string
+            return structured_response.model_dump()
+        except Exception as parsing_error:
+            # Repair near-valid JSON locally before giving up on the output
+            structured_response = parse_model(EmergencyResponse, output)
+            if structured_response is not None:
+                PARSE_REPAIRS.inc()
                 return structured_response.model_dump()
-            except Exception as parsing_error:
-                print(f"Error parsing output: {parsing_error}")
-                # If parsing fails, return a simple response object with the raw output
-                return {
-                    "response_message": f"Successfully processed your request: {output}",
-                    "emergency_type": None,
-                    "additional_notes": f"Unable to parse structured data: {str(parsing_error)}"
-                }
             
-        except Exception as e:
-            print(f"Error processing query: {e}")
-            error_message = f"Error processing your request: {str(e)}"
+            logger.warning("Error parsing output: %s", parsing_error)
+            PARSE_FAILURES.inc()
+            # If parsing fails, return a simple response object with the raw output
             return {
-                "response_message": error_message,
+                "response_message": f"Successfully processed your request: {output}",
                 "emergency_type": None,
-                "additional_notes": "An error occurred during processing"
+                "additional_notes": f"Unable to parse structured data: {str(parsing_error)}",
+                "metadata": {"parse_error": True}
             }
-
-
-
-
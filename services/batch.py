@@ -0,0 +1,108 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+from services.tools import EmergencyTools
+from services.queries import get_transcript, get_coordinates, get_chat_history, get_session_id
+from services.cache import response_cache_key
+from services.resilience import has_time, remaining, request_deadline
+
+# Bulk intake for queued messages, e.g. hundreds of SMS transcripts after a
+# network outage. Identical first messages from the same caller and area are
+# processed once, items run with bounded concurrency and each gets its own
+# time budget.
+#
+# The budget is a request deadline rather than a timer around the future: a
+# running item cannot be cancelled, so one that was abandoned could still
+# alert services after being reported as timed out. Under the deadline the
+# item itself stops waiting on the model and answers from the local
+# fallback, so every item that dispatched returns the response saying so.
+
+
+class BatchProcessor:
+    """Runs many queries through AIService with bounded concurrency"""
+
+    def __init__(self, ai_service, max_concurrency=None, item_timeout=None, extraction_batch_size=None, scheduler=None):
+        self.ai_service = ai_service
+        # Optional PriorityScheduler, so batch items compete fairly with live traffic
+        self.scheduler = scheduler
+        self.max_concurrency = max_concurrency or int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+        self.item_timeout = item_timeout or float(os.getenv("BATCH_ITEM_TIMEOUT", "60"))
+        self.extraction_batch_size = extraction_batch_size or int(os.getenv("BATCH_EXTRACTION_SIZE", "20"))
+        # Shared by all batches so concurrent batch requests cannot exceed the limit
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="batch")
+
+    def process(self, queries: List[Any], batch_extraction: bool = False) -> List[Dict]:
+        """
+        Process a list of queries
+
+        Args:
+            queries (List): Query objects in the same shape as /api/query's "query"
+            batch_extraction (bool): Pre-extract all transcripts in a few batched
+                LLM calls instead of one call per item
+
+        Returns:
+            List[Dict]: One result per query, in input order, with either a
+            "response" or an "error"
+        """
+        results: List[Dict] = [{"index": i} for i in range(len(queries))]
+
+        # Deduplicate identical transcripts from the same caller and location bucket
+        first_index_by_key: Dict[str, int] = {}
+        unique: List[int] = []
+        for i, query in enumerate(queries):
+            key = self._dedupe_key(query)
+            if key is not None and key in first_index_by_key:
+                results[i]["duplicate_of"] = first_index_by_key[key]
+            else:
+                if key is not None:
+                    first_index_by_key[key] = i
+                unique.append(i)
+
+        if batch_extraction:
+            self._prefetch_extractions([get_transcript(queries[i]) for i in unique])
+
+        def run(i):
+            # Items only start timing once a worker picks them up, and waiting
+            # for a scheduler slot spends the same budget
+            with request_deadline(self.item_timeout):
+                if self.scheduler is None:
+                    return self.ai_service.get_response(queries[i])
+                with self.scheduler.slot(queries[i], max_wait=max(0.0, remaining())):
+                    return self.ai_service.get_response(queries[i])
+
+        futures = {i: self._executor.submit(run, i) for i in unique}
+        for i, future in futures.items():
+            try:
+                results[i]["response"] = future.result()
+            except Exception as e:
+                results[i]["error"] = str(e)
+
+        for result in results:
+            if "duplicate_of" in result:
+                original = results[result["duplicate_of"]]
+                if "response" in original:
+                    result["response"] = original["response"]
+                else:
+                    result["error"] = original.get("error")
+        return results
+
+    @staticmethod
+    def _dedupe_key(query: Any) -> Optional[str]:
+        """
+        Key under which identical items are processed once, or None for
+        follow-up messages, whose answer depends on the conversation so far
+        """
+        if get_chat_history(query):
+            return None
+        return f"{get_session_id(query) or ''}|{response_cache_key(get_transcript(query), get_coordinates(query))}"
+
+    def _prefetch_extractions(self, transcripts: List[str]):
+        """
+        Warm the extraction cache with batched LLM calls, within one item's
+        time budget; transcripts left over are extracted by their own items
+        """
+        with request_deadline(self.item_timeout):
+            for start in range(0, len(transcripts), self.extraction_batch_size):
+                if not has_time():
+                    break
+                EmergencyTools.extract_emergency_data_batch(transcripts[start:start + self.extraction_batch_size])
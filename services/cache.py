@@ -0,0 +1,247 @@
+import copy
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+from services.shared_state import SQLITE, SharedDatabase, get_shared_database, state_backend
+
+# Caches for repeated and near-duplicate transcripts.
+# During large incidents many callers send nearly the same message
+# ("flooding on Main Rd, need help"). Keys are built from a normalized
+# transcript plus a coarse location bucket so those messages share one
+# entry, while reports from different areas stay separate.
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+# Words that do not change the meaning of a report
+FILLER_WORDS = frozenset([
+    "a", "an", "the", "um", "uh", "please", "pls", "plz", "asap", "quick", "quickly", "hi", "hello", "oh"
+])
+
+
+def normalize_transcript(text: str) -> str:
+    """Lowercase, strip punctuation and filler words, and collapse repeated words"""
+    words = _WHITESPACE.split(_PUNCTUATION.sub(" ", (text or "").lower()).strip())
+    normalized = []
+    for word in words:
+        if not word or word in FILLER_WORDS:
+            continue
+        if normalized and normalized[-1] == word:
+            continue
+        normalized.append(word)
+    return " ".join(normalized)
+
+
+def location_bucket(coordinates: Optional[Tuple[float, float]], precision: int) -> str:
+    """Round coordinates to a coarse grid cell (2 decimals is roughly 1km)"""
+    if coordinates is None:
+        return "unknown"
+    latitude, longitude = coordinates
+    return f"{round(latitude, precision)},{round(longitude, precision)}"
+
+
+class TTLCache:
+    """Thread-safe LRU cache with a bounded size, per-entry TTL and hit/miss counters"""
+
+    def __init__(self, max_size: int = 1024, ttl_seconds: float = 300):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return a copy of the cached value, or None on a miss or expired entry"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at < now:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return copy.deepcopy(value)
+
+    def set(self, key: str, value: Any):
+        """Store a copy of value, evicting the least recently used entry when full"""
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations
+            }
+
+
+CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache_entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    stored_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE INDEX IF NOT EXISTS idx_cache_entries_stored_at ON cache_entries (namespace, stored_at);
+"""
+
+
+class SharedTTLCache:
+    """
+    TTLCache with the same interface, kept in the shared SQLite database so
+    every worker process sees the same entries. Values are stored as JSON.
+    Hits do not write, so when full the oldest stored entries are evicted
+    rather than the least recently read. Hit/miss counters are per process.
+    """
+
+    # Size is enforced every this many writes rather than on each one
+    TRIM_EVERY = 64
+
+    def __init__(self, namespace: str, database: SharedDatabase, max_size: int = 1024, ttl_seconds: float = 300):
+        self.namespace = namespace
+        self.database = database
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        database.ensure_schema("cache", CACHE_SCHEMA)
+
+    def _count(self, hit: bool, expired: bool = False):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+                self.expirations += expired
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value, or None on a miss or expired entry"""
+        connection = self.database.connection()
+        row = connection.execute(
+            "SELECT expires_at, value FROM cache_entries WHERE namespace = ? AND key = ?", (self.namespace, key)
+        ).fetchone()
+        if row is None:
+            self._count(False)
+            return None
+        if row["expires_at"] < time.time():
+            connection.execute("DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (self.namespace, key))
+            self._count(False, expired=True)
+            return None
+        self._count(True)
+        return json.loads(row["value"])
+
+    def set(self, key: str, value: Any):
+        """Store value, trimming the oldest entries when over max_size"""
+        now = time.time()
+        connection = self.database.connection()
+        connection.execute(
+            "INSERT OR REPLACE INTO cache_entries (namespace, key, stored_at, expires_at, value) VALUES (?, ?, ?, ?, ?)",
+            (self.namespace, key, now, now + self.ttl_seconds, json.dumps(value, default=str))
+        )
+        with self._lock:
+            self._writes += 1
+            trim = self._writes % self.TRIM_EVERY == 0
+        if trim:
+            self._trim(connection, now)
+
+    def _trim(self, connection, now: float):
+        with connection:
+            expired = connection.execute(
+                "DELETE FROM cache_entries WHERE namespace = ? AND expires_at < ?", (self.namespace, now)
+            ).rowcount
+            evicted = connection.execute(
+                "DELETE FROM cache_entries WHERE namespace = ? AND key IN ("
+                "SELECT key FROM cache_entries WHERE namespace = ? ORDER BY stored_at DESC LIMIT -1 OFFSET ?)",
+                (self.namespace, self.namespace, self.max_size)
+            ).rowcount
+        with self._lock:
+            self.expirations += expired
+            self.evictions += evicted
+
+    def clear(self):
+        self.database.connection().execute("DELETE FROM cache_entries WHERE namespace = ?", (self.namespace,))
+
+    def stats(self) -> dict:
+        size = self.database.connection().execute(
+            "SELECT COUNT(*) FROM cache_entries WHERE namespace = ?", (self.namespace,)
+        ).fetchone()[0]
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": size,
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations
+            }
+
+
+def _cache_from_env(prefix: str, max_size: str = "1024", ttl_seconds: str = "300"):
+    max_size = int(os.getenv(f"{prefix}_CACHE_MAX_SIZE", max_size))
+    ttl_seconds = float(os.getenv(f"{prefix}_CACHE_TTL_SECONDS", ttl_seconds))
+    if state_backend() == SQLITE:
+        return SharedTTLCache(prefix.lower(), get_shared_database(), max_size=max_size, ttl_seconds=ttl_seconds)
+    return TTLCache(max_size=max_size, ttl_seconds=ttl_seconds)
+
+
+LOCATION_PRECISION = int(os.getenv("CACHE_LOCATION_PRECISION", "2"))
+
+# Final responses from AIService, keyed by transcript and location bucket
+response_cache = _cache_from_env("RESPONSE")
+
+# extract_emergency_data results, keyed by transcript only
+extraction_cache = _cache_from_env("EXTRACTION")
+
+# LLM translations of free text; translations do not go stale, so entries
+# live for a day and the least recently used are evicted first
+translation_cache = _cache_from_env("TRANSLATION", max_size="4096", ttl_seconds="86400")
+
+
+def response_cache_key(transcript: str, coordinates: Optional[Tuple[float, float]]) -> str:
+    return f"{location_bucket(coordinates, LOCATION_PRECISION)}|{normalize_transcript(transcript)}"
+
+
+def extraction_cache_key(transcript: str) -> str:
+    return normalize_transcript(transcript)
+
+
+def translation_cache_key(text: str, target_language: str) -> str:
+    return f"{target_language}|{_WHITESPACE.sub(' ', (text or '').strip())}"
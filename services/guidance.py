@@ -0,0 +1,151 @@
+import json
+import logging
+import os
+import threading
+import time
+from types import MappingProxyType
+from typing import Dict, Iterable, Mapping, NamedTuple, Optional, Tuple
+
+# Precomputed guidance catalog: next steps and estimated response time for
+# every (service type, severity) pair.
+# The tables are built once from a data file into immutable tuples and
+# read-only mappings, so a lookup is a single dictionary access and shares
+# the same step tuple across requests. Editing the file takes effect
+# without a restart; the catalog checks its modification time at most once
+# per GUIDANCE_RELOAD_INTERVAL seconds and swaps in the new tables.
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_GUIDANCE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "lib", "guidance.json")
+UNKNOWN_SEVERITY = "unknown"
+FALLBACK_SERVICE = "other"
+
+
+class Guidance(NamedTuple):
+    steps: Tuple[str, ...]
+    estimated_response_time: str
+    priority: str
+    follow_up_required: bool
+    additional_notes: Optional[str]
+
+
+def build_catalog(data: Dict, service_types: Iterable[str]) -> Mapping[Tuple[str, str], Guidance]:
+    """
+    Build the read-only (service type, severity) -> Guidance table from catalog data
+
+    Args:
+        data (Dict): Parsed guidance file
+        service_types (Iterable[str]): Service types that must all have steps
+
+    Returns:
+        Mapping: Immutable lookup table
+
+    Raises:
+        ValueError: If a service type or severity is missing
+    """
+    severities = tuple(data.get("severities") or ())
+    if UNKNOWN_SEVERITY not in severities:
+        raise ValueError(f"Guidance severities must include '{UNKNOWN_SEVERITY}'")
+    response_times = data.get("response_times") or {}
+    missing = [severity for severity in severities if severity not in response_times]
+    if missing:
+        raise ValueError(f"Guidance has no response time for severities: {', '.join(missing)}")
+    steps = data.get("steps") or {}
+    missing = [service for service in service_types if service not in steps]
+    if FALLBACK_SERVICE not in steps:
+        missing.append(FALLBACK_SERVICE)
+    if missing:
+        raise ValueError(f"Guidance has no steps for service types: {', '.join(missing)}")
+
+    critical_step = data.get("critical_step")
+    follow_up = set(data.get("follow_up_severities") or ())
+    table = {}
+    for service, service_steps in steps.items():
+        service_steps = tuple(str(step) for step in service_steps)
+        for severity in severities:
+            table[(service, severity)] = Guidance(
+                steps=(critical_step,) + service_steps if severity == "critical" and critical_step else service_steps,
+                estimated_response_time=response_times[severity],
+                priority=severity,
+                follow_up_required=severity in follow_up,
+                additional_notes=data.get("additional_notes")
+            )
+    return MappingProxyType(table)
+
+
+class GuidanceCatalog:
+    """Hot-reloadable guidance tables loaded from a JSON file"""
+
+    def __init__(self, path: str, service_types: Iterable[str], reload_interval: float = 5.0):
+        self.path = path
+        self.service_types = tuple(service_types)
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._table: Mapping[Tuple[str, str], Guidance] = MappingProxyType({})
+        self._mtime = None
+        self._rejected_mtime = None
+        self._loaded_at = None
+        self._next_check = 0.0
+        self.reload()
+
+    def reload(self, force: bool = False) -> bool:
+        """
+        Rebuild the tables from the data file and swap them in
+
+        Args:
+            force (bool): Reload even if the file has not changed
+
+        Returns:
+            bool: True if the file was loaded
+
+        Raises:
+            ValueError, OSError: If the file is missing or invalid; the
+            current tables are kept
+        """
+        with self._lock:
+            self._next_check = time.monotonic() + self.reload_interval
+            mtime = os.stat(self.path).st_mtime
+            if not force and mtime in (self._mtime, self._rejected_mtime):
+                return False
+            try:
+                with open(self.path, encoding="utf-8") as f:
+                    table = build_catalog(json.load(f), self.service_types)
+            except ValueError:
+                # Not retried by the periodic check until the file changes again
+                self._rejected_mtime = mtime
+                raise
+            self._table, self._mtime, self._loaded_at = table, mtime, time.time()
+        logger.info("Loaded guidance catalog", extra={"path": self.path, "entries": len(table)})
+        return True
+
+    def _maybe_reload(self):
+        try:
+            self.reload()
+        except (OSError, ValueError) as e:
+            logger.error("Keeping previous guidance catalog, could not reload %s: %s", self.path, e)
+
+    def get(self, service_type, severity: Optional[str]) -> Guidance:
+        """
+        Guidance for a service type and severity
+
+        Unknown service types use the "other" steps and unknown severities
+        the "unknown" response time.
+        """
+        if self.reload_interval > 0 and time.monotonic() >= self._next_check:
+            self._maybe_reload()
+        table = self._table
+        # str-valued enum members hash and compare like their values
+        guidance = table.get((service_type, severity))
+        if guidance is None:
+            service = getattr(service_type, "value", service_type)
+            if (service, UNKNOWN_SEVERITY) not in table:
+                service = FALLBACK_SERVICE
+            guidance = table.get((service, severity)) or table[(service, UNKNOWN_SEVERITY)]
+        return guidance
+
+    def stats(self) -> Dict:
+        return {
+            "path": self.path,
+            "entries": len(self._table),
+            "loaded_at": self._loaded_at,
+        }
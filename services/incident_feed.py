@@ -0,0 +1,553 @@
+import asyncio
+import collections
+import datetime
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Mapping, NamedTuple, Optional, Set, Tuple
+from services.incident_store import _to_jsonable, parse_coordinates
+from services.metrics import FEED_DROPPED, FEED_EVENTS
+from services.shared_state import MEMORY, SQLITE, SharedDatabase, get_shared_database, state_backend
+
+# Real-time incident feed for dispatchers.
+# alert_emergency_services, generate_report and status changes publish
+# incident events, and subscribers (the SSE and WebSocket endpoints) receive
+# those matching their service type, severity and region filter. Publishing
+# only queues the event: a dispatcher thread fans it out into a bounded
+# buffer per subscriber, dropping that subscriber's oldest events when it
+# falls behind, so a slow console never holds up /api/query. Subscribers are
+# indexed by service type, so an event is only matched against the
+# subscribers that can want it.
+#
+# Events carry a sequence number; a client reconnecting with Last-Event-ID
+# is replayed what it missed from the recent history. Updates carry only the
+# fields that changed.
+#
+# With STATE_BACKEND=sqlite events go through a table in the shared
+# database that every worker tails, so a subscriber sees incidents from
+# every worker process.
+
+logger = logging.getLogger(__name__)
+
+CREATED = "incident.created"
+UPDATED = "incident.updated"
+# Sent to a subscriber in place of the events it lost
+DROPPED = "feed.dropped"
+
+FEED_BUFFER_SIZE = int(os.getenv("FEED_BUFFER_SIZE", "256"))
+FEED_HISTORY_SIZE = int(os.getenv("FEED_HISTORY_SIZE", "1000"))
+FEED_HEARTBEAT_SECONDS = float(os.getenv("FEED_HEARTBEAT_SECONDS", "15"))
+FEED_POLL_SECONDS = float(os.getenv("FEED_POLL_SECONDS", "0.1"))
+FEED_RETENTION_SECONDS = float(os.getenv("FEED_RETENTION_SECONDS", "3600"))
+
+# Events fanned out per dispatcher pass
+DISPATCH_BATCH = 500
+
+# Report fields included in the feed; the full report is at /api/incidents/<id>
+REPORT_FIELDS = ("time_of_incident", "people_affected", "immediate_risks", "resources_needed")
+
+FEED_SCHEMA = """
+CREATE TABLE IF NOT EXISTS feed_events (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at REAL NOT NULL,
+    event TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_feed_events_created_at ON feed_events (created_at);
+"""
+
+
+def _value(value: Any) -> Optional[str]:
+    """Enum member or string as its lower-case value"""
+    if value is None:
+        return None
+    return str(getattr(value, "value", value)).lower()
+
+
+def _values(value: Any) -> Optional[frozenset]:
+    """Comma-separated string or list of values as a set, or None for no filter"""
+    if isinstance(value, str):
+        value = value.split(",")
+    values = frozenset(_value(v).strip() for v in value or () if str(v).strip())
+    return values or None
+
+
+def incident_event(event_type: str, incident_id: str, service_type: Any = None, severity: Any = None,
+                   coordinates: Optional[Tuple[float, float]] = None, changes: Optional[Dict] = None) -> Dict:
+    """
+    Build a feed event
+
+    Args:
+        event_type (str): CREATED or UPDATED
+        incident_id (str): Alert ID of the incident, or the report ID for a report without an alert
+        service_type, severity: Values subscribers filter on
+        coordinates (Tuple[float, float], optional): Incident location, for region filters
+        changes (Dict, optional): Fields that are new or changed
+
+    Returns:
+        Dict: Event without its sequence number, which the feed assigns
+    """
+    return {
+        "type": event_type,
+        "incident_id": incident_id,
+        "service_type": _value(service_type),
+        "severity": _value(severity),
+        "latitude": coordinates[0] if coordinates else None,
+        "longitude": coordinates[1] if coordinates else None,
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "changes": changes or {},
+    }
+
+
+class FeedFilter(NamedTuple):
+    """Which events a subscriber receives; None matches everything"""
+
+    service_types: Optional[frozenset] = None
+    severities: Optional[frozenset] = None
+    # (min_lat, min_lon, max_lat, max_lon)
+    bbox: Optional[Tuple[float, float, float, float]] = None
+
+    @classmethod
+    def from_params(cls, params: Mapping) -> "FeedFilter":
+        """
+        Filter from query parameters or a WebSocket message: service_type and
+        severity as comma-separated values or lists, bbox as
+        "min_lat,min_lon,max_lat,max_lon" or a list of four numbers
+
+        Raises:
+            ValueError: If a parameter is malformed
+        """
+        if not isinstance(params, Mapping):
+            raise ValueError("Feed filter must be an object")
+        bbox = params.get("bbox")
+        if bbox:
+            if isinstance(bbox, str):
+                bbox = bbox.split(",")
+            bbox = tuple(float(v) for v in bbox)
+            if len(bbox) != 4:
+                raise ValueError("bbox must be min_lat,min_lon,max_lat,max_lon")
+        return cls(_values(params.get("service_type")), _values(params.get("severity")), bbox or None)
+
+    def index_keys(self) -> Iterable[Optional[str]]:
+        """Service types this filter is indexed under; None for every type"""
+        return self.service_types or (None,)
+
+    def matches(self, event: Dict) -> bool:
+        if self.service_types is not None and event["service_type"] not in self.service_types:
+            return False
+        if self.severities is not None and event["severity"] not in self.severities:
+            return False
+        if self.bbox is not None:
+            latitude, longitude = event["latitude"], event["longitude"]
+            if latitude is None or longitude is None:
+                return False
+            min_lat, min_lon, max_lat, max_lon = self.bbox
+            return min_lat <= latitude <= max_lat and min_lon <= longitude <= max_lon
+        return True
+
+
+def parse_last_event_id(value: Optional[str]) -> Optional[int]:
+    """Sequence number from a Last-Event-ID header; None if absent or malformed"""
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+
+def format_sse(message: Dict) -> str:
+    """Format one feed message as a Server-Sent Event"""
+    event_id = f"id: {message['seq']}\n" if "seq" in message else ""
+    return f"{event_id}event: {message['type']}\ndata: {json.dumps(message, default=str)}\n\n"
+
+
+class Subscription:
+    """
+    One subscriber's bounded buffer. Only the feed's dispatcher thread adds
+    to it; the subscriber reads with get (threads) or aget (asyncio).
+    """
+
+    def __init__(self, feed_filter: FeedFilter, buffer_size: int, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.filter = feed_filter
+        self.loop = loop
+        self.dropped = 0
+        self.last_seq = 0
+        self._reported_dropped = 0
+        self._events = collections.deque(maxlen=buffer_size)
+        self._ready = threading.Event()
+        # Future an aget call is waiting on, resolved on the subscriber's loop
+        self._waiter: Optional[asyncio.Future] = None
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    def _push(self, event: Dict):
+        if len(self._events) == self._events.maxlen:
+            # The deque drops the oldest event to make room
+            self.dropped += 1
+            FEED_DROPPED.inc()
+        self._events.append(event)
+        if self.loop is None:
+            self._ready.set()
+
+    def _drain(self) -> List[Dict]:
+        messages = []
+        dropped = self.dropped - self._reported_dropped
+        if dropped:
+            self._reported_dropped += dropped
+            messages.append({"type": DROPPED, "dropped": dropped})
+        while True:
+            try:
+                event = self._events.popleft()
+            except IndexError:
+                break
+            # Replayed and live events can overlap when subscribing
+            if event["seq"] > self.last_seq:
+                self.last_seq = event["seq"]
+                messages.append(event)
+        return messages
+
+    def get(self, timeout: Optional[float] = None) -> List[Dict]:
+        """
+        Wait up to timeout seconds for messages
+
+        Returns:
+            List[Dict]: Events in order, preceded by a DROPPED message if events
+            were lost since the last call; empty on timeout
+        """
+        if not self._events:
+            self._ready.wait(timeout)
+        self._ready.clear()
+        return self._drain()
+
+    async def aget(self, timeout: Optional[float] = None) -> List[Dict]:
+        """Async get, for subscriptions made with an event loop"""
+        if not self._events:
+            # A bare future and timer rather than wait_for, which costs a task per call
+            self._waiter = self.loop.create_future()
+            timer = self.loop.call_later(timeout, _resolve, self._waiter) if timeout is not None else None
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+                if timer is not None:
+                    timer.cancel()
+        return self._drain()
+
+
+def _resolve(waiter: asyncio.Future):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+def _wake(subscriptions: Iterable[Subscription]):
+    for subscription in subscriptions:
+        if subscription._waiter is not None:
+            _resolve(subscription._waiter)
+
+
+class IncidentFeed:
+    """Incident feed within one process, with a ring buffer of recent events for replay"""
+
+    backend = MEMORY
+
+    def __init__(self, buffer_size: Optional[int] = None, history_size: Optional[int] = None):
+        self.buffer_size = buffer_size or FEED_BUFFER_SIZE
+        self.history_size = history_size or FEED_HISTORY_SIZE
+        self._inbox: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._subscriptions: Set[Subscription] = set()
+        # Service type (None for subscribers of every type) -> subscriptions
+        self._by_type: Dict[Optional[str], Set[Subscription]] = {}
+        self._history = collections.deque(maxlen=self.history_size)
+        # Sequence number of the last event fanned out
+        self._cursor: Optional[int] = 0
+        self._dispatcher: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    def publish(self, event_type: str, incident_id: str, service_type: Any = None, severity: Any = None,
+                coordinates: Optional[Tuple[float, float]] = None, **changes):
+        """Queue an event for the subscribers; never blocks. See incident_event for the arguments."""
+        self._inbox.put(incident_event(event_type, incident_id, service_type, severity, coordinates, changes))
+        FEED_EVENTS.inc(type=event_type)
+        self._start()
+
+    def publish_alert(self, response: Dict, coordinates: Optional[Tuple[float, float]] = None):
+        """A new incident alerted by alert_emergency_services"""
+        self.publish(
+            CREATED, response["alert_id"], response.get("service_alerted"), response.get("severity_reported"),
+            coordinates, status="open", alert_time=response.get("alert_time"),
+            estimated_response_time=response.get("estimated_response_time"), reports=1
+        )
+
+    def publish_attached(self, incident, severity: Any = None):
+        """Another report attached to an open incident (an ActiveIncident)"""
+        self.publish(UPDATED, incident.incident_id, incident.service_type, severity,
+                     (incident.latitude, incident.longitude), reports=incident.reports)
+
+    def publish_report(self, report: Dict, coordinates: Optional[Tuple[float, float]] = None):
+        """
+        A report from generate_report: an update to the incident it was
+        alerted as, or a new incident if no alert was sent
+        """
+        report = _to_jsonable(report)
+        details = report.get("emergency_details") or {}
+        location = details.get("location") or {}
+        if coordinates is None:
+            coordinates = parse_coordinates(location.get("coordinates"))
+        summary = {"report_id": report["report_id"], "status": report.get("status")}
+        summary.update({field: details[field] for field in REPORT_FIELDS if details.get(field) not in (None, "", [])})
+        if location.get("address"):
+            summary["address"] = location["address"]
+
+        alert_id = (report.get("response_details") or {}).get("alert_id")
+        if alert_id:
+            self.publish(UPDATED, alert_id, details.get("emergency_type"), details.get("severity"), coordinates,
+                         report=summary)
+        else:
+            self.publish(CREATED, report["report_id"], details.get("emergency_type"), details.get("severity"),
+                         coordinates, status=report.get("status", "open"), report=summary)
+
+    def publish_status(self, incident: Dict):
+        """A status change to a stored incident, as returned by IncidentStore.get"""
+        coordinates = None
+        if incident.get("latitude") is not None and incident.get("longitude") is not None:
+            coordinates = (incident["latitude"], incident["longitude"])
+        self.publish(UPDATED, incident.get("alert_id") or incident["incident_id"], incident.get("service_type"),
+                     incident.get("severity"), coordinates, status=incident["status"])
+
+    def subscribe(self, feed_filter: Optional[FeedFilter] = None, last_event_id: Optional[int] = None,
+                  loop: Optional[asyncio.AbstractEventLoop] = None) -> Subscription:
+        """
+        Register a subscriber
+
+        Args:
+            feed_filter (FeedFilter, optional): Events to receive; all by default
+            last_event_id (int, optional): Replay the matching events after this sequence number
+            loop (AbstractEventLoop, optional): Event loop of an asyncio subscriber, which reads with aget
+
+        Returns:
+            Subscription: Pass to unsubscribe when the subscriber disconnects
+        """
+        subscription = Subscription(feed_filter or FeedFilter(), self.buffer_size, loop)
+        self._start()
+        with self._lock:
+            self._add(subscription)
+            cursor = self._current_cursor()
+            # A sequence number from before a restart of the in-process feed is ignored
+            if last_event_id is not None and last_event_id <= cursor:
+                subscription.last_seq = last_event_id
+                missed = self._events_between(last_event_id, cursor)
+                first = missed[0]["seq"] if missed else cursor + 1
+                # Events older than the history cannot be replayed
+                subscription.dropped += first - last_event_id - 1
+                for event in missed:
+                    if subscription.filter.matches(event):
+                        subscription._push(event)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            self._remove(subscription)
+
+    def update_filter(self, subscription: Subscription, feed_filter: FeedFilter):
+        """Change what an existing subscriber receives"""
+        with self._lock:
+            self._remove(subscription)
+            subscription.filter = feed_filter
+            self._add(subscription)
+
+    def _add(self, subscription: Subscription):
+        self._subscriptions.add(subscription)
+        for key in subscription.filter.index_keys():
+            self._by_type.setdefault(key, set()).add(subscription)
+
+    def _remove(self, subscription: Subscription):
+        if subscription not in self._subscriptions:
+            return
+        self._subscriptions.discard(subscription)
+        for key in subscription.filter.index_keys():
+            group = self._by_type.get(key)
+            if group is not None:
+                group.discard(subscription)
+                if not group:
+                    del self._by_type[key]
+
+    def _current_cursor(self) -> int:
+        return self._cursor
+
+    def _events_between(self, after: int, until: int) -> List[Dict]:
+        return [event for event in self._history if after < event["seq"] <= until]
+
+    def _start(self):
+        if self._dispatcher is None:
+            with self._start_lock:
+                if self._dispatcher is None:
+                    self._dispatcher = threading.Thread(target=self._dispatch_loop, name="incident-feed", daemon=True)
+                    self._dispatcher.start()
+
+    def _dispatch_loop(self):
+        while True:
+            try:
+                events = self._next_events()
+                if events:
+                    self._fan_out(events)
+            except Exception as e:
+                logger.error("Error dispatching incident events: %s", e)
+                time.sleep(FEED_POLL_SECONDS)
+
+    def _take_inbox(self, timeout: Optional[float]) -> List[Dict]:
+        """Wait for a published event, then take whatever else is queued"""
+        try:
+            events = [self._inbox.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while len(events) < DISPATCH_BATCH:
+            try:
+                events.append(self._inbox.get_nowait())
+            except queue.Empty:
+                break
+        return events
+
+    def _next_events(self) -> List[Dict]:
+        events = []
+        pending = self._take_inbox(None)
+        with self._lock:
+            for event in pending:
+                self._cursor += 1
+                event = {"seq": self._cursor, **event}
+                self._history.append(event)
+                events.append(event)
+        return events
+
+    def _fan_out(self, events: List[Dict]):
+        wake: Dict[asyncio.AbstractEventLoop, Set[Subscription]] = {}
+        with self._lock:
+            for event in events:
+                groups = [self._by_type.get(None)]
+                if event["service_type"] is not None:
+                    groups.append(self._by_type.get(event["service_type"]))
+                for group in groups:
+                    for subscription in group or ():
+                        if subscription.filter.matches(event):
+                            subscription._push(event)
+                            if subscription.loop is not None:
+                                wake.setdefault(subscription.loop, set()).add(subscription)
+        # One wake-up per event loop rather than per subscriber
+        for loop, subscriptions in wake.items():
+            try:
+                loop.call_soon_threadsafe(_wake, subscriptions)
+            except RuntimeError:
+                # The loop has closed; its subscribers are gone
+                pass
+
+    def stats(self) -> Dict:
+        with self._lock:
+            subscribers = len(self._subscriptions)
+            lagging = sum(1 for s in self._subscriptions if len(s) >= self.buffer_size // 2)
+            cursor = self._cursor
+        return {
+            "backend": self.backend,
+            "subscribers": subscribers,
+            # Subscribers with their buffer at least half full
+            "lagging_subscribers": lagging,
+            "buffer_size": self.buffer_size,
+            "last_event_id": cursor,
+            "dropped_events": int(FEED_DROPPED.value()),
+        }
+
+
+class SharedIncidentFeed(IncidentFeed):
+    """
+    IncidentFeed through the shared SQLite database. Published events are
+    inserted by the dispatcher thread, off the request path, and each worker
+    polls for new rows while it has subscribers; the row ID is the event's
+    sequence number across all workers.
+    """
+
+    backend = SQLITE
+    PRUNE_INTERVAL = 60
+
+    def __init__(self, database: Optional[SharedDatabase] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.database = database or get_shared_database()
+        self.database.ensure_schema("incident_feed", FEED_SCHEMA)
+        # None while nobody is subscribed in this process
+        self._cursor = None
+        self._last_prune = 0.0
+
+    def _current_cursor(self) -> int:
+        if self._cursor is None:
+            row = self.database.connection().execute("SELECT MAX(seq) FROM feed_events").fetchone()
+            self._cursor = row[0] or 0
+        return self._cursor
+
+    def _events_between(self, after: int, until: int) -> List[Dict]:
+        rows = self.database.connection().execute(
+            "SELECT seq, event FROM feed_events WHERE seq > ? AND seq <= ? ORDER BY seq DESC LIMIT ?",
+            (after, until, self.history_size)
+        ).fetchall()
+        return [self._row_to_event(row) for row in reversed(rows)]
+
+    @staticmethod
+    def _row_to_event(row) -> Dict:
+        return {"seq": row["seq"], **json.loads(row["event"])}
+
+    def _next_events(self) -> List[Dict]:
+        pending = self._take_inbox(FEED_POLL_SECONDS)
+        connection = self.database.connection()
+        now = time.time()
+        if pending:
+            connection.executemany(
+                "INSERT INTO feed_events (created_at, event) VALUES (?, ?)",
+                [(now, json.dumps(event, default=str)) for event in pending]
+            )
+        if now - self._last_prune >= self.PRUNE_INTERVAL:
+            self._last_prune = now
+            connection.execute("DELETE FROM feed_events WHERE created_at < ?", (now - FEED_RETENTION_SECONDS,))
+
+        with self._lock:
+            if not self._subscriptions:
+                self._cursor = None
+                return []
+            cursor = self._cursor
+        rows = connection.execute(
+            "SELECT seq, event FROM feed_events WHERE seq > ? ORDER BY seq LIMIT ?", (cursor, DISPATCH_BATCH)
+        ).fetchall()
+        events = [self._row_to_event(row) for row in rows]
+        if events:
+            with self._lock:
+                self._cursor = max(self._cursor or 0, events[-1]["seq"])
+        return events
+
+
+def create_incident_feed() -> IncidentFeed:
+    """Incident feed for the configured STATE_BACKEND"""
+    if state_backend() == SQLITE:
+        return SharedIncidentFeed()
+    return IncidentFeed()
+
+
+_feed = None
+_feed_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    """A forked worker starts its own dispatcher thread and subscriber registry"""
+    global _feed, _feed_lock
+    _feed = None
+    _feed_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_incident_feed() -> IncidentFeed:
+    """Return the process-wide incident feed, created on first use"""
+    global _feed
+    if _feed is None:
+        with _feed_lock:
+            if _feed is None:
+                _feed = create_incident_feed()
+    return _feed
@@ -0,0 +1,360 @@
+import atexit
+import datetime
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, Iterator, Optional, Sequence, Tuple
+from pydantic import BaseModel
+
+# Persistent store for incident reports.
+# SQLite in WAL mode, so dispatcher reads never block the writer. Writes are
+# queued and committed in batches by a background thread, keeping disk I/O
+# off the request thread. Listing uses keyset pagination on
+# (created_at, incident_id), which stays fast however deep the page.
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS incidents (
+    incident_id TEXT PRIMARY KEY,
+    alert_id TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    service_type TEXT,
+    severity TEXT,
+    status TEXT,
+    latitude REAL,
+    longitude REAL,
+    address TEXT,
+    report TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_incidents_created_at ON incidents (created_at, incident_id);
+CREATE INDEX IF NOT EXISTS idx_incidents_service_type ON incidents (service_type, created_at);
+CREATE INDEX IF NOT EXISTS idx_incidents_severity ON incidents (severity, created_at);
+CREATE INDEX IF NOT EXISTS idx_incidents_status ON incidents (status, created_at);
+CREATE INDEX IF NOT EXISTS idx_incidents_location ON incidents (latitude, longitude);
+CREATE INDEX IF NOT EXISTS idx_incidents_alert_id ON incidents (alert_id);
+CREATE INDEX IF NOT EXISTS idx_incidents_updated_at ON incidents (updated_at, incident_id);
+"""
+
+COLUMNS = (
+    "incident_id", "alert_id", "created_at", "updated_at", "service_type", "severity",
+    "status", "latitude", "longitude", "address", "report"
+)
+
+UPSERT = """
+INSERT INTO incidents (
+    incident_id, alert_id, created_at, updated_at, service_type, severity,
+    status, latitude, longitude, address, report
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (incident_id) DO UPDATE SET
+    alert_id = excluded.alert_id,
+    updated_at = excluded.updated_at,
+    service_type = excluded.service_type,
+    severity = excluded.severity,
+    status = excluded.status,
+    latitude = excluded.latitude,
+    longitude = excluded.longitude,
+    address = excluded.address,
+    report = excluded.report
+"""
+
+
+def new_incident_id(prefix: str) -> str:
+    """
+    Collision-free, time-ordered identifier, e.g. RPT-20250812070000-3f2a9c1b0d4e
+
+    Args:
+        prefix (str): Identifier prefix such as "EM" or "RPT"
+
+    Returns:
+        str: Identifier unique across requests, threads and processes
+    """
+    return f"{prefix}-{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:12]}"
+
+
+def _to_jsonable(value: Any) -> Any:
+    # Plain values and containers first: the BaseModel check goes through
+    # pydantic's metaclass and costs several times more
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    if isinstance(value, dict):
+        return {k: _to_jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_jsonable(v) for v in value]
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    return value
+
+
+def parse_coordinates(value: Any) -> Optional[Tuple[float, float]]:
+    """Parse a "lat, lon" string into floats, or None"""
+    if not isinstance(value, str):
+        return None
+    parts = value.replace(";", ",").split(",")
+    if len(parts) != 2:
+        return None
+    try:
+        return float(parts[0]), float(parts[1])
+    except ValueError:
+        return None
+
+
+def incident_record(report: Any, coordinates: Optional[Tuple[float, float]] = None,
+                    now: Optional[float] = None) -> Dict:
+    """
+    Stored columns of a report from generate_report
+
+    Args:
+        report: Report with report_id, emergency_details and response_details, as a dict or ReportResponse
+        coordinates (Tuple[float, float], optional): Caller's GPS location
+        now (float, optional): created_at and updated_at, as a UNIX timestamp
+
+    Returns:
+        Dict: One value per name in COLUMNS; report as a JSON-ready dict
+    """
+    report = _to_jsonable(report)
+    details = report.get("emergency_details") or {}
+    response_details = report.get("response_details") or {}
+    location = details.get("location") or {}
+    if coordinates is None:
+        coordinates = parse_coordinates(location.get("coordinates"))
+    now = now if now is not None else time.time()
+    return {
+        "incident_id": report["report_id"],
+        "alert_id": response_details.get("alert_id"),
+        "created_at": now,
+        "updated_at": now,
+        "service_type": details.get("emergency_type"),
+        "severity": details.get("severity"),
+        "status": report.get("status", "open"),
+        "latitude": coordinates[0] if coordinates else None,
+        "longitude": coordinates[1] if coordinates else None,
+        "address": location.get("address"),
+        "report": report,
+    }
+
+
+class IncidentStore:
+    """SQLite-backed incident store with batched background writes"""
+
+    def __init__(self, path: Optional[str] = None, batch_size: int = 200, flush_interval: float = 0.05):
+        self.path = path or os.getenv("INCIDENT_DB_PATH", "incidents.db")
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._local = threading.local()
+        self._queue: "queue.Queue" = queue.Queue()
+
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(SCHEMA)
+        connection.commit()
+
+        self._writer = threading.Thread(target=self._write_loop, name="incident-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.flush)
+
+    def _connection(self) -> sqlite3.Connection:
+        """Per-thread connection; SQLite connections cannot be shared across threads"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def record_report(self, report: Dict, coordinates: Optional[Tuple[float, float]] = None):
+        """
+        Queue a report from generate_report for storage
+
+        Args:
+            report (Dict): Report with report_id, emergency_details and response_details
+            coordinates (Tuple[float, float], optional): Caller's GPS location
+        """
+        record = incident_record(report, coordinates)
+        record["report"] = json.dumps(record["report"])
+        self._queue.put(tuple(record[column] for column in COLUMNS))
+
+    def _write_loop(self):
+        while True:
+            rows = [self._queue.get()]
+            # Collect whatever else arrives shortly after, then commit once
+            deadline = time.monotonic() + self.flush_interval
+            while len(rows) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    rows.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                connection = self._connection()
+                with connection:
+                    connection.executemany(UPSERT, rows)
+            except Exception as e:
+                logger.error("Error writing incidents: %s", e)
+            finally:
+                for _ in rows:
+                    self._queue.task_done()
+
+    def flush(self):
+        """Block until every queued write has been committed"""
+        self._queue.join()
+
+    def update_status(self, incident_id: str, status: str) -> bool:
+        """Set an incident's status, e.g. "open" or "closed"; see get for the IDs accepted"""
+        self.flush()
+        connection = self._connection()
+        with connection:
+            resolved = self._resolve(connection, incident_id)
+            if resolved is None:
+                return False
+            cursor = connection.execute(
+                "UPDATE incidents SET status = ?, updated_at = ? WHERE incident_id = ?",
+                (status, time.time(), resolved)
+            )
+        return cursor.rowcount > 0
+
+    def get(self, incident_id: str) -> Optional[Dict]:
+        """
+        Fetch an incident by report ID, or by alert ID. Reports attached to an
+        incident share its alert ID; an alert ID resolves to the first report,
+        the one that raised the alert.
+        """
+        connection = self._connection()
+        resolved = self._resolve(connection, incident_id)
+        if resolved is None:
+            return None
+        row = connection.execute("SELECT * FROM incidents WHERE incident_id = ?", (resolved,)).fetchone()
+        return self._row_to_dict(row) if row else None
+
+    @staticmethod
+    def _resolve(connection: sqlite3.Connection, incident_id: str) -> Optional[str]:
+        """The report ID an incident or alert ID refers to"""
+        row = connection.execute("SELECT incident_id FROM incidents WHERE incident_id = ?", (incident_id,)).fetchone()
+        if row is None:
+            row = connection.execute(
+                "SELECT incident_id FROM incidents WHERE alert_id = ? ORDER BY created_at, incident_id LIMIT 1",
+                (incident_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def list(self, service_type: Optional[str] = None, severity: Optional[str] = None,
+             status: Optional[str] = None, since: Optional[float] = None, until: Optional[float] = None,
+             bbox: Optional[Tuple[float, float, float, float]] = None, limit: int = 50,
+             cursor: Optional[str] = None) -> Dict:
+        """
+        List incidents, newest first
+
+        Args:
+            service_type (str, optional): EmergencyServiceType value
+            severity (str, optional): Severity level
+            status (str, optional): Incident status
+            since (float, optional): Earliest created_at, as a UNIX timestamp
+            until (float, optional): Latest created_at, as a UNIX timestamp
+            bbox (Tuple, optional): (min_lat, min_lon, max_lat, max_lon)
+            limit (int): Page size
+            cursor (str, optional): next_cursor from the previous page
+
+        Returns:
+            Dict: {"incidents": [...], "next_cursor": str or None}
+        """
+        clauses, params = [], []
+        for column, value in (("service_type", service_type), ("severity", severity), ("status", status)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if since is not None:
+            clauses.append("created_at >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("created_at <= ?")
+            params.append(until)
+        if bbox is not None:
+            clauses.append("latitude BETWEEN ? AND ? AND longitude BETWEEN ? AND ?")
+            params.extend([bbox[0], bbox[2], bbox[1], bbox[3]])
+        if cursor:
+            created_at, incident_id = cursor.split("|", 1)
+            clauses.append("(created_at, incident_id) < (?, ?)")
+            params.extend([float(created_at), incident_id])
+
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._connection().execute(
+            f"SELECT * FROM incidents {where} ORDER BY created_at DESC, incident_id DESC LIMIT ?",
+            params + [limit + 1]
+        ).fetchall()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = f"{rows[-1]['created_at']!r}|{rows[-1]['incident_id']}"
+        return {"incidents": [self._row_to_dict(row) for row in rows], "next_cursor": next_cursor}
+
+    def iter_changed(self, since: Optional[float] = None, statuses: Optional[Sequence[str]] = None,
+                     page_size: int = 5000) -> Iterator[Dict]:
+        """
+        Incidents updated at or after since, oldest change first, for readers
+        that keep their own copy up to date
+
+        Args:
+            since (float, optional): Earliest updated_at, as a UNIX timestamp; None for all
+            statuses (Sequence[str], optional): Only incidents with one of these statuses
+            page_size (int): Rows read per query
+
+        Yields:
+            Dict: Stored columns, with UNIX timestamps and the report as JSON text
+        """
+        clauses, params = ["(updated_at, incident_id) > (?, ?)"], []
+        if statuses:
+            clauses.append(f"status IN ({', '.join('?' * len(statuses))})")
+            params.extend(statuses)
+        position = (since if since is not None else float("-inf"), "")
+        while True:
+            rows = self._connection().execute(
+                f"SELECT * FROM incidents WHERE {' AND '.join(clauses)} ORDER BY updated_at, incident_id LIMIT ?",
+                [*position, *params, page_size]
+            ).fetchall()
+            for row in rows:
+                yield dict(row)
+            if len(rows) < page_size:
+                return
+            position = (rows[-1]["updated_at"], rows[-1]["incident_id"])
+
+    @staticmethod
+    def _row_to_dict(row: sqlite3.Row) -> Dict:
+        incident = dict(row)
+        incident["report"] = json.loads(incident["report"])
+        for field in ("created_at", "updated_at"):
+            incident[field] = datetime.datetime.fromtimestamp(incident[field], datetime.timezone.utc).isoformat()
+        return incident
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    """A forked worker opens its own connections and writer thread instead of the parent's"""
+    global _store, _store_lock
+    _store = None
+    _store_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_incident_store() -> IncidentStore:
+    """Return the process-wide incident store, created on first use"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = IncidentStore()
+    return _store
@@ -0,0 +1,458 @@
+import datetime
+import json
+import os
+import threading
+import time
+import zlib
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+from services.incident_store import IncidentStore, get_incident_store, incident_record
+from services.metrics import registry, render_samples
+from services.tools import (
+    EmergencyServiceType, ExtractedEmergencyData, Location, PersonProfile, ReportResponse, ServiceInvokedResponse
+)
+
+# Columnar in-memory table of active incidents, for dashboards and matching
+# over large incident sets.
+# A report held as pydantic models or nested dicts costs kilobytes; here the
+# fields that are filtered on are numpy columns (service type, severity and
+# status as small integer codes, float32 coordinates, float64 timestamps),
+# repeated strings such as addresses are interned, and the rest of the
+# report is kept as one JSON blob, compressed against a preset dictionary of
+# the report's field names, that is only decoded for the rows returned. Filters by type, severity, status, time and bounding box
+# are vectorised over the columns; models are only built at the API edge.
+#
+# Removed rows are tombstoned and the columns compacted once a quarter of
+# them are dead. Coordinates are float32, about 1 m resolution.
+
+SEVERITIES = ("low", "medium", "high", "critical")
+ACTIVE_STATUSES = ("open", "attached")
+
+# Decimal places coordinates are rounded to on output, the float32 resolution
+COORDINATE_DECIMALS = 5
+
+NUMERIC_COLUMNS = {
+    "service_type": np.uint8,
+    "severity": np.uint8,
+    "status": np.uint16,
+    "latitude": np.float32,
+    "longitude": np.float32,
+    "created_at": np.float64,
+    "updated_at": np.float64,
+    "alive": np.bool_,
+}
+OBJECT_COLUMNS = ("incident_id", "alert_id", "address", "report")
+
+# Preset zlib dictionary: a report with every field empty. Each report
+# repeats these field names, which a blob of a few hundred bytes could not
+# otherwise compress away; it halves the blob size.
+REPORT_ZDICT = json.dumps({
+    "report_id": None,
+    "generated_at": None,
+    "emergency_details": ExtractedEmergencyData(
+        emergency_type=EmergencyServiceType.OTHER, person_profile=PersonProfile(), location=Location()
+    ).model_dump(mode="json"),
+    "response_details": ServiceInvokedResponse(alert_sent=True).model_dump(mode="json"),
+    "status": "open",
+}).encode("utf-8")
+
+
+def _as_list(value: Any) -> Optional[List]:
+    """A filter value as a list: None, one value, a comma-separated string or a sequence"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return [v.strip() for v in value.split(",") if v.strip()]
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return list(value)
+    return [value]
+
+
+class Categories:
+    """Interned string values with small integer codes; code 0 is None"""
+
+    def __init__(self, values: Iterable[str] = (), dtype=np.uint8):
+        self.dtype = dtype
+        self.max_code = np.iinfo(dtype).max
+        self.values: List[Optional[str]] = [None]
+        self._codes: Dict[Optional[str], int] = {None: 0}
+        for value in values:
+            self.code(value)
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def code(self, value: Any) -> int:
+        """Code of a value, assigning the next one to a value not seen before"""
+        if value is not None:
+            value = str(getattr(value, "value", value))
+        code = self._codes.get(value)
+        if code is None:
+            code = len(self.values)
+            if code > self.max_code:
+                raise ValueError(f"More than {self.max_code} distinct values")
+            self._codes[value] = code
+            self.values.append(value)
+        return code
+
+    def codes_for(self, values: List) -> np.ndarray:
+        """Codes of the values that have one; unknown values match no rows"""
+        codes = [self._codes.get(str(getattr(v, "value", v))) for v in values]
+        return np.array([c for c in codes if c is not None], dtype=self.dtype)
+
+
+class IncidentTable:
+    """Columnar table of incidents keyed by incident ID"""
+
+    def __init__(self, capacity: int = 1024, compress: bool = True):
+        self.compress = compress
+        self._capacity = capacity
+        # Rows in use, including removed ones not yet compacted
+        self._size = 0
+        self._removed = 0
+        self._columns: Dict[str, np.ndarray] = {name: np.zeros(capacity, dtype) for name, dtype in NUMERIC_COLUMNS.items()}
+        self._columns.update({name: np.empty(capacity, dtype=object) for name in OBJECT_COLUMNS})
+        self._rows: Dict[str, int] = {}
+        self._strings: Dict[str, str] = {}
+        self._report_bytes = 0
+        self.service_types = Categories(t.value for t in EmergencyServiceType)
+        self.severities = Categories(SEVERITIES)
+        self.statuses = Categories(ACTIVE_STATUSES + ("closed",), np.uint16)
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, incident_id: str) -> bool:
+        return incident_id in self._rows
+
+    def _intern(self, value: Optional[str]) -> Optional[str]:
+        if value is None:
+            return None
+        return self._strings.setdefault(value, value)
+
+    def _encode_report(self, report: Any) -> bytes:
+        # Formatted like the incident store's JSON, which the dictionary matches
+        data = (report if isinstance(report, str) else json.dumps(report)).encode("utf-8")
+        if not self.compress:
+            return data
+        compressor = zlib.compressobj(6, zdict=REPORT_ZDICT)
+        return compressor.compress(data) + compressor.flush()
+
+    def _decode_report(self, blob: bytes) -> Dict:
+        if self.compress:
+            blob = zlib.decompressobj(zdict=REPORT_ZDICT).decompress(blob)
+        return json.loads(blob)
+
+    def _grow(self):
+        self._capacity *= 2
+        for name, column in self._columns.items():
+            grown = np.zeros(self._capacity, column.dtype) if column.dtype != object else np.empty(self._capacity, dtype=object)
+            grown[:self._size] = column[:self._size]
+            self._columns[name] = grown
+
+    def upsert(self, record: Dict) -> int:
+        """
+        Insert or update an incident
+
+        Args:
+            record (Dict): Columns as from incident_record or IncidentStore.iter_changed;
+                the report may be a dict or JSON text
+
+        Returns:
+            int: The incident's row
+        """
+        with self._lock:
+            columns = self._columns
+            row = self._rows.get(record["incident_id"])
+            if row is not None and columns["updated_at"][row] == record["updated_at"]:
+                return row
+            if row is None:
+                if self._size == self._capacity:
+                    self._grow()
+                row = self._size
+                self._size += 1
+                self._rows[record["incident_id"]] = row
+                columns["incident_id"][row] = record["incident_id"]
+            else:
+                self._report_bytes -= len(columns["report"][row])
+
+            columns["alert_id"][row] = record.get("alert_id")
+            columns["service_type"][row] = self.service_types.code(record.get("service_type"))
+            columns["severity"][row] = self.severities.code(record.get("severity"))
+            columns["status"][row] = self.statuses.code(record.get("status"))
+            latitude, longitude = record.get("latitude"), record.get("longitude")
+            columns["latitude"][row] = np.nan if latitude is None else latitude
+            columns["longitude"][row] = np.nan if longitude is None else longitude
+            columns["created_at"][row] = record["created_at"]
+            columns["updated_at"][row] = record["updated_at"]
+            columns["address"][row] = self._intern(record.get("address"))
+            blob = self._encode_report(record["report"])
+            columns["report"][row] = blob
+            self._report_bytes += len(blob)
+            columns["alive"][row] = True
+            return row
+
+    def add_report(self, report: Any, coordinates: Optional[Tuple[float, float]] = None,
+                   now: Optional[float] = None) -> int:
+        """Add a report from generate_report, as a ReportResponse or dict"""
+        return self.upsert(incident_record(report, coordinates, now))
+
+    def remove(self, incident_id: str) -> bool:
+        with self._lock:
+            row = self._rows.pop(incident_id, None)
+            if row is None:
+                return False
+            self._columns["alive"][row] = False
+            self._report_bytes -= len(self._columns["report"][row])
+            for name in OBJECT_COLUMNS:
+                self._columns[name][row] = None
+            self._removed += 1
+            if self._removed > max(1024, self._size // 4):
+                self._compact()
+            return True
+
+    def _compact(self):
+        """Drop removed rows; caller holds the lock"""
+        keep = np.flatnonzero(self._columns["alive"][:self._size])
+        self._capacity = max(1024, len(keep) * 2)
+        for name, column in self._columns.items():
+            compacted = np.zeros(self._capacity, column.dtype) if column.dtype != object else np.empty(self._capacity, dtype=object)
+            compacted[:len(keep)] = column[keep]
+            self._columns[name] = compacted
+        self._size = len(keep)
+        self._removed = 0
+        self._rows = {incident_id: row for row, incident_id in enumerate(self._columns["incident_id"][:self._size])}
+        self._strings = {address: address for address in self._columns["address"][:self._size] if address is not None}
+
+    def select(self, service_type: Any = None, severity: Any = None, status: Any = None,
+               since: Optional[float] = None, until: Optional[float] = None,
+               bbox: Optional[Tuple[float, float, float, float]] = None) -> np.ndarray:
+        """
+        Rows matching every given filter
+
+        Args:
+            service_type, severity, status: One value, a comma-separated string or a list
+            since (float, optional): Earliest created_at, as a UNIX timestamp
+            until (float, optional): Latest created_at, as a UNIX timestamp
+            bbox (Tuple, optional): (min_lat, min_lon, max_lat, max_lon)
+
+        Returns:
+            np.ndarray: Row numbers, for counts and to_dicts. They are only
+            valid while the table is unchanged; query keeps all three under
+            one lock.
+        """
+        with self._lock:
+            n = self._size
+            columns = self._columns
+            mask = columns["alive"][:n].copy()
+            for name, categories, value in (("service_type", self.service_types, service_type),
+                                            ("severity", self.severities, severity),
+                                            ("status", self.statuses, status)):
+                values = _as_list(value)
+                if values is not None:
+                    codes = categories.codes_for(values)
+                    column = columns[name][:n]
+                    mask &= column == codes[0] if len(codes) == 1 else np.isin(column, codes)
+            created_at = columns["created_at"][:n]
+            if since is not None:
+                mask &= created_at >= since
+            if until is not None:
+                mask &= created_at <= until
+            if bbox is not None:
+                # Comparisons with NaN are false, so incidents without a location drop out
+                latitude, longitude = columns["latitude"][:n], columns["longitude"][:n]
+                mask &= (latitude >= bbox[0]) & (latitude <= bbox[2]) & (longitude >= bbox[1]) & (longitude <= bbox[3])
+            return np.flatnonzero(mask)
+
+    def query(self, limit: Optional[int] = None, **filters) -> Dict:
+        """
+        Select, count and list matching incidents as one consistent snapshot.
+        Row numbers go stale once the lock is released, since another
+        request's refresh can remove rows or compact the columns.
+
+        Args:
+            limit (int, optional): Most incidents to list, newest first
+            **filters: Filters of select
+
+        Returns:
+            Dict: "total" matches, "counts" per service type and severity, and "incidents"
+        """
+        with self._lock:
+            rows = self.select(**filters)
+            return {"total": len(rows), "counts": self.counts(rows), "incidents": self.to_dicts(rows, limit)}
+
+    def _live(self, rows: np.ndarray) -> np.ndarray:
+        """rows without any removed since they were selected; caller holds the lock"""
+        rows = rows[rows < self._size]
+        return rows[self._columns["alive"][rows]]
+
+    def counts(self, rows: Optional[np.ndarray] = None) -> Dict[str, Dict[str, int]]:
+        """Incidents per service type and severity, for dashboards"""
+        with self._lock:
+            if rows is None:
+                rows = np.flatnonzero(self._columns["alive"][:self._size])
+            else:
+                rows = self._live(rows)
+            width = len(self.severities)
+            combined = self._columns["service_type"][rows].astype(np.int64) * width + self._columns["severity"][rows]
+            totals = np.bincount(combined, minlength=len(self.service_types) * width)
+        result: Dict[str, Dict[str, int]] = {}
+        for index in np.flatnonzero(totals):
+            service_type, severity = divmod(int(index), width)
+            result.setdefault(self.service_types.values[service_type] or "unknown", {})[
+                self.severities.values[severity] or "unknown"] = int(totals[index])
+        return result
+
+    def to_dicts(self, rows: np.ndarray, limit: Optional[int] = None) -> List[Dict]:
+        """Rows as incident dicts, in the format of IncidentStore.get, newest first"""
+        with self._lock:
+            rows = self._live(rows)
+            created_at = self._columns["created_at"][rows]
+            if limit is not None and len(rows) > limit:
+                if limit <= 0:
+                    return []
+                top = np.argpartition(-created_at, limit - 1)[:limit]
+                rows, created_at = rows[top], created_at[top]
+            rows = rows[np.argsort(-created_at, kind="stable")]
+            return [self._row_to_dict(int(row)) for row in rows]
+
+    def _row_to_dict(self, row: int) -> Dict:
+        columns = self._columns
+        incident = {
+            "incident_id": columns["incident_id"][row],
+            "alert_id": columns["alert_id"][row],
+        }
+        for field in ("created_at", "updated_at"):
+            incident[field] = datetime.datetime.fromtimestamp(float(columns[field][row]), datetime.timezone.utc).isoformat()
+        incident["service_type"] = self.service_types.values[columns["service_type"][row]]
+        incident["severity"] = self.severities.values[columns["severity"][row]]
+        incident["status"] = self.statuses.values[columns["status"][row]]
+        for field in ("latitude", "longitude"):
+            value = float(columns[field][row])
+            incident[field] = None if np.isnan(value) else round(value, COORDINATE_DECIMALS)
+        incident["address"] = columns["address"][row]
+        incident["report"] = self._decode_report(columns["report"][row])
+        return incident
+
+    def get(self, incident_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._rows.get(incident_id)
+            return self._row_to_dict(row) if row is not None else None
+
+    def report(self, incident_id: str) -> Optional[ReportResponse]:
+        """The incident's report as a ReportResponse"""
+        incident = self.get(incident_id)
+        return ReportResponse.model_validate(incident["report"]) if incident else None
+
+    def emergency_data(self, incident_id: str) -> Optional[ExtractedEmergencyData]:
+        """The incident's extracted emergency data as an ExtractedEmergencyData"""
+        incident = self.get(incident_id)
+        if not incident or not incident["report"].get("emergency_details"):
+            return None
+        return ExtractedEmergencyData.model_validate(incident["report"]["emergency_details"])
+
+    def stats(self) -> Dict:
+        with self._lock:
+            column_bytes = sum(column.nbytes for column in self._columns.values())
+            return {
+                "rows": len(self._rows),
+                "removed_rows": self._removed,
+                "capacity": self._capacity,
+                "column_bytes": column_bytes,
+                "report_bytes": self._report_bytes,
+            }
+
+
+class ActiveIncidentTable(IncidentTable):
+    """
+    IncidentTable of the open incidents in the incident store. Reads call
+    refresh, which applies what changed in the store since the last one, so
+    incidents written by any worker process appear within
+    ACTIVE_TABLE_REFRESH_SECONDS.
+    """
+
+    # Reports are committed in batches, so a change can land with an
+    # updated_at slightly older than one already read
+    REFRESH_OVERLAP_SECONDS = 2.0
+
+    def __init__(self, store: Optional[IncidentStore] = None, refresh_interval: Optional[float] = None,
+                 statuses: Sequence[str] = ACTIVE_STATUSES, **kwargs):
+        super().__init__(**kwargs)
+        self.store = store or get_incident_store()
+        self.refresh_interval = refresh_interval if refresh_interval is not None else float(
+            os.getenv("ACTIVE_TABLE_REFRESH_SECONDS", "1"))
+        self.active_statuses = tuple(statuses)
+        self._watermark: Optional[float] = None
+        self._last_refresh = float("-inf")
+        self._refresh_lock = threading.Lock()
+
+    def refresh(self, force: bool = False) -> int:
+        """
+        Apply changes from the incident store, at most once per refresh interval
+
+        Returns:
+            int: Changes read from the store
+        """
+        if not force and time.monotonic() - self._last_refresh < self.refresh_interval:
+            return 0
+        with self._refresh_lock:
+            if not force and time.monotonic() - self._last_refresh < self.refresh_interval:
+                return 0
+            changes = 0
+            if self._watermark is None:
+                # First load: only incidents that are still active
+                records = self.store.iter_changed(statuses=self.active_statuses)
+            else:
+                records = self.store.iter_changed(since=self._watermark - self.REFRESH_OVERLAP_SECONDS)
+            for record in records:
+                changes += 1
+                self._watermark = max(self._watermark or record["updated_at"], record["updated_at"])
+                if record["status"] in self.active_statuses:
+                    self.upsert(record)
+                else:
+                    self.remove(record["incident_id"])
+            if self._watermark is None:
+                self._watermark = time.time()
+            self._last_refresh = time.monotonic()
+            return changes
+
+
+_table = None
+_table_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    """A forked worker builds its own table rather than sharing the parent's lock"""
+    global _table, _table_lock
+    _table = None
+    _table_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _collect_table_metrics():
+    if _table is None:
+        return []
+    stats = _table.stats()
+    return render_samples(
+        "emergency_incident_table_rows", "Active incidents in the in-memory incident table", "gauge",
+        [({}, stats["rows"])]
+    ) + render_samples(
+        "emergency_incident_table_bytes", "Memory held by the incident table's columns and report blobs", "gauge",
+        [({}, stats["column_bytes"] + stats["report_bytes"])]
+    )
+
+
+registry.register_collector(_collect_table_metrics)
+
+
+def get_active_incident_table() -> ActiveIncidentTable:
+    """Return the process-wide active-incident table, created on first use"""
+    global _table
+    if _table is None:
+        with _table_lock:
+            if _table is None:
+                _table = ActiveIncidentTable()
+    return _table
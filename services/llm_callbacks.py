@@ -0,0 +1,51 @@
+import time
+from typing import Dict
+from langchain_core.callbacks import BaseCallbackHandler
+from services.metrics import LLM_ERRORS, record_llm_usage
+from services.resilience import get_breaker, failure_reason
+
+# LangChain callbacks for the agent and the hybrid wording LLM. Kept apart
+# from services.metrics so that langchain_core is only imported once an
+# LLM-backed path is first used (see get_metrics_callback).
+
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """
+    Records per-turn latency and token usage of the agent's chat model, and
+    feeds each turn's outcome to the model's circuit breaker
+    """
+
+    def __init__(self):
+        self._started: Dict = {}
+
+    def _start(self, run_id, kwargs):
+        params = kwargs.get("invocation_params") or {}
+        model = params.get("model_name") or params.get("model") or (kwargs.get("metadata") or {}).get("ls_model_name")
+        self._started[run_id] = (time.perf_counter(), model or "unknown")
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._start(run_id, kwargs)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._start(run_id, kwargs)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        started = self._started.pop(run_id, None)
+        if started is None:
+            return
+        get_breaker(started[1]).record_success()
+        llm_output = response.llm_output or {}
+        usage = llm_output.get("token_usage") or {}
+        record_llm_usage(
+            llm_output.get("model_name") or started[1],
+            time.perf_counter() - started[0],
+            usage.get("prompt_tokens", 0) or 0,
+            usage.get("completion_tokens", 0) or 0
+        )
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        started = self._started.pop(run_id, None)
+        model = started[1] if started else "unknown"
+        LLM_ERRORS.inc(model=model)
+        if failure_reason(error) is not None:
+            get_breaker(model).record_failure()
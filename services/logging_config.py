@@ -0,0 +1,176 @@
+import atexit
+import datetime
+import enum
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import threading
+from typing import Any, Optional
+
+# Structured, non-blocking logging.
+# Request threads only put records on an in-memory queue; a listener thread
+# formats them as JSON lines and does the actual I/O. Profile data and
+# secrets are redacted, and full payloads (queries, OpenAI responses, agent
+# outputs) are only logged at DEBUG for a sampled fraction of requests and
+# truncated, so they cannot flood the log or leak PII.
+
+REDACTED = "[REDACTED]"
+
+# Keys whose values are never logged, matched case-insensitively
+REDACT_KEYS = {
+    "profile_data", "fname", "sname", "bloodtype", "knownmedicalissues", "person_profile",
+    "api_key", "openai_api_key", "open_ai_key", "authorization", "password", "secret", "token",
+}
+
+SECRET_PATTERN = re.compile(r"\b(sk-[A-Za-z0-9_\-]{8,}|Bearer\s+[A-Za-z0-9_\-\.]{8,})")
+
+# Attributes every LogRecord has; anything else came from extra=
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+def redact(value: Any) -> Any:
+    """Copy of value with sensitive keys replaced and API keys masked"""
+    if isinstance(value, dict):
+        return {
+            k: REDACTED if str(k).lower() in REDACT_KEYS else redact(v)
+            for k, v in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [redact(v) for v in value]
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, str):
+        return SECRET_PATTERN.sub(REDACTED, value)
+    if hasattr(value, "model_dump"):
+        return redact(value.model_dump(mode="json"))
+    return value
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with the message, level and any extra fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": SECRET_PATTERN.sub(REDACTED, record.getMessage()),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = redact(value)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class _NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Drops records instead of blocking the request thread when the queue is full"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Formatting happens on the listener thread; only resolve the message
+        # here so later changes to the arguments cannot alter it
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_configure_lock = threading.Lock()
+
+
+def _start_listener(output: logging.Handler):
+    """Start a listener thread writing to output and point the root logger at its queue"""
+    global _listener
+    log_queue = queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", "10000")))
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    logging.getLogger().handlers = [_NonBlockingQueueHandler(log_queue)]
+
+
+def _restart_after_fork():
+    """
+    Threads do not survive fork, so a pre-forked worker would queue records
+    that nothing writes; give the child its own queue and listener thread
+    """
+    global _configure_lock
+    _configure_lock = threading.Lock()
+    if _listener is not None:
+        _start_listener(_listener.handlers[0])
+
+
+os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+def configure_logging(level: Optional[str] = None, stream=None):
+    """
+    Route logging through a background queue listener. Safe to call more
+    than once; only the first call installs handlers.
+
+    Args:
+        level (str, optional): Log level, defaults to LOG_LEVEL or INFO
+        stream (optional): Output stream, defaults to stderr
+    """
+    with _configure_lock:
+        if _listener is not None:
+            return
+        output = logging.StreamHandler(stream)
+        output.setFormatter(
+            JsonFormatter() if os.getenv("LOG_FORMAT", "json") == "json"
+            else logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+        )
+        _start_listener(output)
+        atexit.register(shutdown_logging)
+
+        root = logging.getLogger()
+        root.setLevel((level or os.getenv("LOG_LEVEL", "INFO")).upper())
+        # Per-request connection chatter from the HTTP clients
+        for noisy in ("httpx", "httpcore", "openai"):
+            logging.getLogger(noisy).setLevel(logging.WARNING)
+
+
+def shutdown_logging():
+    """Write out queued records and stop the listener thread"""
+    global _listener
+    with _configure_lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        _listener = None
+        logging.getLogger().handlers = []
+
+
+def log_payload(logger: logging.Logger, message: str, payload: Any, **fields):
+    """
+    Log a full payload at DEBUG for a sampled fraction of calls. The payload
+    is redacted and truncated before it leaves the calling thread.
+
+    Args:
+        logger (Logger): Logger to write to
+        message (str): Log message
+        payload: Request body, LLM response or agent output
+        **fields: Extra structured fields
+    """
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    if random.random() >= float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", "0.01")):
+        return
+    max_chars = int(os.getenv("LOG_PAYLOAD_MAX_CHARS", "2000"))
+    text = json.dumps(redact(payload), default=str)
+    if len(text) > max_chars:
+        text = text[:max_chars] + "...(truncated)"
+    logger.debug(message, extra={**fields, "payload": text})
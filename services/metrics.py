@@ -0,0 +1,254 @@
+import bisect
+import functools
+import inspect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Tuple
+
+# Lightweight in-process metrics with Prometheus text exposition.
+# Recording is a dict lookup and a few additions under a lock, cheap enough
+# for every request, agent step and tool call. Per-span histograms show
+# which tool or LLM call dominates tail latency.
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+
+# USD per million tokens (prompt, completion)
+MODEL_PRICES_PER_MILLION = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+}
+
+
+def _price_for(model: str) -> Tuple[float, float]:
+    # Dated snapshots such as gpt-4o-mini-2024-07-18 share their base model's price
+    for name in sorted(MODEL_PRICES_PER_MILLION, key=len, reverse=True):
+        if model.startswith(name):
+            return MODEL_PRICES_PER_MILLION[name]
+    return 0.0, 0.0
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{n}="{str(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(str(labels.get(n, "")) for n in self.labels), 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (), buckets: List[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def snapshot(self) -> Dict[Tuple[str, ...], Dict]:
+        """Count, sum and cumulative bucket counts per label set"""
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._values.items()]
+        result = {}
+        for key, series in items:
+            cumulative, counts = 0, []
+            for count in series[:-1]:
+                cumulative += count
+                counts.append(cumulative)
+            result[key] = {"buckets": counts, "count": cumulative, "sum": series[-1]}
+        return result
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for key, data in sorted(self.snapshot().items()):
+            for bound, count in zip(self.buckets + ["+Inf"], data["buckets"]):
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {data['sum']}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {data['count']}")
+        return lines
+
+
+def render_samples(name: str, help_text: str, metric_type: str, samples: List[Tuple[Dict, float]]) -> List[str]:
+    """Exposition lines for values read from elsewhere, e.g. cache or scheduler stats"""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+    for labels, value in samples:
+        lines.append(f"{name}{_format_labels(tuple(labels), tuple(labels.values()))} {value}")
+    return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors: List[Callable[[], List[str]]] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector: Callable[[], List[str]]):
+        """Add a function producing exposition lines at scrape time"""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            try:
+                lines.extend(collector())
+            except Exception as e:
+                logger.error("Error collecting metrics: %s", e)
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+REQUEST_DURATION = registry.register(Histogram(
+    "emergency_request_duration_seconds", "End-to-end query processing time", ("path",)
+))
+SPAN_DURATION = registry.register(Histogram(
+    "emergency_span_duration_seconds", "Time spent per agent step and tool call", ("span",)
+))
+LLM_DURATION = registry.register(Histogram(
+    "emergency_llm_request_duration_seconds", "LLM call latency", ("model",)
+))
+LLM_TOKENS = registry.register(Counter(
+    "emergency_llm_tokens_total", "LLM tokens used", ("model", "type")
+))
+LLM_COST = registry.register(Counter(
+    "emergency_llm_cost_usd_total", "Estimated LLM spend in USD", ("model",)
+))
+LLM_ERRORS = registry.register(Counter(
+    "emergency_llm_errors_total", "Failed LLM calls", ("model",)
+))
+LLM_FALLBACKS = registry.register(Counter(
+    "emergency_llm_fallbacks_total", "LLM attempts abandoned for the next model or local triage", ("model", "reason")
+))
+LLM_HEDGES = registry.register(Counter(
+    "emergency_llm_hedged_requests_total", "Hedged LLM calls by which attempt answered first", ("winner",)
+))
+FEED_EVENTS = registry.register(Counter(
+    "emergency_feed_events_total", "Incident events published to the dispatcher feed", ("type",)
+))
+FEED_DROPPED = registry.register(Counter(
+    "emergency_feed_dropped_events_total", "Feed events dropped because a subscriber's buffer was full"
+))
+PARSE_FAILURES = registry.register(Counter(
+    "emergency_parse_failures_total", "Agent outputs that could not be parsed as EmergencyResponse"
+))
+PARSE_REPAIRS = registry.register(Counter(
+    "emergency_parse_repairs_total", "Agent outputs parsed after local JSON repair"
+))
+
+
+def record_llm_usage(model: str, duration: float, prompt_tokens: int = 0, completion_tokens: int = 0):
+    """Record latency, token counts and estimated cost of one LLM call"""
+    LLM_DURATION.observe(duration, model=model)
+    SPAN_DURATION.observe(duration, span=f"llm:{model}")
+    if prompt_tokens:
+        LLM_TOKENS.inc(prompt_tokens, model=model, type="prompt")
+    if completion_tokens:
+        LLM_TOKENS.inc(completion_tokens, model=model, type="completion")
+    prompt_price, completion_price = _price_for(model)
+    cost = (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+    if cost:
+        LLM_COST.inc(cost, model=model)
+
+
+def record_openai_response(model: str, started: float, response):
+    """Record an OpenAI SDK chat completion, reading token usage from the response"""
+    usage = getattr(response, "usage", None)
+    record_llm_usage(
+        getattr(response, "model", None) or model,
+        time.perf_counter() - started,
+        getattr(usage, "prompt_tokens", 0) or 0,
+        getattr(usage, "completion_tokens", 0) or 0
+    )
+
+
+@contextmanager
+def span(name: str):
+    """Time a block into the span histogram"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        SPAN_DURATION.observe(time.perf_counter() - started, span=name)
+
+
+def traced(name: str):
+    """Decorator timing a sync or async function into the span histogram"""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+_metrics_callback = None
+_metrics_callback_lock = threading.Lock()
+
+
+def get_metrics_callback():
+    """
+    Shared LangChain callback handler recording agent LLM turns. Created on
+    first use so importing metrics does not import langchain_core.
+    """
+    global _metrics_callback
+    if _metrics_callback is None:
+        with _metrics_callback_lock:
+            if _metrics_callback is None:
+                from services.llm_callbacks import MetricsCallbackHandler
+                _metrics_callback = MetricsCallbackHandler()
+    return _metrics_callback
+
+
+def render_prometheus() -> str:
+    return registry.render()
@@ -0,0 +1,158 @@
+import os
+import threading
+from typing import TYPE_CHECKING, Optional
+import httpx
+
+if TYPE_CHECKING:
+    import openai
+
+# Shared OpenAI client factory.
+# The agent LLM and every tool go through the same pooled HTTP stack, so a
+# burst of calls reuses kept-alive TLS connections instead of paying for a
+# handshake each time. The pool limits double as backpressure: when every
+# connection is busy, callers wait up to OPENAI_POOL_TIMEOUT for a free one.
+#
+# Retries use the OpenAI SDK's exponential backoff with random jitter and
+# honour Retry-After headers on 429/5xx responses. Tool calls go through
+# services.resilience instead, which turns SDK retries off per call and
+# retries down its fallback chain within the request deadline.
+#
+# The openai and langchain_openai packages take most of a second to import,
+# so they are imported when the first client is built rather than with
+# this module.
+
+
+class OpenAIClientConfig:
+    """Connection pool, timeout and retry settings read from the environment"""
+
+    def __init__(self):
+        self.api_key = os.getenv("OPENAI_API_KEY")
+        self.base_url = os.getenv("OPENAI_BASE_URL") or None
+        self.max_connections = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+        self.max_keepalive_connections = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "20"))
+        self.keepalive_expiry = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "30"))
+        self.timeout = float(os.getenv("OPENAI_TIMEOUT", "30"))
+        self.connect_timeout = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5"))
+        self.pool_timeout = float(os.getenv("OPENAI_POOL_TIMEOUT", "10"))
+        self.max_retries = int(os.getenv("OPENAI_MAX_RETRIES", "3"))
+
+    def limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry
+        )
+
+    def timeouts(self, timeout: Optional[float] = None) -> httpx.Timeout:
+        return httpx.Timeout(
+            self.timeout if timeout is None else timeout,
+            connect=self.connect_timeout,
+            pool=self.pool_timeout
+        )
+
+
+_lock = threading.Lock()
+_config = None
+_http_client = None
+_async_http_client = None
+_client = None
+_async_client = None
+
+
+def get_config() -> OpenAIClientConfig:
+    """Return the client configuration, read once from the environment"""
+    global _config
+    if _config is None:
+        with _lock:
+            if _config is None:
+                _config = OpenAIClientConfig()
+    return _config
+
+
+def get_http_client() -> httpx.Client:
+    """Return the shared, pooled sync HTTP client"""
+    global _http_client
+    if _http_client is None:
+        config = get_config()
+        with _lock:
+            if _http_client is None:
+                _http_client = httpx.Client(limits=config.limits(), timeout=config.timeouts())
+    return _http_client
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """Return the shared, pooled async HTTP client"""
+    global _async_http_client
+    if _async_http_client is None:
+        config = get_config()
+        with _lock:
+            if _async_http_client is None:
+                _async_http_client = httpx.AsyncClient(limits=config.limits(), timeout=config.timeouts())
+    return _async_http_client
+
+
+def get_openai_client() -> "openai.OpenAI":
+    """Return the shared sync OpenAI client used by the tools"""
+    global _client
+    if _client is None:
+        import openai
+        config = get_config()
+        http_client = get_http_client()
+        with _lock:
+            if _client is None:
+                _client = openai.OpenAI(
+                    api_key=config.api_key,
+                    base_url=config.base_url,
+                    max_retries=config.max_retries,
+                    timeout=config.timeouts(),
+                    http_client=http_client
+                )
+    return _client
+
+
+def get_async_openai_client() -> "openai.AsyncOpenAI":
+    """Return the shared async OpenAI client used by the async tools"""
+    global _async_client
+    if _async_client is None:
+        import openai
+        config = get_config()
+        http_client = get_async_http_client()
+        with _lock:
+            if _async_client is None:
+                _async_client = openai.AsyncOpenAI(
+                    api_key=config.api_key,
+                    base_url=config.base_url,
+                    max_retries=config.max_retries,
+                    timeout=config.timeouts(),
+                    http_client=http_client
+                )
+    return _async_client
+
+
+def get_chat_model(model: str, temperature: float = 0.7, timeout: Optional[float] = None,
+                   max_retries: Optional[int] = None):
+    """
+    Build a ChatOpenAI instance on top of the shared HTTP connection pools
+
+    Args:
+        model (str): OpenAI model name, e.g. "gpt-4o"
+        temperature (float): Sampling temperature
+        timeout (float, optional): Per-call timeout, OPENAI_TIMEOUT by default
+        max_retries (int, optional): SDK retries, OPENAI_MAX_RETRIES by default
+
+    Returns:
+        ChatOpenAI: Chat model sharing the tools' connection pools
+    """
+    from langchain_openai import ChatOpenAI
+
+    config = get_config()
+    return ChatOpenAI(
+        model=model,
+        temperature=temperature,
+        openai_api_key=config.api_key,
+        openai_api_base=config.base_url,
+        max_retries=config.max_retries if max_retries is None else max_retries,
+        timeout=config.timeouts(timeout),
+        http_client=get_http_client(),
+        http_async_client=get_async_http_client()
+    )
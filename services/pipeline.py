@@ -0,0 +1,289 @@
+import asyncio
+import contextvars
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+from pydantic import BaseModel
+from lib.constants import SYSTEM_PROMPT_RESPONSE_WORDING
+from services.tools import EmergencyTools, EmergencyServiceType, ExtractedEmergencyData, Location, ServiceInvokedResponse
+from services.queries import get_transcript, get_coordinates
+from services.triage import FastTriage
+from services.sessions import merge_emergency_data
+from services.metrics import get_metrics_callback
+from services.request_context import get_current_query
+from services.translation import MAORI, detect_language, phrasebook_translate
+from services.resilience import get_breaker, has_time, call_timeout
+
+# Hybrid orchestration.
+# The LLM is only used for extraction and for wording the reply. The
+# deterministic tools (alert_emergency_services, find_next_steps,
+# generate_report) run as a fixed local pipeline instead of costing an
+# agent turn each, with alerting and next steps executed concurrently.
+
+logger = logging.getLogger(__name__)
+
+_tool_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("LOCAL_TOOL_WORKERS", "8")),
+    thread_name_prefix="local-tools"
+)
+
+_triage = FastTriage()
+
+
+class PipelineResult(BaseModel):
+    emergency_data: ExtractedEmergencyData
+    alert: Dict
+    next_steps: Dict
+    report: Dict
+    response_message: str
+    llm_turns: int = 0
+
+
+def coerce_emergency_data(extracted: Dict, transcript: str = "") -> ExtractedEmergencyData:
+    """
+    Build ExtractedEmergencyData from a raw extraction, mapping free-text
+    emergency types such as "flood" onto EmergencyServiceType
+
+    Args:
+        extracted (Dict): Output of extract_emergency_data
+        transcript (str): Original transcript, used when the type is missing
+
+    Returns:
+        ExtractedEmergencyData: Validated emergency data
+    """
+    data = dict(extracted)
+    emergency_type = str(data.get("emergency_type") or "").strip().lower()
+    try:
+        data["emergency_type"] = EmergencyServiceType(emergency_type)
+    except ValueError:
+        guess = _triage.classify(f"{emergency_type} {transcript}")
+        data["emergency_type"] = guess.emergency_type
+    if data.get("severity") not in ("low", "medium", "high", "critical"):
+        data["severity"] = "unknown"
+    return ExtractedEmergencyData(**data)
+
+
+def run_local_tools(emergency_data: ExtractedEmergencyData, previous_alert: Optional[Dict] = None):
+    """
+    Run the deterministic tools for extracted emergency data.
+    Alerting and next steps do not depend on each other's output, so they
+    run concurrently; the report is generated once the alert is back.
+
+    Args:
+        emergency_data (ExtractedEmergencyData): Structured emergency data
+        previous_alert (Dict, optional): Alert already sent earlier in the
+            conversation; the same service is not alerted again
+
+    Returns:
+        tuple: (alert, next_steps, report) dictionaries
+    """
+    if previous_alert and _service_value(previous_alert.get("service_alerted")) == emergency_data.emergency_type.value:
+        alert = {
+            **previous_alert,
+            "alert_sent": False,
+            "duplicate_of": previous_alert.get("duplicate_of") or previous_alert.get("alert_id")
+        }
+        next_steps = EmergencyTools.find_next_steps(emergency_data, ServiceInvokedResponse(**alert))
+        report = EmergencyTools.generate_report(emergency_data, alert)
+        return alert, next_steps, report
+
+    # find_next_steps only reads which service is being alerted
+    planned_alert = ServiceInvokedResponse(alert_sent=True, service_alerted=emergency_data.emergency_type)
+    # Each task runs in a copy of the caller's context so tools can see the current query
+    alert_future = _tool_executor.submit(
+        contextvars.copy_context().run, EmergencyTools.alert_emergency_services, emergency_data
+    )
+    next_steps_future = _tool_executor.submit(
+        contextvars.copy_context().run, EmergencyTools.find_next_steps, emergency_data, planned_alert
+    )
+
+    alert = alert_future.result()
+    next_steps = next_steps_future.result()
+    report = EmergencyTools.generate_report(emergency_data, alert)
+    return alert, next_steps, report
+
+
+def _service_value(service) -> str:
+    return str(getattr(service, "value", service))
+
+
+def compose_response_message(emergency_data: ExtractedEmergencyData, alert: Dict, next_steps: Dict,
+                             language: Optional[str] = None) -> str:
+    """Template wording of the reply to the caller, in the caller's language, used without an LLM turn"""
+    service_name = emergency_data.emergency_type.value.replace("_", " ")
+    if alert.get("duplicate_of"):
+        message = (
+            f"{service_name.capitalize()} services are already responding to this incident. "
+            f"Estimated response time: {alert.get('estimated_response_time')}. "
+        )
+    elif alert.get("alert_sent"):
+        message = (
+            f"{service_name.capitalize()} services have been alerted. "
+            f"Estimated response time: {alert.get('estimated_response_time')}. "
+        )
+    else:
+        message = "We could not alert emergency services automatically, please call 111. "
+    message += " ".join(f"{step}." for step in next_steps.get("recommended_steps", []))
+    if language is None:
+        language = detect_language(get_transcript(get_current_query()))
+    if language == MAORI:
+        return phrasebook_translate(message, MAORI) or message
+    return message
+
+
+class HybridPipeline:
+    """Extraction by LLM, then a fixed local tool pipeline, then LLM wording"""
+
+    def __init__(self, llm=None, llm_wording: Optional[bool] = None):
+        self.llm = llm
+        if llm_wording is None:
+            llm_wording = os.getenv("HYBRID_LLM_WORDING", "true").lower() == "true"
+        self.llm_wording = llm_wording and llm is not None
+
+    def run(self, query, previous_data: Optional[Dict] = None, previous_alert: Optional[Dict] = None) -> PipelineResult:
+        """
+        Run the pipeline for a query
+
+        Args:
+            query: User's query, a transcript string or query object
+            previous_data (Dict, optional): Data extracted earlier in the conversation;
+                the new message only updates the fields it changes
+            previous_alert (Dict, optional): Alert already sent earlier in the conversation
+
+        Returns:
+            PipelineResult: Extracted data, tool outputs and the reply wording
+        """
+        result = None
+        for event, data in self.stream(query, previous_data, previous_alert):
+            if event == "result":
+                result = data
+        return result
+
+    def stream(self, query, previous_data: Optional[Dict] = None, previous_alert: Optional[Dict] = None):
+        """
+        Run the pipeline, yielding (event name, data) as each stage finishes.
+        The last event is ("result", PipelineResult).
+        """
+        transcript = get_transcript(query)
+
+        extracted = EmergencyTools.extract_emergency_data(transcript)
+        llm_turns = 1
+        if "error" in extracted:
+            raise RuntimeError(f"Extraction failed: {extracted['error']}")
+        yield "extracted_data", extracted
+
+        merged = merge_emergency_data(previous_data, extracted)
+        emergency_data = self._with_query_location(coerce_emergency_data(merged, transcript), query)
+        alert, next_steps, report = run_local_tools(emergency_data, previous_alert)
+        yield "alert", alert
+        yield "next_steps", next_steps
+
+        response_message = None
+        if self._wording_available():
+            response_message = self._word_response(transcript, emergency_data, alert, next_steps)
+            llm_turns += 1
+        if not response_message:
+            response_message = compose_response_message(emergency_data, alert, next_steps, detect_language(transcript))
+
+        yield "result", PipelineResult(
+            emergency_data=emergency_data,
+            alert=alert,
+            next_steps=next_steps,
+            report=report,
+            response_message=response_message,
+            llm_turns=llm_turns
+        )
+
+    async def arun(self, query, previous_data: Optional[Dict] = None, previous_alert: Optional[Dict] = None) -> PipelineResult:
+        """Async version of run using the async OpenAI client and LLM"""
+        transcript = get_transcript(query)
+
+        extracted = await EmergencyTools.aextract_emergency_data(transcript)
+        llm_turns = 1
+        if "error" in extracted:
+            raise RuntimeError(f"Extraction failed: {extracted['error']}")
+
+        merged = merge_emergency_data(previous_data, extracted)
+        emergency_data = self._with_query_location(coerce_emergency_data(merged, transcript), query)
+        # Alerting, next steps and the report write block on locks and SQLite,
+        # so they run on a worker thread; to_thread keeps the request context
+        alert, next_steps, report = await asyncio.to_thread(run_local_tools, emergency_data, previous_alert)
+
+        response_message = None
+        if self._wording_available():
+            try:
+                reply = await self.llm.ainvoke(
+                    self._wording_messages(transcript, emergency_data, alert, next_steps),
+                    config={"callbacks": [get_metrics_callback()]},
+                    timeout=call_timeout()
+                )
+                response_message = reply.content.strip()
+            except Exception as e:
+                logger.warning("Error wording response: %s", e)
+            finally:
+                self._wording_breaker().release()
+            llm_turns += 1
+        if not response_message:
+            response_message = compose_response_message(emergency_data, alert, next_steps, detect_language(transcript))
+
+        return PipelineResult(
+            emergency_data=emergency_data,
+            alert=alert,
+            next_steps=next_steps,
+            report=report,
+            response_message=response_message,
+            llm_turns=llm_turns
+        )
+
+    def _wording_available(self) -> bool:
+        """
+        LLM wording is skipped, in favour of the template, when the model's
+        circuit is open or the request is short of time
+        """
+        if not self.llm_wording or not has_time():
+            return False
+        return self._wording_breaker().allow()
+    
+    def _wording_breaker(self):
+        return get_breaker(getattr(self.llm, "model_name", "unknown"))
+
+    @staticmethod
+    def _with_query_location(emergency_data: ExtractedEmergencyData, query) -> ExtractedEmergencyData:
+        """Fill in the caller's GPS coordinates from the query when extraction has none"""
+        coordinates = get_coordinates(query)
+        if coordinates is None:
+            return emergency_data
+        location = emergency_data.location.model_copy() if emergency_data.location else Location()
+        if not location.coordinates:
+            location.coordinates = f"{coordinates[0]}, {coordinates[1]}"
+        return emergency_data.model_copy(update={"location": location})
+
+    @staticmethod
+    def _wording_messages(transcript, emergency_data, alert, next_steps):
+        return [
+            ("system", SYSTEM_PROMPT_RESPONSE_WORDING),
+            ("human", (
+                f"Caller message: {transcript}\n"
+                f"Emergency data: {emergency_data.model_dump_json(exclude_none=True)}\n"
+                f"Alert: service={alert.get('service_alerted')}, sent={alert.get('alert_sent')}, "
+                f"estimated response time={alert.get('estimated_response_time')}\n"
+                f"Recommended steps: {'; '.join(next_steps.get('recommended_steps', []))}"
+            )),
+        ]
+
+    def _word_response(self, transcript, emergency_data, alert, next_steps) -> Optional[str]:
+        """Ask the LLM to word the reply; returns None if the call fails"""
+        try:
+            reply = self.llm.invoke(
+                self._wording_messages(transcript, emergency_data, alert, next_steps),
+                config={"callbacks": [get_metrics_callback()]},
+                timeout=call_timeout()
+            )
+            return reply.content.strip()
+        except Exception as e:
+            logger.warning("Error wording response: %s", e)
+            return None
+        finally:
+            # Frees a circuit probe slot if the call recorded no outcome
+            self._wording_breaker().release()
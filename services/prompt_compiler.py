@@ -0,0 +1,237 @@
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple, Type
+from pydantic import BaseModel
+from lib.constants import (
+    SYSTEM_PROMPT_DATA_EXTRACT, SYSTEM_PROMPT_AGENT_COMPACT, STRUCTURED_RESPONSE_INSTRUCTIONS, COMPACT_FORMAT_INSTRUCTIONS
+)
+from services.queries import get_coordinates, get_profile_data, get_transcript
+from services.sessions import estimate_tokens
+
+# Prompt compilation for the agent.
+# Every agent turn resends the system prompt and the tool schemas, so they
+# are kept short and identical across requests: PROMPT_LAYOUT=compact drops
+# instructions the request already carries (the tool list is in the tool
+# schemas, the output schema in submit_response) and the titles and null
+# branches pydantic adds to the tool schemas, and all per-request
+# content comes after them, so the provider's prefix cache can match the
+# whole static part. The caller's message is rendered as plain lines
+# rather than the raw query object, which repeated the chat history, and
+# profile data and chat history are trimmed to per-request token budgets.
+# PROMPT_LAYOUT=full keeps the original prompt and inputs.
+
+logger = logging.getLogger(__name__)
+
+FULL = "full"
+COMPACT = "compact"
+
+# Query fields that are rendered separately or not needed by the agent
+RENDERED_QUERY_FIELDS = {"transcript", "location", "chat_history", "profile_data", "session_id", "caller_id"}
+
+# Profile fields kept first when the profile has to be trimmed
+PROFILE_FIELD_PRIORITY = ("knownMedicalIssues", "bloodType", "age", "fName", "sName")
+
+
+def prompt_layout() -> str:
+    """Configured prompt layout, "compact" or "full" """
+    layout = os.getenv("PROMPT_LAYOUT", COMPACT).strip().lower()
+    if layout not in (COMPACT, FULL):
+        raise ValueError(f"Unknown PROMPT_LAYOUT '{layout}', expected '{COMPACT}' or '{FULL}'")
+    return layout
+
+
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+
+def count_tokens(text: str) -> int:
+    """
+    Tokens in text for the gpt-4o family. Uses tiktoken when its encoding
+    is available locally and the four-characters-per-token estimate
+    otherwise, so counting never needs the network at request time.
+    """
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        with _encoding_lock:
+            if not _encoding_loaded:
+                try:
+                    import tiktoken
+                    _encoding = tiktoken.get_encoding("o200k_base")
+                except Exception as e:
+                    logger.info("tiktoken encoding unavailable, estimating token counts: %s", e)
+                _encoding_loaded = True
+    if _encoding is None:
+        return estimate_tokens(text)
+    return len(_encoding.encode(text))
+
+
+def compact_text(text: str) -> str:
+    """Strip the indentation and blank lines of a prompt written as a triple-quoted string"""
+    return "\n".join(line.strip() for line in text.strip().splitlines() if line.strip())
+
+
+class PromptSection(NamedTuple):
+    name: str
+    text: str
+    # Identical for every request, so part of the cacheable prefix
+    stable: bool
+
+
+def section_tokens(sections: Sequence[PromptSection]) -> List[Dict]:
+    """Token count of each section, in prompt order"""
+    return [{"section": s.name, "stable": s.stable, "tokens": count_tokens(s.text)} for s in sections]
+
+
+def compact_schema(schema, properties: bool = False):
+    """
+    JSON schema without what the model does not need: titles, null
+    defaults, and the null branch of optional fields (being optional
+    already says they may be left out)
+    """
+    if isinstance(schema, list):
+        return [compact_schema(value) for value in schema]
+    if not isinstance(schema, dict):
+        return schema
+    if properties:
+        # Keys here are field names, which may themselves be "title"
+        return {name: compact_schema(value) for name, value in schema.items()}
+    result = {}
+    for key, value in schema.items():
+        if key == "title" or (key == "default" and value is None):
+            continue
+        result[key] = compact_schema(value, properties=key == "properties")
+    any_of = result.get("anyOf")
+    if isinstance(any_of, list) and len(any_of) == 2 and {"type": "null"} in any_of:
+        other = next(value for value in any_of if value != {"type": "null"})
+        result = {**other, **{key: value for key, value in result.items() if key != "anyOf"}}
+    return result
+
+
+def render_profile(profile: Dict, token_budget: int) -> str:
+    """
+    Profile data as compact JSON within token_budget. Empty fields are left
+    out and the lowest-priority fields are dropped first.
+    """
+    fields = [(key, value) for key, value in profile.items() if value not in (None, "", [], {})]
+    priority = {name.lower(): i for i, name in enumerate(PROFILE_FIELD_PRIORITY)}
+    fields.sort(key=lambda item: priority.get(str(item[0]).lower(), len(priority)))
+    while fields:
+        text = json.dumps(dict(fields), separators=(",", ":"), ensure_ascii=False, default=str)
+        if count_tokens(text) <= token_budget:
+            return text
+        fields.pop()
+    return ""
+
+
+def fit_history(history: List[Tuple[str, str]], token_budget: int) -> List[Tuple[str, str]]:
+    """
+    Trim a prompt history to token_budget. System entries (known emergency
+    data, the summary of earlier turns) are kept, then the newest turns
+    that fit; the order is preserved.
+    """
+    budget = token_budget - sum(count_tokens(text) for role, text in history if role == "system")
+    keep = set()
+    for i in range(len(history) - 1, -1, -1):
+        role, text = history[i]
+        if role == "system":
+            continue
+        cost = count_tokens(text)
+        if cost > budget:
+            break
+        budget -= cost
+        keep.add(i)
+    return [entry for i, entry in enumerate(history) if entry[0] == "system" or i in keep]
+
+
+class PromptCompiler:
+    """Builds the agent's system prompt and per-request inputs for a prompt layout"""
+
+    def __init__(self, layout: Optional[str] = None, history_token_budget: Optional[int] = None,
+                 profile_token_budget: Optional[int] = None):
+        self.layout = layout or prompt_layout()
+        self.history_token_budget = history_token_budget or int(os.getenv("PROMPT_HISTORY_TOKENS", "400"))
+        self.profile_token_budget = profile_token_budget or int(os.getenv("PROMPT_PROFILE_TOKENS", "80"))
+
+    def system_sections(self, structured_response: bool, output_model: Type[BaseModel],
+                        format_instructions: str) -> List[PromptSection]:
+        """
+        Sections of the system prompt
+
+        Args:
+            structured_response (bool): The agent answers through submit_response
+            output_model (Type[BaseModel]): Schema of the final answer
+            format_instructions (str): The output parser's instructions, used by the full layout
+
+        Returns:
+            List[PromptSection]: Sections in prompt order
+        """
+        if self.layout == FULL:
+            output = STRUCTURED_RESPONSE_INSTRUCTIONS if structured_response else format_instructions
+            return [
+                PromptSection("system_prompt", SYSTEM_PROMPT_DATA_EXTRACT, True),
+                PromptSection("output_instructions", f" \n {output}", True),
+            ]
+        if structured_response:
+            output = compact_text(STRUCTURED_RESPONSE_INSTRUCTIONS)
+        else:
+            schema = json.dumps(compact_schema(output_model.model_json_schema()), separators=(",", ":"))
+            output = compact_text(COMPACT_FORMAT_INSTRUCTIONS).format(schema=schema)
+        return [
+            PromptSection("system_prompt", compact_text(SYSTEM_PROMPT_AGENT_COMPACT), True),
+            PromptSection("output_instructions", "\n" + output, True),
+        ]
+
+    def system_prompt(self, structured_response: bool, output_model: Type[BaseModel], format_instructions: str) -> str:
+        """The agent's system message"""
+        return "".join(s.text for s in self.system_sections(structured_response, output_model, format_instructions))
+
+    def tool_schemas(self, tools: List) -> List:
+        """
+        Tools as bound to the LLM. The compact layout sends their OpenAI
+        schemas through compact_schema; execution still uses the tools.
+        """
+        if self.layout == FULL:
+            return tools
+        from langchain_core.utils.function_calling import convert_to_openai_tool
+        return [compact_schema(convert_to_openai_tool(tool)) for tool in tools]
+
+    def render_query(self, query: Any) -> str:
+        """The caller's message and its context as the human message"""
+        if self.layout == FULL:
+            return str(query)
+        if not isinstance(query, dict):
+            return get_transcript(query)
+        lines = [f"Caller message: {get_transcript(query)}"]
+        coordinates = get_coordinates(query)
+        if coordinates:
+            lines.append(f"Location: {coordinates[0]}, {coordinates[1]}")
+        extra = {key: value for key, value in query.items() if key not in RENDERED_QUERY_FIELDS and value not in (None, "")}
+        for key, value in extra.items():
+            if not isinstance(value, str):
+                value = json.dumps(value, separators=(",", ":"), ensure_ascii=False, default=str)
+            lines.append(f"{key.replace('_', ' ').capitalize()}: {value}")
+        profile = render_profile(get_profile_data(query), self.profile_token_budget)
+        if profile:
+            lines.append(f"Caller profile: {profile}")
+        return "\n".join(lines)
+
+    def agent_inputs(self, query: Any, chat_history: List[Tuple[str, str]]) -> Dict:
+        """Prompt variables for one agent run"""
+        if self.layout == FULL:
+            return {"query": query, "chat_history": chat_history}
+        return {
+            "query": self.render_query(query),
+            "chat_history": fit_history(chat_history, self.history_token_budget),
+        }
+
+    def request_sections(self, query: Any, chat_history: List[Tuple[str, str]]) -> List[PromptSection]:
+        """Per-request sections, for measuring token use"""
+        inputs = self.agent_inputs(query, chat_history)
+        history = "\n".join(text for _, text in inputs["chat_history"])
+        return [
+            PromptSection("chat_history", history, False),
+            PromptSection("query", str(inputs["query"]), False),
+        ]
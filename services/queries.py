@@ -0,0 +1,54 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+# Helpers for reading the documented /api/query body.
+# The query may be a plain string or an object such as:
+# {
+#   "transcript": "I am hurt badly and need help",
+#   "location": {"latitude": -41.2865, "longitude": 174.7762},
+#   "time_submitted": "2025-08-12T07:00:00+00:00",
+#   "chat_history": [...],
+#   "profile_data": {...},
+#   "session_id": "caller-123"
+# }
+
+
+def get_transcript(query: Any) -> str:
+    """Return the caller's message text from a query"""
+    if isinstance(query, dict):
+        return str(query.get("transcript") or "")
+    return str(query or "")
+
+
+def get_coordinates(query: Any) -> Optional[Tuple[float, float]]:
+    """Return (latitude, longitude) from a query, or None if not provided"""
+    if not isinstance(query, dict):
+        return None
+    location = query.get("location")
+    if not isinstance(location, dict):
+        return None
+    try:
+        return float(location["latitude"]), float(location["longitude"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def get_chat_history(query: Any) -> List[Dict]:
+    """Return the client-supplied chat history from a query"""
+    if isinstance(query, dict) and isinstance(query.get("chat_history"), list):
+        return query["chat_history"]
+    return []
+
+
+def get_profile_data(query: Any) -> Dict:
+    """Return the caller's profile data from a query"""
+    if isinstance(query, dict) and isinstance(query.get("profile_data"), dict):
+        return query["profile_data"]
+    return {}
+
+
+def get_session_id(query: Any) -> Optional[str]:
+    """Return the session or caller ID that links follow-up messages, if any"""
+    if not isinstance(query, dict):
+        return None
+    session_id = query.get("session_id") or query.get("caller_id")
+    return str(session_id) if session_id else None
@@ -0,0 +1,56 @@
+import contextvars
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+# The query being processed on the current thread or task.
+# Tools are called by the agent with only the arguments the LLM chose, so
+# anything they need from the original request (such as the caller's GPS
+# location) is read from here instead.
+#
+# Each request also carries a dispatch record of the alerts and reports its
+# tools have already made. An agent run that overran its deadline keeps
+# going in the background while the fallback chain answers, and both may
+# call the tools; the record makes the second call reuse the first's alert
+# and report instead of dispatching services and storing an incident twice.
+
+current_query = contextvars.ContextVar("current_query", default=None)
+current_dispatches = contextvars.ContextVar("current_dispatches", default=None)
+
+
+class RequestDispatches:
+    """Alerts and reports already made for one request"""
+
+    def __init__(self):
+        # Held while a tool decides and makes its side effect, so the
+        # abandoned run and the fallback cannot both miss the record
+        self.lock = threading.RLock()
+        self.alerts: Dict[str, Dict] = {}
+        self.reports: Dict[Optional[str], Dict] = {}
+
+
+@contextmanager
+def query_context(query: Any, dispatches: Optional[RequestDispatches] = None):
+    """
+    Make query visible to tools for the duration of the block
+
+    Args:
+        query: User's query, a transcript string or query object
+        dispatches (RequestDispatches, optional): Record to share across
+            several blocks of the same request, e.g. the steps of a stream
+    """
+    token = current_query.set(query)
+    dispatches_token = current_dispatches.set(dispatches or RequestDispatches())
+    try:
+        yield
+    finally:
+        current_dispatches.reset(dispatches_token)
+        current_query.reset(token)
+
+
+def get_current_query() -> Any:
+    return current_query.get()
+
+
+def get_current_dispatches() -> Optional[RequestDispatches]:
+    return current_dispatches.get()
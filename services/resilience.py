@@ -0,0 +1,502 @@
+import asyncio
+import contextvars
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+from services.metrics import LLM_ERRORS, LLM_FALLBACKS, LLM_HEDGES, record_openai_response
+from services.openai_client import get_async_openai_client, get_openai_client
+
+# Resilience layer for OpenAI calls.
+#
+# - Deadlines: each query gets a time budget (REQUEST_DEADLINE_SECONDS, or
+#   CRITICAL_DEADLINE_SECONDS for critical reports). Every LLM attempt is
+#   capped at LLM_CALL_TIMEOUT and at what is left of the budget, and the
+#   SDK's own retries are turned off so they cannot overrun it.
+# - Circuit breakers: one per model. CIRCUIT_FAILURE_THRESHOLD consecutive
+#   timeouts, 429s or 5xx open the circuit and the model is skipped for
+#   CIRCUIT_RESET_SECONDS; then a single probe call decides whether it closes.
+#   A probe that ends without a verdict (cancelled, or a client error that
+#   says nothing about the model) frees its slot, and a probe still
+#   outstanding after CIRCUIT_RESET_SECONDS is replaced by a new one.
+# - Fallback chain: a call starting at one model moves on to the later
+#   models in LLM_FALLBACK_MODELS (gpt-4o, then gpt-4o-mini). When the chain
+#   is exhausted LLMUnavailable is raised and the caller falls back to local
+#   triage.
+#   The agent itself gets the budget less FALLBACK_RESERVE_SECONDS, so a
+#   slow or failed run still leaves time for the fallback chain.
+# - Hedging: for critical reports a second attempt is started on the next
+#   model after HEDGE_DELAY_SECONDS if the first has not answered, and the
+#   first success wins.
+
+logger = logging.getLogger(__name__)
+
+FALLBACK_MODELS = [m.strip() for m in os.getenv("LLM_FALLBACK_MODELS", "gpt-4o,gpt-4o-mini").split(",") if m.strip()]
+LLM_CALL_TIMEOUT = float(os.getenv("LLM_CALL_TIMEOUT", "10"))
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", "1"))
+MIN_CALL_SECONDS = float(os.getenv("LLM_MIN_CALL_SECONDS", "0.5"))
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "20"))
+CRITICAL_DEADLINE_SECONDS = float(os.getenv("CRITICAL_DEADLINE_SECONDS", "10"))
+# Part of the budget kept back from the agent for the fallback chain
+FALLBACK_RESERVE_SECONDS = float(os.getenv("FALLBACK_RESERVE_SECONDS", "4"))
+HEDGE_DELAY_SECONDS = float(os.getenv("HEDGE_DELAY_SECONDS", "1.5"))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+
+# Client errors that say nothing about the model's health
+NON_RETRYABLE_STATUS = {400, 401, 403, 404, 422}
+
+
+class LLMUnavailable(Exception):
+    """Every model in the fallback chain failed, was skipped or ran out of time"""
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker for one model"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._probe_started = 0.0
+        self.times_opened = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_seconds:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        """
+        Whether a call to the model may go ahead. After the reset period one
+        caller at a time is let through as a probe; a probe that has not
+        reported back within the reset period is presumed lost.
+        """
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            now = time.monotonic()
+            if self._state == self.OPEN and now - self._opened_at >= self.reset_seconds:
+                self._state = self.HALF_OPEN
+            if self._state == self.HALF_OPEN and (not self._probing or now - self._probe_started >= self.reset_seconds):
+                self._probing, self._probe_started = True, now
+                return True
+            return False
+    
+    def release(self):
+        """
+        Free the probe slot taken by allow() when the call it let through
+        ended without recording an outcome. A no-op once an outcome is in.
+        """
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            if self._state != self.CLOSED:
+                logger.info("Circuit for %s closed", self.name)
+            self._state, self._failures, self._probing = self.CLOSED, 0, False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self._state == self.HALF_OPEN or (self._state == self.CLOSED and self._failures >= self.failure_threshold):
+                self._state, self._opened_at = self.OPEN, time.monotonic()
+                self.times_opened += 1
+                logger.warning("Circuit for %s opened after %d failures", self.name, self._failures)
+
+    def stats(self) -> Dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self._failures,
+            "times_opened": self.times_opened,
+        }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(model: str) -> CircuitBreaker:
+    """Return the circuit breaker for a model, created on first use"""
+    breaker = _breakers.get(model)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.setdefault(
+                model, CircuitBreaker(model, CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_SECONDS)
+            )
+    return breaker
+
+
+def breaker_stats() -> Dict[str, Dict]:
+    return {model: breaker.stats() for model, breaker in list(_breakers.items())}
+
+
+# Absolute time.monotonic() deadline of the current query, and whether it was
+# triaged as critical
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("request_deadline", default=None)
+_critical: contextvars.ContextVar[bool] = contextvars.ContextVar("request_critical", default=False)
+
+
+def budget_seconds(critical: bool = False) -> float:
+    """Time budget of a query"""
+    return CRITICAL_DEADLINE_SECONDS if critical else REQUEST_DEADLINE_SECONDS
+
+
+@contextmanager
+def request_deadline(seconds: Optional[float] = None, critical: bool = False):
+    """
+    Give the enclosed block a time budget. A nested budget never extends
+    the one already in force.
+
+    Args:
+        seconds (float): Budget; defaults to CRITICAL_DEADLINE_SECONDS or
+            REQUEST_DEADLINE_SECONDS
+        critical (bool): Whether tool-level LLM calls should be hedged
+    """
+    if seconds is None:
+        seconds = budget_seconds(critical)
+    deadline = time.monotonic() + seconds
+    current = _deadline.get()
+    if current is not None:
+        deadline = min(deadline, current)
+    deadline_token = _deadline.set(deadline)
+    critical_token = _critical.set(critical or _critical.get())
+    try:
+        yield
+    finally:
+        _critical.reset(critical_token)
+        _deadline.reset(deadline_token)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left of the current query's budget, None outside a deadline"""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def is_critical() -> bool:
+    return _critical.get()
+
+
+def call_timeout() -> float:
+    """Timeout for the next LLM attempt"""
+    left = remaining()
+    return LLM_CALL_TIMEOUT if left is None else max(0.0, min(LLM_CALL_TIMEOUT, left))
+
+
+def fallback_chain(model: str) -> List[str]:
+    """The model followed by the later models of LLM_FALLBACK_MODELS"""
+    if model in FALLBACK_MODELS:
+        return FALLBACK_MODELS[FALLBACK_MODELS.index(model):]
+    return [model]
+
+
+def failure_reason(error: BaseException) -> Optional[str]:
+    """Why an attempt failed, or None if retrying on another model would not help"""
+    status = getattr(error, "status_code", None)
+    if status in NON_RETRYABLE_STATUS:
+        return None
+    if status == 429:
+        return "rate_limited"
+    if "timeout" in type(error).__name__.lower() or isinstance(error, (asyncio.TimeoutError, TimeoutError)):
+        return "timeout"
+    return "error"
+
+
+def _backoff(attempt: int, error: BaseException) -> float:
+    """Jittered delay before retrying the same model, honouring Retry-After"""
+    delay = random.uniform(0, 0.25 * 2 ** attempt)
+    response = getattr(error, "response", None)
+    retry_after = getattr(response, "headers", {}).get("retry-after") if response is not None else None
+    try:
+        delay = max(delay, float(retry_after))
+    except (TypeError, ValueError):
+        pass
+    return delay
+
+
+def has_time(delay: float = 0.0) -> bool:
+    """Whether the budget leaves room for another LLM attempt after delay seconds"""
+    left = remaining()
+    return left is None or left - delay >= MIN_CALL_SECONDS
+
+
+_executors: Dict[str, ThreadPoolExecutor] = {}
+_executor_lock = threading.Lock()
+
+
+def _pool(name: str, workers: int) -> ThreadPoolExecutor:
+    executor = _executors.get(name)
+    if executor is None:
+        with _executor_lock:
+            executor = _executors.get(name)
+            if executor is None:
+                executor = _executors[name] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+    return executor
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """Runs the agent runs and streams waited on with a deadline"""
+    return _pool("llm-deadline", int(os.getenv("DEADLINE_WORKERS", "64")))
+
+
+def _get_hedge_executor() -> ThreadPoolExecutor:
+    """
+    Runs hedged calls. Kept apart from the deadline pool because agent runs
+    on that pool make hedged calls, and abandoned runs could otherwise
+    leave no thread for the hedges they are waiting on.
+    """
+    return _pool("llm-hedge", int(os.getenv("HEDGE_WORKERS", "32")))
+
+
+def _reset_after_fork():
+    _executors.clear()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _record_error(breaker: CircuitBreaker, model: str, error: Exception):
+    """Count a failed attempt; a client error means the model did answer"""
+    LLM_ERRORS.inc(model=model)
+    if failure_reason(error) is not None:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+
+
+def _call_once(model: str, create: Callable):
+    """One attempt against one model, updating its breaker"""
+    breaker = get_breaker(model)
+    started = time.perf_counter()
+    try:
+        response = create(get_openai_client().with_options(timeout=call_timeout(), max_retries=0), model)
+    except Exception as e:
+        _record_error(breaker, model, e)
+        raise
+    except BaseException:
+        breaker.release()
+        raise
+    breaker.record_success()
+    record_openai_response(model, started, response)
+    return response
+
+
+def _hedged_call(model: str, create: Callable):
+    """
+    Start the call on a worker thread and, if it has not answered within
+    HEDGE_DELAY_SECONDS, a second one on the next model of the chain (or
+    the same model). Returns the first successful response.
+    """
+    chain = fallback_chain(model)
+    hedge_model = next((m for m in chain[1:] if get_breaker(m).state == CircuitBreaker.CLOSED), model)
+    executor = _get_hedge_executor()
+    futures = {executor.submit(contextvars.copy_context().run, _call_once, model, create): "primary"}
+    done, _ = wait(futures, timeout=min(HEDGE_DELAY_SECONDS, call_timeout()))
+    if not done and has_time():
+        futures[executor.submit(contextvars.copy_context().run, _call_once, hedge_model, create)] = "hedge"
+    error = None
+    pending = set(futures)
+    while pending:
+        done, pending = wait(pending, timeout=call_timeout(), return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for future in done:
+            if future.exception() is None:
+                if len(futures) > 1:
+                    LLM_HEDGES.inc(winner=futures[future])
+                return future.result()
+            error = future.exception()
+    raise error or TimeoutError(f"No response from {model} within the deadline")
+
+
+def call_with_fallback(model: str, create: Callable):
+    """
+    Call OpenAI through the fallback chain starting at model
+
+    Args:
+        model (str): Preferred model
+        create (Callable): create(client, model) making one chat completion
+            with the given client and model
+
+    Returns:
+        The first successful response; response.model names the model used
+
+    Raises:
+        LLMUnavailable: If no model in the chain answered in time
+        Exception: Client errors (400, 401, ...) are raised as they are
+    """
+    last_reason = None
+    for candidate in fallback_chain(model):
+        for attempt in range(1 + LLM_RETRIES):
+            if not has_time():
+                raise LLMUnavailable(f"Deadline reached before {candidate} could be called ({last_reason})")
+            if not get_breaker(candidate).allow():
+                LLM_FALLBACKS.inc(model=candidate, reason="circuit_open")
+                last_reason = f"circuit for {candidate} is open"
+                break
+            try:
+                if is_critical() and attempt == 0:
+                    return _hedged_call(candidate, create)
+                return _call_once(candidate, create)
+            except Exception as e:
+                reason = failure_reason(e)
+                if reason is None:
+                    raise
+                LLM_FALLBACKS.inc(model=candidate, reason=reason)
+                last_reason = f"{candidate}: {e}"
+                logger.warning("LLM call to %s failed (%s): %s", candidate, reason, e)
+                if attempt < LLM_RETRIES:
+                    delay = _backoff(attempt, e)
+                    if not has_time(delay):
+                        break
+                    time.sleep(delay)
+    raise LLMUnavailable(f"No model available for the request ({last_reason})")
+
+
+async def _acall_once(model: str, create: Callable[..., Awaitable]):
+    breaker = get_breaker(model)
+    started = time.perf_counter()
+    timeout = call_timeout()
+    try:
+        client = get_async_openai_client().with_options(timeout=timeout, max_retries=0)
+        response = await asyncio.wait_for(create(client, model), timeout)
+    except Exception as e:
+        _record_error(breaker, model, e)
+        raise
+    except BaseException:
+        # Cancelled, e.g. the losing side of a hedge
+        breaker.release()
+        raise
+    breaker.record_success()
+    record_openai_response(model, started, response)
+    return response
+
+
+async def _ahedged_call(model: str, create: Callable[..., Awaitable]):
+    chain = fallback_chain(model)
+    hedge_model = next((m for m in chain[1:] if get_breaker(m).state == CircuitBreaker.CLOSED), model)
+    tasks = {asyncio.ensure_future(_acall_once(model, create)): "primary"}
+    done, _ = await asyncio.wait(tasks, timeout=min(HEDGE_DELAY_SECONDS, call_timeout()))
+    if not done and has_time():
+        tasks[asyncio.ensure_future(_acall_once(hedge_model, create))] = "hedge"
+    error = None
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, timeout=call_timeout(), return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                break
+            for task in done:
+                if task.exception() is None:
+                    if len(tasks) > 1:
+                        LLM_HEDGES.inc(winner=tasks[task])
+                    return task.result()
+                error = task.exception()
+    finally:
+        for task in pending:
+            task.cancel()
+    raise error or asyncio.TimeoutError(f"No response from {model} within the deadline")
+
+
+async def acall_with_fallback(model: str, create: Callable[..., Awaitable]):
+    """Async twin of call_with_fallback; create(client, model) returns an awaitable"""
+    last_reason = None
+    for candidate in fallback_chain(model):
+        for attempt in range(1 + LLM_RETRIES):
+            if not has_time():
+                raise LLMUnavailable(f"Deadline reached before {candidate} could be called ({last_reason})")
+            if not get_breaker(candidate).allow():
+                LLM_FALLBACKS.inc(model=candidate, reason="circuit_open")
+                last_reason = f"circuit for {candidate} is open"
+                break
+            try:
+                if is_critical() and attempt == 0:
+                    return await _ahedged_call(candidate, create)
+                return await _acall_once(candidate, create)
+            except Exception as e:
+                reason = failure_reason(e)
+                if reason is None:
+                    raise
+                LLM_FALLBACKS.inc(model=candidate, reason=reason)
+                last_reason = f"{candidate}: {e}"
+                logger.warning("LLM call to %s failed (%s): %s", candidate, reason, e)
+                if attempt < LLM_RETRIES:
+                    delay = _backoff(attempt, e)
+                    if not has_time(delay):
+                        break
+                    await asyncio.sleep(delay)
+    raise LLMUnavailable(f"No model available for the request ({last_reason})")
+
+
+def run_with_deadline(fn: Callable, *args, **kwargs):
+    """
+    Run fn on a worker thread and wait at most for the rest of the current
+    budget. The worker keeps the caller's context variables.
+
+    Raises:
+        TimeoutError: If fn has not returned before the deadline; it is left
+        to finish in the background. Tools it calls after that share the
+        request's dispatch record (services.request_context) with the
+        fallback, so services are not alerted twice.
+    """
+    left = remaining()
+    if left is None:
+        return fn(*args, **kwargs)
+    future = _get_executor().submit(contextvars.copy_context().run, fn, *args, **kwargs)
+    try:
+        return future.result(timeout=max(0.0, left))
+    except TimeoutError:
+        raise TimeoutError(f"{getattr(fn, '__name__', 'call')} did not finish within the deadline") from None
+
+
+def iterate_with_deadline(iterable: Iterable):
+    """
+    Iterate on a worker thread, yielding items until the current budget
+    runs out. Like run_with_deadline, for streamed runs.
+
+    Raises:
+        TimeoutError: If the next item does not arrive before the deadline
+    """
+    items: queue.Queue = queue.Queue()
+    done = object()
+
+    def produce():
+        try:
+            for item in iterable:
+                items.put((item, None))
+            items.put((done, None))
+        except BaseException as e:
+            items.put((done, e))
+
+    _get_executor().submit(contextvars.copy_context().run, produce)
+    while True:
+        left = remaining()
+        try:
+            item, error = items.get(timeout=None if left is None else max(0.0, left))
+        except queue.Empty:
+            raise TimeoutError("Stream did not finish within the deadline") from None
+        if item is done:
+            if error is not None:
+                raise error
+            return
+        yield item
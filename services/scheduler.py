@@ -0,0 +1,298 @@
+import asyncio
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Dict, List, Optional
+from services.triage import FastTriage
+from services.queries import get_transcript, get_profile_data
+
+# In-process admission control in front of AIService.get_response.
+# Requests are queued by a cheap severity estimate so a critical fire is
+# never stuck behind foodbank requests. Waiting requests age towards higher
+# priority so low-severity work is delayed rather than starved, and when a
+# priority's queue is full (or its wait budget runs out) the request is shed
+# so the caller can retry later.
+#
+# Threaded servers wait on a condition variable; coroutines under asgi.py
+# wait on an asyncio.Event that releases wake through their event loop, so a
+# queued async request holds no thread.
+
+PRIORITIES = ["critical", "high", "medium", "low"]
+SEVERITY_TO_PRIORITY = {name: level for level, name in enumerate(PRIORITIES)}
+
+WAIT_TIME_BUCKETS = [0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30]
+
+
+def _env_list(name: str, default: List[Optional[float]]) -> List[Optional[float]]:
+    """Read a comma-separated critical,high,medium,low list; "none" means unlimited"""
+    raw = os.getenv(name)
+    if not raw:
+        return default
+    values = [None if v.strip().lower() == "none" else float(v) for v in raw.split(",")]
+    if len(values) != len(PRIORITIES):
+        raise ValueError(f"{name} needs {len(PRIORITIES)} comma-separated values")
+    return values
+
+
+class SchedulerSaturated(Exception):
+    """Raised when a request is shed because its priority class is saturated"""
+
+    def __init__(self, priority: str, retry_after: int):
+        super().__init__(f"Service is at capacity for {priority} priority requests")
+        self.priority = priority
+        self.retry_after = retry_after
+
+
+class _Ticket:
+    __slots__ = ("priority", "enqueued_at", "seq")
+
+    def __init__(self, priority: int, enqueued_at: float, seq: int):
+        self.priority = priority
+        self.enqueued_at = enqueued_at
+        self.seq = seq
+
+
+class PriorityScheduler:
+    """Priority queues with aging, per-priority concurrency limits and load shedding"""
+
+    def __init__(self, max_concurrency=None, priority_limits=None, max_queue_depth=None,
+                 max_wait_seconds=None, aging_seconds=None):
+        self.max_concurrency = max_concurrency or int(os.getenv("SCHEDULER_MAX_CONCURRENCY", "16"))
+        # Concurrency cap per priority; critical may use every slot
+        self.priority_limits = priority_limits or [
+            int(v) if v is not None else self.max_concurrency
+            for v in _env_list("SCHEDULER_PRIORITY_LIMITS", [None, 12, 8, 4])
+        ]
+        self.max_queue_depth = max_queue_depth or [
+            int(v) if v is not None else None
+            for v in _env_list("SCHEDULER_MAX_QUEUE_DEPTH", [None, 200, 100, 50])
+        ]
+        self.max_wait_seconds = max_wait_seconds or _env_list("SCHEDULER_MAX_WAIT_SECONDS", [None, 30, 15, 5])
+        # Seconds of waiting that raise a request by one priority level
+        self.aging_seconds = aging_seconds or float(os.getenv("SCHEDULER_AGING_SECONDS", "10"))
+
+        self.triage = FastTriage()
+        self._cond = threading.Condition()
+        self._waiting: List[_Ticket] = []
+        self._running = [0] * len(PRIORITIES)
+        self._total_running = 0
+        self._seq = 0
+        # (event loop, asyncio.Event) of each coroutine waiting in aslot
+        self._async_waiters = set()
+
+        self._admitted = [0] * len(PRIORITIES)
+        self._rejected = [0] * len(PRIORITIES)
+        self._wait_count = [0] * len(PRIORITIES)
+        self._wait_sum = [0.0] * len(PRIORITIES)
+        self._wait_max = [0.0] * len(PRIORITIES)
+        self._wait_buckets = [[0] * len(WAIT_TIME_BUCKETS) for _ in PRIORITIES]
+
+    def estimate_priority(self, query: Any) -> int:
+        """
+        Cheap severity estimate from transcript keywords and profile data
+
+        Returns:
+            int: Priority level, 0 (critical) to 3 (low)
+        """
+        triage = self.triage.classify(get_transcript(query))
+        priority = SEVERITY_TO_PRIORITY.get(triage.severity, SEVERITY_TO_PRIORITY["medium"])
+        if triage.confidence == 0:
+            priority = SEVERITY_TO_PRIORITY["medium"]
+
+        # Callers with known medical issues are more vulnerable
+        profile_data = get_profile_data(query)
+        if profile_data.get("knownMedicalIssues"):
+            priority = max(0, priority - 1)
+        return priority
+
+    def run(self, query: Any, fn, *args, **kwargs):
+        """Run fn once the query is admitted, raising SchedulerSaturated if shed"""
+        with self.slot(query):
+            return fn(*args, **kwargs)
+
+    async def arun(self, query: Any, fn, *args, **kwargs):
+        """Await fn(*args, **kwargs) once the query is admitted, raising SchedulerSaturated if shed"""
+        async with self.aslot(query):
+            return await fn(*args, **kwargs)
+
+    @contextmanager
+    def slot(self, query: Any, max_wait: Optional[float] = None):
+        """
+        Hold an execution slot for the duration of the block
+
+        Args:
+            query: Query the priority is estimated from
+            max_wait (float, optional): Shed the request after this many
+                seconds of waiting, if sooner than its priority's limit
+        """
+        priority = self.estimate_priority(query)
+        self._acquire(priority, max_wait)
+        try:
+            yield PRIORITIES[priority]
+        finally:
+            self._release(priority)
+
+    @asynccontextmanager
+    async def aslot(self, query: Any):
+        """Async twin of slot; the wait happens on the event loop"""
+        priority = self.estimate_priority(query)
+        await self._aacquire(priority)
+        try:
+            yield PRIORITIES[priority]
+        finally:
+            self._release(priority)
+
+    def _effective_priority(self, ticket: _Ticket, now: float) -> float:
+        return ticket.priority - (now - ticket.enqueued_at) / self.aging_seconds
+
+    def _can_start(self, ticket: _Ticket, now: float) -> bool:
+        if self._total_running >= self.max_concurrency:
+            return False
+        if self._running[ticket.priority] >= self.priority_limits[ticket.priority]:
+            return False
+        eligible = [t for t in self._waiting if self._running[t.priority] < self.priority_limits[t.priority]]
+        best = min(eligible, key=lambda t: (self._effective_priority(t, now), t.seq))
+        return best is ticket
+
+    def _enqueue(self, priority: int, max_wait: Optional[float] = None):
+        """Queue a ticket, or shed it if its queue is full; caller holds the lock"""
+        now = time.monotonic()
+        depth_limit = self.max_queue_depth[priority]
+        queued = sum(1 for t in self._waiting if t.priority == priority)
+        if depth_limit is not None and queued >= depth_limit:
+            self._rejected[priority] += 1
+            raise SchedulerSaturated(PRIORITIES[priority], retry_after=self._retry_after(priority))
+
+        self._seq += 1
+        ticket = _Ticket(priority, now, self._seq)
+        self._waiting.append(ticket)
+        limit = self.max_wait_seconds[priority]
+        if max_wait is not None:
+            limit = max_wait if limit is None else min(limit, max_wait)
+        return ticket, now + limit if limit is not None else None
+
+    def _try_start(self, ticket: _Ticket, deadline: Optional[float]) -> bool:
+        """
+        Start ticket if it is next, shedding it once its wait budget has run
+        out; caller holds the lock
+
+        Returns:
+            bool: Whether the ticket now holds a slot
+        """
+        if self._can_start(ticket, time.monotonic()):
+            self._waiting.remove(ticket)
+            self._running[ticket.priority] += 1
+            self._total_running += 1
+            self._admitted[ticket.priority] += 1
+            self._record_wait(ticket.priority, time.monotonic() - ticket.enqueued_at)
+            # Several releases may have woken waiters before this ticket was
+            # next; wake them again so the new best one takes a free slot
+            if self._waiting and self._total_running < self.max_concurrency:
+                self._notify()
+            return True
+        if deadline is not None and deadline - time.monotonic() <= 0:
+            self._abandon(ticket)
+            self._rejected[ticket.priority] += 1
+            raise SchedulerSaturated(PRIORITIES[ticket.priority], retry_after=self._retry_after(ticket.priority))
+        return False
+
+    def _wait_timeout(self, deadline: Optional[float]) -> float:
+        # Wake periodically so aging can reorder the queue
+        timeout = min(1.0, self.aging_seconds / 4)
+        if deadline is not None:
+            timeout = max(0.0, min(timeout, deadline - time.monotonic()))
+        return timeout
+
+    def _abandon(self, ticket: _Ticket):
+        """Take a ticket that will never start out of the queue; caller holds the lock"""
+        self._waiting.remove(ticket)
+        self._notify()
+
+    def _acquire(self, priority: int, max_wait: Optional[float] = None):
+        with self._cond:
+            ticket, deadline = self._enqueue(priority, max_wait)
+            while not self._try_start(ticket, deadline):
+                self._cond.wait(self._wait_timeout(deadline))
+
+    async def _aacquire(self, priority: int):
+        wakeup = asyncio.Event()
+        waiter = (asyncio.get_running_loop(), wakeup)
+        with self._cond:
+            ticket, deadline = self._enqueue(priority)
+            self._async_waiters.add(waiter)
+        try:
+            while True:
+                with self._cond:
+                    if self._try_start(ticket, deadline):
+                        return
+                    # Cleared under the lock, so a release after this check still wakes us
+                    wakeup.clear()
+                    timeout = self._wait_timeout(deadline)
+                try:
+                    await asyncio.wait_for(wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+        except asyncio.CancelledError:
+            with self._cond:
+                if ticket in self._waiting:
+                    self._abandon(ticket)
+            raise
+        finally:
+            with self._cond:
+                self._async_waiters.discard(waiter)
+
+    def _notify(self):
+        """Wake every waiter to re-check the queue; caller holds the lock"""
+        self._cond.notify_all()
+        for loop, wakeup in self._async_waiters:
+            try:
+                loop.call_soon_threadsafe(wakeup.set)
+            except RuntimeError:
+                # Its event loop has closed
+                pass
+
+    def _release(self, priority: int):
+        with self._cond:
+            self._running[priority] -= 1
+            self._total_running -= 1
+            self._notify()
+
+    def _record_wait(self, priority: int, waited: float):
+        self._wait_count[priority] += 1
+        self._wait_sum[priority] += waited
+        self._wait_max[priority] = max(self._wait_max[priority], waited)
+        for i, bound in enumerate(WAIT_TIME_BUCKETS):
+            if waited <= bound:
+                self._wait_buckets[priority][i] += 1
+
+    def _retry_after(self, priority: int) -> int:
+        """Suggested Retry-After seconds for a shed request"""
+        return int(self.max_wait_seconds[priority] or self.aging_seconds)
+
+    def stats(self) -> Dict:
+        """Queue depth, in-flight and wait-time metrics per priority"""
+        with self._cond:
+            per_priority = {}
+            for level, name in enumerate(PRIORITIES):
+                count = self._wait_count[level]
+                per_priority[name] = {
+                    "queue_depth": sum(1 for t in self._waiting if t.priority == level),
+                    "in_flight": self._running[level],
+                    "concurrency_limit": self.priority_limits[level],
+                    "admitted": self._admitted[level],
+                    "rejected": self._rejected[level],
+                    "wait_seconds": {
+                        "count": count,
+                        "sum": round(self._wait_sum[level], 6),
+                        "mean": round(self._wait_sum[level] / count, 6) if count else 0.0,
+                        "max": round(self._wait_max[level], 6),
+                        "buckets": dict(zip([str(b) for b in WAIT_TIME_BUCKETS], self._wait_buckets[level]))
+                    }
+                }
+            return {
+                "max_concurrency": self.max_concurrency,
+                "in_flight": self._total_running,
+                "queue_depth": len(self._waiting),
+                "priorities": per_priority
+            }
@@ -0,0 +1,292 @@
+import datetime
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from services.queries import get_chat_history, get_transcript
+from services.shared_state import SQLITE, SharedDatabase, get_shared_database, state_backend
+
+# Multi-turn conversation state keyed by session/caller ID.
+# Keeps prior turns, the last extracted emergency data and the last alert
+# so follow-up messages only update what changed. The prompt receives a
+# token-budgeted window of recent turns; older turns are folded into a
+# running summary as they fall out of the window. The first exchange, which
+# usually states the incident and address, stays at the top of the summary;
+# when it outgrows its budget, lines are dropped from just after it.
+
+# Summary lines kept however long the conversation runs: the caller's first
+# message and the reply to it
+PINNED_SUMMARY_LINES = 2
+
+ROLE_NAMES = {"user": "human", "human": "human", "assistant": "ai", "ai": "ai", "system": "system"}
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token for English)"""
+    return len(text) // 4 + 1
+
+
+def _summarize_turn(turn: Dict, max_chars: int = 160) -> str:
+    """Condense one turn into a short summary line"""
+    message = " ".join(str(turn.get("message", "")).split())
+    if len(message) > max_chars:
+        message = message[:max_chars].rsplit(" ", 1)[0] + "..."
+    return f"{turn.get('role', 'user')}: {message}"
+
+
+def merge_emergency_data(previous: Optional[Dict], update: Optional[Dict]) -> Optional[Dict]:
+    """
+    Merge newly extracted fields onto the previous extraction. Fields the
+    follow-up does not mention keep their earlier values; list fields are
+    combined without duplicates.
+    """
+    if not previous:
+        return update
+    if not update:
+        return previous
+    merged = dict(previous)
+    for key, value in update.items():
+        if value in (None, "", [], {}, "unknown", "Unknown"):
+            continue
+        if isinstance(value, list) and isinstance(merged.get(key), list):
+            merged[key] = merged[key] + [v for v in value if v not in merged[key]]
+        elif isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge_emergency_data(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+class Session:
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.turns: List[Dict] = []
+        self.summary = ""
+        self.last_extracted: Optional[Dict] = None
+        self.last_alert: Optional[Dict] = None
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+
+class Conversation:
+    """Per-request view of a session: the prompt history and prior state"""
+
+    def __init__(self, session: Optional[Session], chat_history: List[Tuple[str, str]],
+                 previous_data: Optional[Dict], previous_alert: Optional[Dict]):
+        self.session = session
+        self.chat_history = chat_history
+        self.previous_data = previous_data
+        self.previous_alert = previous_alert
+
+    @property
+    def is_follow_up(self) -> bool:
+        return bool(self.chat_history)
+
+
+class SessionStore:
+    """Bounded, expiring store of conversation sessions"""
+
+    def __init__(self, max_sessions: Optional[int] = None, ttl_seconds: Optional[float] = None,
+                 history_token_budget: Optional[int] = None, summary_token_budget: Optional[int] = None):
+        self.max_sessions = max_sessions or int(os.getenv("SESSION_MAX_SESSIONS", "10000"))
+        self.ttl_seconds = ttl_seconds or float(os.getenv("SESSION_TTL_SECONDS", "3600"))
+        self.history_token_budget = history_token_budget or int(os.getenv("SESSION_HISTORY_TOKENS", "600"))
+        self.summary_token_budget = summary_token_budget or int(os.getenv("SESSION_SUMMARY_TOKENS", "200"))
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> Session:
+        """Return the session for session_id, creating it if needed"""
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None or now - session.updated_at > self.ttl_seconds:
+                session = Session(session_id)
+                self._sessions[session_id] = session
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            return session
+
+    def begin(self, query: Any, session_id: Optional[str]) -> Conversation:
+        """
+        Build the conversation context for a new message
+
+        Args:
+            query: User's query, a transcript string or query object
+            session_id (str, optional): Session or caller ID; without one the
+                client-supplied chat_history is used and nothing is stored
+
+        Returns:
+            Conversation: Prompt history and the state from earlier turns
+        """
+        if session_id is None:
+            turns = [t for t in get_chat_history(query) if isinstance(t, dict)]
+            return Conversation(None, self._window(turns, ""), None, None)
+
+        session = self.get(session_id)
+        with session.lock:
+            # Seed a fresh session from the history the client sent
+            if not session.turns and not session.summary:
+                for turn in get_chat_history(query):
+                    if isinstance(turn, dict):
+                        self._append(session, turn.get("role", "user"), turn.get("message", ""), turn.get("timestamp"))
+                if session.turns:
+                    self._save(session)
+            history = self._window(session.turns, session.summary)
+            if session.last_extracted:
+                known = {"known_emergency_data": session.last_extracted}
+                if session.last_alert:
+                    known["services_already_alerted"] = {
+                        key: session.last_alert.get(key)
+                        for key in ("service_alerted", "alert_id", "estimated_response_time")
+                    }
+                history.insert(0, ("system", (
+                    "Information from earlier in this conversation. Only update fields the new "
+                    "message changes and do not alert the same service again: "
+                    f"{json.dumps(known, default=str)}"
+                )))
+            return Conversation(session, history, session.last_extracted, session.last_alert)
+
+    def complete(self, conversation: Conversation, query: Any, response: Dict,
+                 emergency_data: Optional[Dict], alert: Optional[Dict]):
+        """Record the exchange and the latest emergency state in the session"""
+        session = conversation.session
+        if session is None:
+            return
+        with session.lock:
+            self._append(session, "user", get_transcript(query))
+            self._append(session, "assistant", response.get("response_message", ""))
+            if emergency_data:
+                session.last_extracted = merge_emergency_data(session.last_extracted, emergency_data)
+            if alert and (alert.get("alert_sent") or alert.get("duplicate_of")):
+                session.last_alert = alert
+            session.updated_at = time.monotonic()
+            self._save(session)
+
+    def _save(self, session: Session):
+        """Persist a changed session; in-process sessions are already up to date"""
+
+    def _append(self, session: Session, role: str, message: str, timestamp: Optional[str] = None):
+        session.turns.append({
+            "role": role,
+            "message": message,
+            "timestamp": timestamp or datetime.datetime.now().isoformat()
+        })
+        self._fold_old_turns(session)
+
+    def _fold_old_turns(self, session: Session):
+        """Move turns that no longer fit the history budget into the running summary"""
+        total = sum(estimate_tokens(t["message"]) for t in session.turns)
+        while len(session.turns) > 2 and total > self.history_token_budget:
+            oldest = session.turns.pop(0)
+            total -= estimate_tokens(oldest["message"])
+            session.summary = f"{session.summary}\n{_summarize_turn(oldest)}".strip()
+        # Keep the opening exchange and the most recent lines within the budget
+        lines = session.summary.split("\n")
+        total = sum(estimate_tokens(line) for line in lines)
+        while total > self.summary_token_budget and len(lines) > PINNED_SUMMARY_LINES + 1:
+            total -= estimate_tokens(lines.pop(PINNED_SUMMARY_LINES))
+        session.summary = "\n".join(lines)
+
+    def _window(self, turns: List[Dict], summary: str) -> List[Tuple[str, str]]:
+        """Newest turns that fit the token budget, oldest first, after the summary"""
+        budget = self.history_token_budget
+        window: List[Tuple[str, str]] = []
+        for turn in reversed(turns):
+            message = str(turn.get("message", ""))
+            cost = estimate_tokens(message)
+            if cost > budget:
+                break
+            budget -= cost
+            window.append((ROLE_NAMES.get(turn.get("role"), "human"), message))
+        window.reverse()
+        if summary:
+            window.insert(0, ("system", f"Summary of earlier conversation:\n{summary}"))
+        return window
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"sessions": len(self._sessions), "max_sessions": self.max_sessions}
+
+
+SESSION_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    updated_at REAL NOT NULL,
+    state TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_updated_at ON sessions (updated_at);
+"""
+
+
+class SharedSessionStore(SessionStore):
+    """
+    SessionStore kept in the shared SQLite database, so a follow-up message
+    finds its session whichever worker process receives it. Each request
+    loads the session and writes it back when the exchange completes.
+    """
+
+    # Expired and excess sessions are swept every this many writes
+    PRUNE_EVERY = 256
+
+    def __init__(self, database: Optional[SharedDatabase] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.database = database or get_shared_database()
+        self.database.ensure_schema("sessions", SESSION_SCHEMA)
+        self._writes = 0
+
+    def get(self, session_id: str) -> Session:
+        """Load the session for session_id, or start a new one if none is active"""
+        session = Session(session_id)
+        row = self.database.connection().execute(
+            "SELECT state FROM sessions WHERE session_id = ? AND updated_at >= ?",
+            (session_id, time.time() - self.ttl_seconds)
+        ).fetchone()
+        if row is not None:
+            state = json.loads(row["state"])
+            session.turns = state["turns"]
+            session.summary = state["summary"]
+            session.last_extracted = state["last_extracted"]
+            session.last_alert = state["last_alert"]
+        return session
+
+    def _save(self, session: Session):
+        state = {
+            "turns": session.turns,
+            "summary": session.summary,
+            "last_extracted": session.last_extracted,
+            "last_alert": session.last_alert
+        }
+        now = time.time()
+        connection = self.database.connection()
+        connection.execute(
+            "INSERT OR REPLACE INTO sessions (session_id, updated_at, state) VALUES (?, ?, ?)",
+            (session.session_id, now, json.dumps(state, default=str))
+        )
+        with self._lock:
+            self._writes += 1
+            prune = self._writes % self.PRUNE_EVERY == 0
+        if prune:
+            with connection:
+                connection.execute("DELETE FROM sessions WHERE updated_at < ?", (now - self.ttl_seconds,))
+                connection.execute(
+                    "DELETE FROM sessions WHERE session_id IN ("
+                    "SELECT session_id FROM sessions ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_sessions,)
+                )
+
+    def stats(self) -> Dict:
+        count = self.database.connection().execute(
+            "SELECT COUNT(*) FROM sessions WHERE updated_at >= ?", (time.time() - self.ttl_seconds,)
+        ).fetchone()[0]
+        return {"sessions": count, "max_sessions": self.max_sessions}
+
+
+def create_session_store() -> SessionStore:
+    """Session store for the configured STATE_BACKEND"""
+    if state_backend() == SQLITE:
+        return SharedSessionStore()
+    return SessionStore()
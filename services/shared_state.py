@@ -0,0 +1,70 @@
+import os
+import sqlite3
+import threading
+from typing import Optional
+
+# Backend selection for state that has to be shared between worker
+# processes: the response/extraction/translation caches, conversation
+# sessions and the active-incident index.
+#
+# STATE_BACKEND=memory keeps everything in the process (the default, and
+# right for a single process). STATE_BACKEND=sqlite keeps it in one SQLite
+# file in WAL mode, which every worker on the host opens, so a follow-up
+# message or a duplicate report is recognised whichever worker receives it.
+
+MEMORY = "memory"
+SQLITE = "sqlite"
+
+
+def state_backend() -> str:
+    """Configured state backend, "memory" or "sqlite" """
+    backend = os.getenv("STATE_BACKEND", MEMORY).strip().lower()
+    if backend not in (MEMORY, SQLITE):
+        raise ValueError(f"Unknown STATE_BACKEND '{backend}', expected '{MEMORY}' or '{SQLITE}'")
+    return backend
+
+
+class SharedDatabase:
+    """
+    SQLite database shared by worker processes. Connections are opened per
+    thread and per process, so one inherited across a fork is never used.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._schemas = set()
+
+    def connection(self) -> sqlite3.Connection:
+        pid = os.getpid()
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != pid:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection, self._local.pid = connection, pid
+        return connection
+
+    def ensure_schema(self, name: str, schema: str):
+        """Create the tables for one user of the database, once per process"""
+        with self._schema_lock:
+            if name in self._schemas:
+                return
+            self.connection().executescript(schema)
+            self._schemas.add(name)
+
+
+_database: Optional[SharedDatabase] = None
+_database_lock = threading.Lock()
+
+
+def get_shared_database() -> SharedDatabase:
+    """Return the database named by SHARED_STATE_PATH, opened on first use"""
+    global _database
+    if _database is None:
+        with _database_lock:
+            if _database is None:
+                _database = SharedDatabase(os.getenv("SHARED_STATE_PATH", "shared_state.db"))
+    return _database
@@ -0,0 +1,322 @@
+import math
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from services.shared_state import SQLITE, SharedDatabase, get_shared_database, state_backend
+
+# In-memory spatial index of active incidents.
+# Points are bucketed per service type into a uniform lat/lon grid whose
+# cell size matches the match radius, so a radius lookup only has to scan
+# the handful of cells around the caller. Used to recognise that many
+# callers are reporting the same fire and attach them to one incident
+# instead of alerting services again.
+
+EARTH_RADIUS_METERS = 6371000
+METERS_PER_DEGREE = 111320
+
+
+def haversine_meters(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance between two points in meters"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_METERS * math.asin(math.sqrt(a))
+
+
+def _type_key(service_type) -> str:
+    """Service type as its plain value, whether given as an enum member or a string"""
+    return str(getattr(service_type, "value", service_type))
+
+
+class ActiveIncident:
+    __slots__ = ("incident_id", "service_type", "latitude", "longitude", "created_at", "last_seen",
+                 "reports", "estimated_response_time")
+
+    def __init__(self, incident_id: str, service_type: str, latitude: float, longitude: float,
+                 estimated_response_time: Optional[str], now: float):
+        self.incident_id = incident_id
+        self.service_type = service_type
+        self.latitude = latitude
+        self.longitude = longitude
+        self.created_at = now
+        self.last_seen = now
+        self.reports = 1
+        self.estimated_response_time = estimated_response_time
+
+    def to_dict(self) -> Dict:
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+
+class SpatialIndex:
+    """Grid index of active incidents for radius and time-window lookups"""
+
+    def __init__(self, radius_meters: Optional[float] = None, window_seconds: Optional[float] = None):
+        self.radius_meters = radius_meters or float(os.getenv("SPATIAL_RADIUS_METERS", "500"))
+        self.window_seconds = window_seconds or float(os.getenv("SPATIAL_WINDOW_SECONDS", "3600"))
+        self.cell_degrees = self.radius_meters / METERS_PER_DEGREE
+        self._grids: Dict[str, Dict[Tuple[int, int], List[ActiveIncident]]] = {}
+        self._by_id: Dict[str, Tuple[Tuple[int, int], ActiveIncident]] = {}
+        self._lock = threading.Lock()
+        # Expired incidents are skipped by lookups and swept out periodically
+        self.prune_interval = min(60.0, self.window_seconds / 10)
+        self._last_prune = time.time()
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def _cell(self, latitude: float, longitude: float) -> Tuple[int, int]:
+        return int(math.floor(latitude / self.cell_degrees)), int(math.floor(longitude / self.cell_degrees))
+
+    def add(self, incident_id: str, service_type: str, latitude: float, longitude: float,
+            estimated_response_time: Optional[str] = None, now: Optional[float] = None) -> ActiveIncident:
+        """Index a newly alerted incident"""
+        now = now if now is not None else time.time()
+        with self._lock:
+            return self._insert(incident_id, service_type, latitude, longitude, estimated_response_time, now)
+
+    def find_or_add(self, incident_id: str, service_type: str, latitude: float, longitude: float,
+                    estimated_response_time: Optional[str] = None,
+                    now: Optional[float] = None) -> Tuple[ActiveIncident, bool]:
+        """
+        Attach to the nearest active incident, or index a new one under
+        incident_id, as one step. Simultaneous first reports of the same
+        fire then raise a single alert.
+
+        Returns:
+            tuple: (ActiveIncident, whether it was newly added)
+        """
+        now = now if now is not None else time.time()
+        with self._lock:
+            existing = self._nearest(service_type, latitude, longitude, now)
+            if existing is not None:
+                existing.reports += 1
+                existing.last_seen = now
+                return existing, False
+            return self._insert(incident_id, service_type, latitude, longitude, estimated_response_time, now), True
+
+    def _insert(self, incident_id: str, service_type: str, latitude: float, longitude: float,
+                estimated_response_time: Optional[str], now: float) -> ActiveIncident:
+        """Index an incident; caller holds the lock"""
+        incident = ActiveIncident(incident_id, _type_key(service_type), latitude, longitude, estimated_response_time, now)
+        cell = self._cell(latitude, longitude)
+        self._grids.setdefault(incident.service_type, {}).setdefault(cell, []).append(incident)
+        self._by_id[incident_id] = (cell, incident)
+        if now - self._last_prune >= self.prune_interval:
+            self._prune(now)
+        return incident
+
+    def find_nearby(self, service_type: str, latitude: float, longitude: float,
+                    now: Optional[float] = None) -> Optional[ActiveIncident]:
+        """
+        Find the nearest active incident of the same service type within the
+        match radius and time window
+
+        Returns:
+            ActiveIncident: Closest match, or None
+        """
+        now = now if now is not None else time.time()
+        with self._lock:
+            return self._nearest(service_type, latitude, longitude, now)
+
+    def _nearest(self, service_type: str, latitude: float, longitude: float, now: float) -> Optional[ActiveIncident]:
+        """find_nearby; caller holds the lock"""
+        grid = self._grids.get(_type_key(service_type))
+        if not grid:
+            return None
+
+        # Longitude degrees shrink towards the poles, so widen the scan
+        lat_cells = 1
+        cos_lat = max(math.cos(math.radians(latitude)), 0.01)
+        lon_cells = int(math.ceil(1 / cos_lat))
+        row, col = self._cell(latitude, longitude)
+        oldest = now - self.window_seconds
+
+        best, best_distance = None, self.radius_meters
+        for r in range(row - lat_cells, row + lat_cells + 1):
+            for c in range(col - lon_cells, col + lon_cells + 1):
+                for incident in grid.get((r, c), ()):
+                    if incident.last_seen < oldest:
+                        continue
+                    distance = haversine_meters(latitude, longitude, incident.latitude, incident.longitude)
+                    if distance <= best_distance:
+                        best, best_distance = incident, distance
+        return best
+
+    def attach(self, incident: ActiveIncident, now: Optional[float] = None) -> ActiveIncident:
+        """Record another report of an existing incident, keeping it active"""
+        with self._lock:
+            incident.reports += 1
+            incident.last_seen = now if now is not None else time.time()
+        return incident
+
+    def remove(self, incident_id: str):
+        with self._lock:
+            entry = self._by_id.pop(incident_id, None)
+            if entry is None:
+                return
+            cell, incident = entry
+            bucket = self._grids[incident.service_type][cell]
+            bucket.remove(incident)
+            if not bucket:
+                del self._grids[incident.service_type][cell]
+
+    def _prune(self, now: float):
+        """Drop incidents not seen within the time window; caller holds the lock"""
+        self._last_prune = now
+        oldest = now - self.window_seconds
+        for service_type, grid in self._grids.items():
+            for cell in list(grid):
+                active = [incident for incident in grid[cell] if incident.last_seen >= oldest]
+                for incident in grid[cell]:
+                    if incident.last_seen < oldest:
+                        self._by_id.pop(incident.incident_id, None)
+                if active:
+                    grid[cell] = active
+                else:
+                    del grid[cell]
+
+
+SPATIAL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS active_incidents (
+    incident_id TEXT PRIMARY KEY,
+    service_type TEXT NOT NULL,
+    cell_row INTEGER NOT NULL,
+    cell_col INTEGER NOT NULL,
+    latitude REAL NOT NULL,
+    longitude REAL NOT NULL,
+    created_at REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    reports INTEGER NOT NULL,
+    estimated_response_time TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_active_incidents_cell ON active_incidents (service_type, cell_row, cell_col);
+CREATE INDEX IF NOT EXISTS idx_active_incidents_last_seen ON active_incidents (last_seen);
+"""
+
+
+class SharedSpatialIndex(SpatialIndex):
+    """
+    SpatialIndex kept in the shared SQLite database, so a duplicate report
+    is attached to the incident another worker process alerted. Uses the
+    same grid cells; the (service type, cell) index stands in for the
+    in-memory grid.
+    """
+
+    def __init__(self, database: Optional[SharedDatabase] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.database = database or get_shared_database()
+        self.database.ensure_schema("spatial_index", SPATIAL_SCHEMA)
+
+    def __len__(self) -> int:
+        return self.database.connection().execute(
+            "SELECT COUNT(*) FROM active_incidents WHERE last_seen >= ?", (time.time() - self.window_seconds,)
+        ).fetchone()[0]
+
+    def add(self, incident_id: str, service_type: str, latitude: float, longitude: float,
+            estimated_response_time: Optional[str] = None, now: Optional[float] = None) -> ActiveIncident:
+        now = now if now is not None else time.time()
+        incident = ActiveIncident(incident_id, _type_key(service_type), latitude, longitude, estimated_response_time, now)
+        row, col = self._cell(latitude, longitude)
+        connection = self.database.connection()
+        connection.execute(
+            "INSERT OR REPLACE INTO active_incidents VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (incident_id, incident.service_type, row, col, latitude, longitude, now, now, 1, estimated_response_time)
+        )
+        self._maybe_prune(connection, now)
+        return incident
+
+    def _maybe_prune(self, connection, now: float):
+        with self._lock:
+            prune = now - self._last_prune >= self.prune_interval
+            if prune:
+                self._last_prune = now
+        if prune:
+            connection.execute("DELETE FROM active_incidents WHERE last_seen < ?", (now - self.window_seconds,))
+
+    def find_nearby(self, service_type: str, latitude: float, longitude: float,
+                    now: Optional[float] = None) -> Optional[ActiveIncident]:
+        now = now if now is not None else time.time()
+        return self._nearest_in(self.database.connection(), service_type, latitude, longitude, now)
+
+    def find_or_add(self, incident_id: str, service_type: str, latitude: float, longitude: float,
+                    estimated_response_time: Optional[str] = None,
+                    now: Optional[float] = None) -> Tuple[ActiveIncident, bool]:
+        # BEGIN IMMEDIATE takes the write lock up front, so workers cannot
+        # both miss the lookup and both insert
+        now = now if now is not None else time.time()
+        connection = self.database.connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            existing = self._nearest_in(connection, service_type, latitude, longitude, now)
+            if existing is not None:
+                connection.execute(
+                    "UPDATE active_incidents SET reports = reports + 1, last_seen = ? WHERE incident_id = ?",
+                    (now, existing.incident_id)
+                )
+                existing.reports += 1
+                existing.last_seen = now
+            else:
+                row, col = self._cell(latitude, longitude)
+                connection.execute(
+                    "INSERT OR REPLACE INTO active_incidents VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (incident_id, _type_key(service_type), row, col, latitude, longitude, now, now, 1,
+                     estimated_response_time)
+                )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        self._maybe_prune(connection, now)
+        if existing is not None:
+            return existing, False
+        return ActiveIncident(incident_id, _type_key(service_type), latitude, longitude, estimated_response_time, now), True
+
+    def _nearest_in(self, connection, service_type: str, latitude: float, longitude: float,
+                    now: float) -> Optional[ActiveIncident]:
+        cos_lat = max(math.cos(math.radians(latitude)), 0.01)
+        lon_cells = int(math.ceil(1 / cos_lat))
+        row, col = self._cell(latitude, longitude)
+        rows = connection.execute(
+            "SELECT * FROM active_incidents WHERE service_type = ? AND cell_row BETWEEN ? AND ? "
+            "AND cell_col BETWEEN ? AND ? AND last_seen >= ?",
+            (_type_key(service_type), row - 1, row + 1, col - lon_cells, col + lon_cells, now - self.window_seconds)
+        ).fetchall()
+
+        best, best_distance = None, self.radius_meters
+        for candidate in rows:
+            distance = haversine_meters(latitude, longitude, candidate["latitude"], candidate["longitude"])
+            if distance <= best_distance:
+                best, best_distance = candidate, distance
+        if best is None:
+            return None
+        incident = ActiveIncident(best["incident_id"], best["service_type"], best["latitude"], best["longitude"],
+                                  best["estimated_response_time"], best["created_at"])
+        incident.last_seen = best["last_seen"]
+        incident.reports = best["reports"]
+        return incident
+
+    def attach(self, incident: ActiveIncident, now: Optional[float] = None) -> ActiveIncident:
+        now = now if now is not None else time.time()
+        rows = self.database.connection().execute(
+            "UPDATE active_incidents SET reports = reports + 1, last_seen = ? WHERE incident_id = ? RETURNING reports",
+            (now, incident.incident_id)
+        ).fetchall()
+        incident.reports = rows[0]["reports"] if rows else incident.reports + 1
+        incident.last_seen = now
+        return incident
+
+    def remove(self, incident_id: str):
+        self.database.connection().execute("DELETE FROM active_incidents WHERE incident_id = ?", (incident_id,))
+
+
+def create_spatial_index() -> SpatialIndex:
+    """Active-incident index for the configured STATE_BACKEND"""
+    if state_backend() == SQLITE:
+        return SharedSpatialIndex()
+    return SpatialIndex()
+
+
+# Process-wide index of incidents alerted through /api/query
+active_incidents = create_spatial_index()
@@ -1,48 +1,73 @@
-import openai
-import os
-
-openai.api_key = os.getenv("OPEN_AI_KEY")
-
-response = openai.chat.completions.create(
-    model="gpt-4o-mini",
-    messages=[
-        {"role": "user", "content": "I am hurt badly and need an ambulance right now."}
-    ],
-    functions=[
-        {
-            "name": "triage_emergency",
-            "description": "Extract emergency triage details from caller input",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "severity": {
-                        "type": "string",
-                        "enum": ["low", "medium", "high", "critical"],
-                        "description": "Severity level of the emergency"
-                    },
-                    "time_submitted": {
-                        "type": "string",
-                        "format": "date-time",
-                        "description": "Timestamp when the emergency was reported"
-                    },
-                    "service_type": {
-                        "type": "string",
-                        "enum": ["fire", "police", "ambulance", "mentalhealth", "foodbank", "other"],
-                        "description": "Type of emergency service needed"
-                    },
-                    "transcript": {
-                        "type": "string",
-                        "description": "Raw transcription of the caller's statement"
-                    }
-                },
-                "required": ["severity", "time_submitted", "service_type"]
+import json
+import sys
+import time
+from typing import Dict, Optional
+from services.openai_client import get_openai_client
+from services.metrics import record_openai_response
+from services.structured_output import repair_json
+
+# Standalone triage extraction with gpt-4o-mini.
+# Importing this module makes no network calls; run it directly to try the
+# schema against a message:
+#     python -m services.structure_transcript "I am hurt badly and need an ambulance right now."
+
+TRIAGE_MODEL = "gpt-4o-mini"
+
+TRIAGE_FUNCTION = {
+    "name": "triage_emergency",
+    "description": "Extract emergency triage details from caller input",
+    "parameters": {
+        "type": "object",
+        "properties": {
+            "severity": {
+                "type": "string",
+                "enum": ["low", "medium", "high", "critical"],
+                "description": "Severity level of the emergency"
+            },
+            "time_submitted": {
+                "type": "string",
+                "format": "date-time",
+                "description": "Timestamp when the emergency was reported"
+            },
+            "service_type": {
+                "type": "string",
+                "enum": ["fire", "police", "ambulance", "mentalhealth", "foodbank", "other"],
+                "description": "Type of emergency service needed"
+            },
+            "transcript": {
+                "type": "string",
+                "description": "Raw transcription of the caller's statement"
             }
-        }
-    ],
-    function_call={"name": "triage_emergency"}
-)
+        },
+        "required": ["severity", "time_submitted", "service_type"]
+    }
+}
+
+SAMPLE_TRANSCRIPT = "I am hurt badly and need an ambulance right now."
+
+
+def structure_transcript(transcript: str) -> Optional[Dict]:
+    """
+    Extract triage details from a caller's message
+
+    Args:
+        transcript (str): Caller's message
+
+    Returns:
+        Dict: The triage_emergency arguments, or None if they could not be parsed
+    """
+    started = time.perf_counter()
+    response = get_openai_client().chat.completions.create(
+        model=TRIAGE_MODEL,
+        messages=[{"role": "user", "content": transcript}],
+        functions=[TRIAGE_FUNCTION],
+        function_call={"name": "triage_emergency"}
+    )
+    record_openai_response(TRIAGE_MODEL, started, response)
+
+    # Extract the JSON arguments returned by the model
+    return repair_json(response.choices[0].message.function_call.arguments)
 
-# Extract the JSON arguments returned by the model
-triage_data = response.choices[0].message.function_call.arguments
 
-print(triage_data)
+if __name__ == "__main__":
+    print(json.dumps(structure_transcript(" ".join(sys.argv[1:]) or SAMPLE_TRANSCRIPT), indent=2))
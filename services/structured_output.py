@@ -0,0 +1,159 @@
+import ast
+import copy
+import json
+import re
+from typing import Any, Dict, List, Optional, Type
+from pydantic import BaseModel, ValidationError
+
+# Structured-output helpers.
+# Function/tool schemas are generated from the pydantic models, so the
+# schema the LLM fills in and the model that validates the result cannot
+# drift apart. LLM JSON that is almost valid (code fences, prose around
+# it, trailing commas, Python literals, a truncated tail) is repaired
+# locally instead of failing the request.
+
+CODE_FENCE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$", re.IGNORECASE)
+TRAILING_COMMA = re.compile(r",\s*([}\]])")
+SMART_QUOTES = str.maketrans({"“": '"', "”": '"', "‘": "'", "’": "'"})
+
+
+def _inline_refs(schema: Any, defs: Dict) -> Any:
+    """Replace $ref pointers with their definitions and drop pydantic titles"""
+    if isinstance(schema, dict):
+        if "$ref" in schema:
+            resolved = _inline_refs(copy.deepcopy(defs[schema["$ref"].split("/")[-1]]), defs)
+            # Keep a description given on the referencing field
+            if "description" in schema:
+                resolved["description"] = schema["description"]
+            return resolved
+        return {
+            key: _inline_refs(value, defs)
+            for key, value in schema.items()
+            if key not in ("title", "$defs")
+        }
+    if isinstance(schema, list):
+        return [_inline_refs(value, defs) for value in schema]
+    return schema
+
+
+def _drop_null_variants(schema: Any) -> Any:
+    """Collapse Optional[X] (anyOf X / null) to X; missing fields already mean "not provided" """
+    if isinstance(schema, dict):
+        any_of = schema.get("anyOf")
+        if any_of and len(any_of) == 2 and {"type": "null"} in any_of:
+            inner = next(option for option in any_of if option != {"type": "null"})
+            merged = {**{k: v for k, v in schema.items() if k not in ("anyOf", "default")}, **inner}
+            return _drop_null_variants(merged)
+        return {key: _drop_null_variants(value) for key, value in schema.items() if key != "default"}
+    if isinstance(schema, list):
+        return [_drop_null_variants(value) for value in schema]
+    return schema
+
+
+def model_parameters(model: Type[BaseModel], required: Optional[List[str]] = None) -> Dict:
+    """
+    JSON schema of a pydantic model in the form OpenAI function parameters expect
+
+    Args:
+        model (Type[BaseModel]): Model describing the arguments
+        required (List[str], optional): Fields the LLM must fill in, when it
+            should be asked for more than the model strictly requires
+
+    Returns:
+        Dict: Self-contained object schema
+    """
+    schema = model.model_json_schema()
+    parameters = _drop_null_variants(_inline_refs(schema, schema.get("$defs", {})))
+    parameters.pop("description", None)
+    if required is not None:
+        parameters["required"] = required
+    return parameters
+
+
+def model_function(model: Type[BaseModel], name: str, description: str,
+                   required: Optional[List[str]] = None) -> Dict:
+    """OpenAI function definition whose parameters are generated from a pydantic model"""
+    return {"name": name, "description": description, "parameters": model_parameters(model, required)}
+
+
+def _close_truncated(text: str) -> str:
+    """Close strings, arrays and objects left open by a truncated reply"""
+    stack, in_string, escaped = [], False, False
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]" and stack:
+            stack.pop()
+    if in_string:
+        text += '"'
+    text = re.sub(r'(,\s*"[^"]*"\s*:?\s*|,\s*)$', "", text.rstrip())
+    return text + "".join(reversed(stack))
+
+
+def repair_json(text: Any) -> Optional[Any]:
+    """
+    Parse JSON from an LLM reply, repairing common near-misses
+
+    Args:
+        text: Reply text, or an already parsed value
+
+    Returns:
+        The parsed value, or None if it could not be repaired
+    """
+    if not isinstance(text, str):
+        return text
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+
+    candidate = CODE_FENCE.sub("", text.translate(SMART_QUOTES)).strip()
+    start = min((i for i in (candidate.find("{"), candidate.find("[")) if i >= 0), default=-1)
+    if start < 0:
+        return None
+    candidate = candidate[start:]
+    end = max(candidate.rfind("}"), candidate.rfind("]"))
+    attempts = [candidate[:end + 1]] if end >= 0 else []
+    attempts.append(_close_truncated(candidate))
+
+    for attempt in attempts:
+        attempt = TRAILING_COMMA.sub(r"\1", attempt)
+        try:
+            return json.loads(attempt)
+        except ValueError:
+            pass
+        # Single quotes and True/False/None from Python-style dicts
+        try:
+            return ast.literal_eval(attempt)
+        except (ValueError, SyntaxError, MemoryError, RecursionError):
+            pass
+    return None
+
+
+def parse_model(model: Type[BaseModel], value: Any) -> Optional[BaseModel]:
+    """
+    Validate a reply as model, repairing the JSON first if needed
+
+    Args:
+        model (Type[BaseModel]): Expected model
+        value: Reply text or already parsed dictionary
+
+    Returns:
+        BaseModel: The validated model, or None
+    """
+    data = repair_json(value)
+    if not isinstance(data, dict):
+        return None
+    try:
+        return model.model_validate(data)
+    except ValidationError:
+        return None
@@ -1,14 +1,42 @@
 import datetime
-import json
+import logging
 import os
 from typing import Dict, List, Optional, Any, Union
-import openai
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from enum import Enum
+from services.cache import extraction_cache, extraction_cache_key
+from services.incident_store import get_incident_store, new_incident_id
+from services.incident_feed import get_incident_feed
+from services.request_context import get_current_query, get_current_dispatches
+from services.queries import get_coordinates
+from services.spatial_index import active_incidents
+from services.metrics import traced
+from services.resilience import call_with_fallback, acall_with_fallback
+from services.logging_config import log_payload
+from services.structured_output import model_function, repair_json
+from services.translation import translate_local, remember_translation
+from services.guidance import GuidanceCatalog, DEFAULT_GUIDANCE_PATH
 
-from dotenv import load_dotenv
+logger = logging.getLogger(__name__)
+
+
+def _once_per_request(kind: str, key, make):
+    """
+    The alert or report (kind "alerts" or "reports") the current request
+    already made under key, else make() it. Failed attempts are not kept.
+    """
+    dispatches = get_current_dispatches()
+    if dispatches is None:
+        return make()
+    made = getattr(dispatches, kind)
+    with dispatches.lock:
+        if key not in made:
+            result = make()
+            if "error" in result:
+                return result
+            made[key] = result
+        return dict(made[key])
 
-load_dotenv()
 
 class EmergencyServiceType(str, Enum):
     """Types of emergency services that can be alerted"""
@@ -26,26 +54,37 @@ class EmergencyServiceType(str, Enum):
     SHELTER = "shelter"
     OTHER = "other"
 
+# Next steps and response times for every service type and severity
+guidance_catalog = GuidanceCatalog(
+    os.getenv("GUIDANCE_PATH", DEFAULT_GUIDANCE_PATH),
+    service_types=[service_type.value for service_type in EmergencyServiceType],
+    reload_interval=float(os.getenv("GUIDANCE_RELOAD_INTERVAL", "5"))
+)
+
 class PersonProfile(BaseModel):
-    age: Optional[str] = None
-    gender: Optional[str] = None
-    medical_conditions: Optional[str] = None
+    age: Optional[str] = Field(None, description="Age of affected person(s)")
+    gender: Optional[str] = Field(None, description="Gender of affected person(s)")
+    medical_conditions: Optional[str] = Field(None, description="Any relevant medical conditions")
 
 class Location(BaseModel):
-    address: Optional[str] = None
-    landmarks: Optional[str] = None
-    coordinates: Optional[str] = None
+    address: Optional[str] = Field(None, description="Address where emergency is occurring")
+    landmarks: Optional[str] = Field(None, description="Nearby landmarks to help locate the emergency")
+    coordinates: Optional[str] = Field(None, description="GPS coordinates if available")
 
 class ExtractedEmergencyData(BaseModel):
-    emergency_type: EmergencyServiceType  # Type of emergency (fire, ambulance, police, etc.)
+    emergency_type: EmergencyServiceType = Field(description="Emergency service needed for the situation")
     person_profile: Optional[PersonProfile] = None
     location: Optional[Location] = None
-    time_of_incident: Optional[str] = None
-    people_affected: Optional[int] = None
-    immediate_risks: Optional[List[str]] = None
-    resources_needed: Optional[List[str]] = None
-    additional_notes: Optional[str] = None
-    severity: Optional[str] = None
+    time_of_incident: Optional[str] = Field(None, description="When the emergency occurred")
+    people_affected: Optional[int] = Field(None, description="Number of people affected by the emergency")
+    immediate_risks: Optional[List[str]] = Field(None, description="Immediate risks present in the situation")
+    resources_needed: Optional[List[str]] = Field(None, description="Resources needed to address the emergency")
+    additional_notes: Optional[str] = Field(None, description="Any additional relevant information")
+    severity: Optional[str] = Field(
+        None,
+        description="Severity level of the emergency",
+        json_schema_extra={"enum": ["low", "medium", "high", "critical"]}
+    )
     
 class ServiceInvokedResponse(BaseModel):
     alert_sent: bool
@@ -54,6 +93,8 @@ class ServiceInvokedResponse(BaseModel):
     estimated_response_time: Optional[str] = None
     alert_time: Optional[str] = None
     alert_id: Optional[str] = None
+    duplicate_of: Optional[str] = None  # alert_id of the nearby incident this report was attached to
+    reports: Optional[int] = None  # Number of reports attached to the incident
     error: Optional[str] = None
     
 class NextStepsResponse(BaseModel):
@@ -69,6 +110,7 @@ class TranslationResponse(BaseModel):
     target_language: str
     translation_time: Optional[str] = None
     translation_successful: Optional[bool] = None
+    translation_source: Optional[str] = None  # "identity", "phrasebook", "cache" or "llm"
     error: Optional[str] = None
 
 class ReportResponse(BaseModel):
@@ -80,10 +122,54 @@ class ReportResponse(BaseModel):
     report_generated: Optional[bool] = None
     error: Optional[str] = None
     
+# Function schema used to extract triage data from a transcript, generated
+# from ExtractedEmergencyData so the LLM fills in exactly what we validate
+TRIAGE_FUNCTION = model_function(
+    ExtractedEmergencyData,
+    name="triage_emergency",
+    description="Extract emergency triage details from caller input",
+    required=["emergency_type", "location", "severity"]
+)
+
+# Function schema used to extract triage data for several numbered transcripts in one call
+BATCH_TRIAGE_FUNCTION = {
+    "name": "triage_emergencies",
+    "description": "Extract emergency triage details for each numbered caller message",
+    "parameters": {
+        "type": "object",
+        "properties": {
+            "emergencies": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "index": {
+                            "type": "integer",
+                            "description": "Number of the caller message these details belong to"
+                        },
+                        **TRIAGE_FUNCTION["parameters"]["properties"]
+                    },
+                    "required": ["index"] + TRIAGE_FUNCTION["parameters"]["required"]
+                }
+            }
+        },
+        "required": ["emergencies"]
+    }
+}
+
+def _function_arguments(response) -> Dict:
+    """Arguments of the function call in an OpenAI response, repairing near-valid JSON"""
+    arguments = response.choices[0].message.function_call.arguments
+    parsed = repair_json(arguments)
+    if not isinstance(parsed, dict):
+        raise ValueError(f"Function call arguments are not a JSON object: {arguments[:200]}")
+    return parsed
+
 class EmergencyTools:
     """Tools for emergency management and response"""
     
     @staticmethod
+    @traced("tool:extract_emergency_data")
     def extract_emergency_data(transcript: str) -> ExtractedEmergencyData:
         """
         Extract structured data from emergency transcripts using AI
@@ -95,107 +181,31 @@ class EmergencyTools:
             Dict: Structured data extracted from the transcript
         """
         try:
-            print(f"Extracting emergency data from transcript: {transcript}")
-            openai.api_key = os.getenv("OPENAI_API_KEY")
+            cache_key = extraction_cache_key(transcript)
+            cached = extraction_cache.get(cache_key)
+            if cached is not None:
+                logger.debug("Extraction cache hit")
+                return cached
             
-            response = openai.chat.completions.create(
-                model="gpt-4o-mini",
+            response = call_with_fallback("gpt-4o-mini", lambda client, model: client.chat.completions.create(
+                model=model,
                 messages=[
                     {"role": "user", "content": transcript}
                 ],
-                functions=[
-                    {
-                        "name": "triage_emergency",
-                        "description": "Extract emergency triage details from caller input",
-                        "parameters": {
-                            "type": "object",
-                            "properties": {
-                                "emergency_type": {
-                                    "type": "string",
-                                    "description": "Type of emergency (fire, flood, medical emergency, etc.)"
-                                },
-                                "person_profile": {
-                                    "type": "object",
-                                    "properties": {
-                                        "age": {
-                                            "type": "string",
-                                            "description": "Age of affected person(s)"
-                                        },
-                                        "gender": {
-                                            "type": "string",
-                                            "description": "Gender of affected person(s)"
-                                        },
-                                        "medical_conditions": {
-                                            "type": "string",
-                                            "description": "Any relevant medical conditions"
-                                        }
-                                    }
-                                },
-                                "location": {
-                                    "type": "object",
-                                    "properties": {
-                                        "address": {
-                                            "type": "string",
-                                            "description": "Address where emergency is occurring"
-                                        },
-                                        "landmarks": {
-                                            "type": "string",
-                                            "description": "Nearby landmarks to help locate the emergency"
-                                        },
-                                        "coordinates": {
-                                            "type": "string",
-                                            "description": "GPS coordinates if available"
-                                        }
-                                    }
-                                },
-                                "time_of_incident": {
-                                    "type": "string",
-                                    "description": "When the emergency occurred"
-                                },
-                                "people_affected": {
-                                    "type": "integer",
-                                    "description": "Number of people affected by the emergency"
-                                },
-                                "immediate_risks": {
-                                    "type": "array",
-                                    "items": {
-                                        "type": "string"
-                                    },
-                                    "description": "Immediate risks present in the situation"
-                                },
-                                "resources_needed": {
-                                    "type": "array",
-                                    "items": {
-                                        "type": "string"
-                                    },
-                                    "description": "Resources needed to address the emergency"
-                                },
-                                "additional_notes": {
-                                    "type": "string",
-                                    "description": "Any additional relevant information"
-                                },
-                                "severity": {
-                                    "type": "string",
-                                    "enum": ["low", "medium", "high", "critical"],
-                                    "description": "Severity level of the emergency"
-                                }
-                            },
-                            "required": ["emergency_type", "location", "severity"]
-                        }
-                    }
-                ],
+                functions=[TRIAGE_FUNCTION],
                 function_call={"name": "triage_emergency"}
-            )
+            ))
             
-            print(f"OpenAI response: {response}")
+            log_payload(logger, "OpenAI response", response)
             # Extract the JSON arguments returned by the model
-            triage_data = json.loads(response.choices[0].message.function_call.arguments)
-            print(f"Extracted emergency data: {triage_data}")
+            triage_data = _function_arguments(response)
+            log_payload(logger, "Extracted emergency data", triage_data)
+            extraction_cache.set(cache_key, triage_data)
             # Convert to a dictionary for easy serialization
             return triage_data
             
         except Exception as e:
-            print(f"Error extracting emergency data: {e}")
+            logger.error("Error extracting emergency data: %s", e)
             return {
                 "error": str(e),
                 "severity": "unknown",
@@ -204,6 +214,103 @@ class EmergencyTools:
             }
     
     @staticmethod
+    @traced("tool:extract_emergency_data_batch")
+    def extract_emergency_data_batch(transcripts: List[str]) -> List[Optional[Dict]]:
+        """
+        Extract structured data for several transcripts in a single LLM call.
+        Results are stored in the extraction cache, so later calls to
+        extract_emergency_data for the same transcripts skip the LLM.
+        
+        Args:
+            transcripts (List[str]): Transcript texts from emergency calls/messages
+            
+        Returns:
+            List[Optional[Dict]]: Extracted data per transcript, None where extraction failed
+        """
+        results = [None] * len(transcripts)
+        pending = []
+        for i, transcript in enumerate(transcripts):
+            cached = extraction_cache.get(extraction_cache_key(transcript))
+            if cached is not None:
+                results[i] = cached
+            else:
+                pending.append(i)
+        
+        if not pending:
+            return results
+        
+        try:
+            numbered = "\n".join(f"{n}. {transcripts[i]}" for n, i in enumerate(pending, start=1))
+            logger.info("Extracting emergency data for %d transcripts in one call", len(pending))
+            
+            response = call_with_fallback("gpt-4o-mini", lambda client, model: client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": "Each numbered line is a separate caller message. Extract triage details for every message."},
+                    {"role": "user", "content": numbered}
+                ],
+                functions=[BATCH_TRIAGE_FUNCTION],
+                function_call={"name": "triage_emergencies"}
+            ))
+            
+            emergencies = _function_arguments(response).get("emergencies", [])
+            for triage_data in emergencies:
+                n = triage_data.pop("index", None)
+                if not isinstance(n, int) or not 1 <= n <= len(pending):
+                    continue
+                i = pending[n - 1]
+                results[i] = triage_data
+                extraction_cache.set(extraction_cache_key(transcripts[i]), triage_data)
+            
+        except Exception as e:
+            logger.error("Error extracting emergency data in batch: %s", e)
+        
+        return results
+    
+    @staticmethod
+    @traced("tool:extract_emergency_data")
+    async def aextract_emergency_data(transcript: str) -> ExtractedEmergencyData:
+        """
+        Async twin of extract_emergency_data using the async OpenAI client
+        
+        Args:
+            transcript (str): The transcript text from emergency call/message
+            
+        Returns:
+            Dict: Structured data extracted from the transcript
+        """
+        try:
+            cache_key = extraction_cache_key(transcript)
+            cached = extraction_cache.get(cache_key)
+            if cached is not None:
+                logger.debug("Extraction cache hit")
+                return cached
+            
+            response = await acall_with_fallback("gpt-4o-mini", lambda client, model: client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "user", "content": transcript}
+                ],
+                functions=[TRIAGE_FUNCTION],
+                function_call={"name": "triage_emergency"}
+            ))
+            
+            triage_data = _function_arguments(response)
+            log_payload(logger, "Extracted emergency data", triage_data)
+            extraction_cache.set(cache_key, triage_data)
+            return triage_data
+            
+        except Exception as e:
+            logger.error("Error extracting emergency data: %s", e)
+            return {
+                "error": str(e),
+                "severity": "unknown",
+                "emergency_type": "unknown",
+                "time_of_incident": datetime.datetime.now().isoformat()
+            }
+    
+    @staticmethod
+    @traced("tool:alert_emergency_services")
     def alert_emergency_services(emergency_data: ExtractedEmergencyData) -> ServiceInvokedResponse:
         """
         Alert relevant emergency services based on the emergency data
@@ -214,42 +321,66 @@ class EmergencyTools:
         Returns:
             ServiceInvokedResponse: Response from emergency services
         """
+        # An overrunning agent run and the fallback answering the same
+        # request share one alert per service
+        service = getattr(emergency_data.emergency_type, "value", emergency_data.emergency_type)
+        return _once_per_request("alerts", service, lambda: EmergencyTools._send_alert(emergency_data))
+    
+    @staticmethod
+    def _send_alert(emergency_data: ExtractedEmergencyData) -> ServiceInvokedResponse:
         # In a production environment, this would integrate with emergency service APIs
         try:
-            print(f"Received request: {emergency_data}")
+            log_payload(logger, "Alert request", emergency_data)
             emergency_type = emergency_data.emergency_type
             severity = emergency_data.severity
+            estimated_response_time = guidance_catalog.get(emergency_type, severity).estimated_response_time
             
-           
+            alert_id = new_incident_id("EM")
             
-            # Simulate different response times based on severity
-            response_times = {
-                "critical": "2-5 minutes",
-                "high": "5-10 minutes",
-                "medium": "10-20 minutes",
-                "low": "30-60 minutes",
-                "unknown": "unknown"
-            }
+            # Attach to an open incident of the same type nearby instead of
+            # alerting again. Finding and reserving are one step, so callers
+            # reporting the same fire at the same moment raise one alert
+            coordinates = get_coordinates(get_current_query())
+            if coordinates is not None:
+                incident, created = active_incidents.find_or_add(
+                    alert_id, emergency_type, *coordinates, estimated_response_time
+                )
+                if not created:
+                    get_incident_feed().publish_attached(incident, severity)
+                    return {
+                        "alert_sent": False,
+                        "service_alerted": emergency_type,
+                        "severity_reported": severity,
+                        "estimated_response_time": incident.estimated_response_time,
+                        "alert_time": datetime.datetime.now().isoformat(),
+                        "alert_id": incident.incident_id,
+                        "duplicate_of": incident.incident_id,
+                        "reports": incident.reports
+                    }
             
             response = {
                 "alert_sent": True,
                 "service_alerted": emergency_type,
                 "severity_reported": severity,
-                "estimated_response_time": response_times.get(severity, "unknown"),
+                "estimated_response_time": estimated_response_time,
                 "alert_time": datetime.datetime.now().isoformat(),
-                "alert_id": f"EM-{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}"
+                "alert_id": alert_id
             }
             
+            # Push the new incident to dispatcher consoles; only queued here
+            get_incident_feed().publish_alert(response, coordinates)
+            
             return response
             
         except Exception as e:
-            print(f"Error alerting emergency services: {e}")
+            logger.error("Error alerting emergency services: %s", e)
             return {
                 "alert_sent": False,
                 "error": str(e)
             }
     
     @staticmethod
+    @traced("tool:generate_report")
     def generate_report(emergency_data: ExtractedEmergencyData, response_data: Optional[ServiceInvokedResponse] = None) -> ReportResponse:
         """
         Generate a comprehensive report of the emergency and response
@@ -261,25 +392,43 @@ class EmergencyTools:
         Returns:
             ReportResponse: Comprehensive report data
         """
+        response_details = response_data if response_data else {}
+        if isinstance(response_details, BaseModel):
+            response_details = response_details.model_dump()
+        # One incident row per alert of a request, however many runs report it
+        return _once_per_request(
+            "reports", response_details.get("alert_id"),
+            lambda: EmergencyTools._store_report(emergency_data, response_details)
+        )
+    
+    @staticmethod
+    def _store_report(emergency_data: ExtractedEmergencyData, response_details: Dict) -> ReportResponse:
         try:
             report = {
-                "report_id": f"RPT-{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}",
+                "report_id": new_incident_id("RPT"),
                 "generated_at": datetime.datetime.now().isoformat(),
                 "emergency_details": emergency_data,
-                "response_details": response_data if response_data else {},
-                "status": "open"
+                "response_details": response_details,
+                # Reports of an incident that is already being handled
+                "status": "attached" if response_details.get("duplicate_of") else "open"
             }
             
+            # Persist the incident and push it to dispatchers; both are done off the request thread
+            coordinates = get_coordinates(get_current_query())
+            get_incident_store().record_report(report, coordinates=coordinates)
+            get_incident_feed().publish_report(report, coordinates=coordinates)
+            
             return report
             
         except Exception as e:
-            print(f"Error generating report: {e}")
+            logger.error("Error generating report: %s", e)
             return {
                 "error": str(e),
                 "report_generated": False
             }
     
     @staticmethod
+    @traced("tool:find_next_steps")
     def find_next_steps(emergency_data: ExtractedEmergencyData, services_response: ServiceInvokedResponse) -> NextStepsResponse:
         """
         Determine recommended next steps based on emergency data
@@ -292,67 +441,26 @@ class EmergencyTools:
             NextStepsResponse: Recommended next steps
         """
         try:
-            print(f"Finding next steps for: {emergency_data}")
-            service_type = emergency_data.emergency_type
-            severity = emergency_data.severity
-            services_alerted = services_response.service_alerted
-            
-            # Define common next steps based on emergency type
-            next_steps = {
-                "fire": [
-                    "Evacuate the building immediately",
-                    "Call 911 if not already done",
-                    "Move to a safe distance",
-                    "Do not re-enter until cleared by authorities"
-                ],
-                "police": [
-                    "Stay in a safe location",
-                    "Cooperate with authorities",
-                    "Document any relevant details"
-                ],
-                "ambulance": [
-                    "Stay on the line with emergency services",
-                    "Follow first aid instructions if provided",
-                    "Clear a path for emergency responders",
-                    "Have medical information ready if available"
-                ],
-                "mentalhealth": [
-                    "Stay on the line with the crisis counselor",
-                    "Remove any dangerous objects from vicinity",
-                    "Focus on breathing and grounding techniques",
-                    "Have a trusted person join if possible"
-                ],
-                "foodbank": [
-                    "Document current food supplies",
-                    "Identify dietary restrictions",
-                    "Prepare for delivery or pickup instructions"
-                ],
-                "other": [
-                    "Stay calm",
-                    "Follow instructions from authorities",
-                    "Document the situation"
-                ]
-            }
-            
-            # Add severity-specific recommendations
-            if severity == "critical":
-                next_steps.get(service_type, next_steps["other"]).insert(0, "This is a CRITICAL situation - act immediately")
+            log_payload(logger, "Finding next steps", emergency_data)
+            guidance = guidance_catalog.get(emergency_data.emergency_type, emergency_data.severity)
             
+            # The steps tuple is shared by every request with this type and severity
             return {
-                "recommended_steps": next_steps.get(service_type, next_steps["other"]),
-                "priority": severity,
-                "follow_up_required": severity in ["critical", "high"],
-                "additional_notes": "Ensure to keep communication lines open with emergency services"
+                "recommended_steps": guidance.steps,
+                "priority": guidance.priority,
+                "follow_up_required": guidance.follow_up_required,
+                "additional_notes": guidance.additional_notes
             }
             
         except Exception as e:
-            print(f"Error finding next steps: {e}")
+            logger.error("Error finding next steps: %s", e)
             return {
                 "error": str(e),
                 "recommended_steps": ["Contact emergency services directly"]
             }
     
     @staticmethod
+    @traced("tool:translate_to_language")
     def translate_to_language(text: str, target_language: str) -> TranslationResponse:
         """
         Translate text to the specified language
@@ -365,29 +473,83 @@ class EmergencyTools:
             TranslationResponse: Translation results
         """
         try:
-            openai.api_key = os.getenv("OPENAI_API_KEY")
+            # Fixed strings and repeated text are translated locally
+            local = translate_local(text, target_language)
+            if local is not None:
+                translated_text, source = local
+            else:
+                # Using OpenAI for novel free text, falling back to gpt-4o-mini
+                response = call_with_fallback("gpt-4o", lambda client, model: client.chat.completions.create(
+                    model=model,
+                    messages=[
+                        {"role": "system", "content": f"You are a translator. Translate the following text to {target_language}:"},
+                        {"role": "user", "content": text}
+                    ]
+                ))
+                translated_text = response.choices[0].message.content
+                remember_translation(text, target_language, translated_text)
+                source = "llm"
             
-            # Using OpenAI for translation
-            response = openai.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": f"You are a translator. Translate the following text to {target_language}:"},
-                    {"role": "user", "content": text}
-                ]
-            )
+            return {
+                "original_text": text,
+                "translated_text": translated_text,
+                "target_language": target_language,
+                "translation_time": datetime.datetime.now().isoformat(),
+                "translation_successful": True,
+                "translation_source": source
+            }
             
-            translated_text = response.choices[0].message.content
+        except Exception as e:
+            logger.error("Error translating text: %s", e)
+            return {
+                "error": str(e),
+                "original_text": text,
+                "target_language": target_language,
+                "translation_successful": False
+            }
+    
+    @staticmethod
+    @traced("tool:translate_to_language")
+    async def atranslate_to_language(text: str, target_language: str) -> TranslationResponse:
+        """
+        Async twin of translate_to_language using the async OpenAI client
+        
+        Args:
+            text (str): Text to translate
+            target_language (str): Target language code (e.g., "es" for Spanish)
+            
+        Returns:
+            TranslationResponse: Translation results
+        """
+        try:
+            # Fixed strings and repeated text are translated locally
+            local = translate_local(text, target_language)
+            if local is not None:
+                translated_text, source = local
+            else:
+                # Using OpenAI for novel free text, falling back to gpt-4o-mini
+                response = await acall_with_fallback("gpt-4o", lambda client, model: client.chat.completions.create(
+                    model=model,
+                    messages=[
+                        {"role": "system", "content": f"You are a translator. Translate the following text to {target_language}:"},
+                        {"role": "user", "content": text}
+                    ]
+                ))
+                translated_text = response.choices[0].message.content
+                remember_translation(text, target_language, translated_text)
+                source = "llm"
             
             return {
                 "original_text": text,
                 "translated_text": translated_text,
                 "target_language": target_language,
                 "translation_time": datetime.datetime.now().isoformat(),
-                "translation_successful": True
+                "translation_successful": True,
+                "translation_source": source
             }
             
         except Exception as e:
-            print(f"Error translating text: {e}")
+            logger.error("Error translating text: %s", e)
             return {
                 "error": str(e),
                 "original_text": text,
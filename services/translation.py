@@ -0,0 +1,252 @@
+import re
+from typing import List, Optional, Tuple
+from services.cache import translation_cache, translation_cache_key
+
+# Local Māori/English language detection and translation of fixed text.
+# Everything the service itself emits (alert confirmations, next steps,
+# standard responses) comes from a small set of strings, so those are
+# translated from a phrasebook and sentence templates. Free text is looked
+# up in the translation cache; only novel free text needs the LLM.
+
+ENGLISH = "en"
+MAORI = "mi"
+
+LANGUAGE_ALIASES = {
+    "en": ENGLISH, "eng": ENGLISH, "english": ENGLISH,
+    "mi": MAORI, "mri": MAORI, "maori": MAORI, "māori": MAORI, "te reo": MAORI, "te reo māori": MAORI,
+    "te reo maori": MAORI, "reo": MAORI,
+}
+
+# Common Māori words, including ones that also look like English (he, i, e)
+MAORI_WORDS = frozenset([
+    "te", "ngā", "nga", "kei", "ana", "ahau", "au", "koe", "ia", "mātou", "tātou", "tōku", "toku", "taku",
+    "tāku", "tōna", "tana", "kua", "kāore", "kaore", "kia", "ki", "i", "e", "he", "mai", "atu", "ake",
+    "tēnei", "tenei", "tērā", "ko", "nō", "no", "mō", "mo", "rawa", "tonu", "whare", "wai", "ahi",
+    "āwhina", "awhina", "tamariki", "tangata", "tāngata", "mātua", "pāpā", "māmā", "hoa", "waka",
+    "kai", "moana", "whenua", "huarahi", "tūroro", "pirihimana", "hinga", "wera", "auahi", "ināianei",
+])
+ENGLISH_WORDS = frozenset([
+    "the", "and", "is", "are", "was", "my", "me", "we", "you", "to", "of", "in", "on", "at", "it",
+    "help", "please", "not", "there", "has", "have", "with", "our", "he", "she", "a", "an", "i",
+])
+# Short words common in both languages; they count for neither
+AMBIGUOUS_WORDS = frozenset(["no", "he", "i", "e", "a", "me", "to", "mo", "ana"])
+# Evidence needed before text is treated as Māori: a macron, or this many
+# distinctively Māori words. Word shapes alone never make text Māori, since
+# many short English words ("one", "here", "home") are valid Māori syllables
+MIN_MAORI_WORDS = 2
+MACRON = re.compile(r"[āēīōū]")
+# Letters that never occur in Māori words ("g" only appears in "ng")
+NON_MAORI_LETTERS = re.compile(r"[bcdfjlqsvxyz]|(?<!n)g")
+MAORI_SYLLABLES = re.compile(r"^(?:(?:ng|wh|[hkmnprtw])?[aeiouāēīōū])+$")
+WORD = re.compile(r"[a-zāēīōū']+")
+
+
+def detect_language(text: str) -> str:
+    """
+    Classify text as Māori or English from word shapes and common words.
+    English is the default: short or mixed messages without clear Māori
+    evidence are answered in English.
+
+    Args:
+        text (str): Caller's message
+
+    Returns:
+        str: "mi" for Māori, otherwise "en"
+    """
+    maori, english = 0.0, 0.0
+    evidence = 0
+    for word in WORD.findall((text or "").lower()):
+        if word in AMBIGUOUS_WORDS:
+            continue
+        if MACRON.search(word):
+            maori += 2
+            evidence += MIN_MAORI_WORDS
+        elif NON_MAORI_LETTERS.search(word):
+            english += 1
+        elif word in MAORI_WORDS and word not in ENGLISH_WORDS:
+            maori += 1
+            evidence += 1
+        elif word in ENGLISH_WORDS:
+            english += 1
+        elif MAORI_SYLLABLES.match(word):
+            maori += 0.5
+    return MAORI if evidence >= MIN_MAORI_WORDS and maori > english else ENGLISH
+
+
+def normalize_language(language: str) -> Optional[str]:
+    """Language code for a name or code such as "Maori" or "mi", or None if unsupported"""
+    return LANGUAGE_ALIASES.get((language or "").strip().lower())
+
+
+SERVICE_NAMES_MI = {
+    "ambulance": "waka tūroro",
+    "fire": "tinei ahi",
+    "police": "pirihimana",
+    "medevac": "waka rererangi tūroro",
+    "coastguard": "kaitiaki takutai",
+    "mountain rescue": "whakaora maunga",
+    "hazmat": "matū mōrearea",
+    "mentalhealth": "hauora hinengaro",
+    "animal control": "kararehe",
+    "disaster response": "urupare parekura",
+    "foodbank": "pātaka kai",
+    "shelter": "whare noho",
+    "other": "ohotata",
+}
+
+RESPONSE_TIMES_MI = {
+    "2-5 minutes": "2-5 meneti",
+    "5-10 minutes": "5-10 meneti",
+    "10-20 minutes": "10-20 meneti",
+    "30-60 minutes": "30-60 meneti",
+    "unknown": "kāore i te mōhiotia",
+    "None": "kāore i te mōhiotia",
+}
+
+# Fixed English sentences the service emits, without trailing punctuation.
+# Steps added to lib/guidance.json need an entry here to be replied to in
+# te reo without an LLM translation.
+PHRASEBOOK_MI = {
+    "We could not alert emergency services automatically, please call 111":
+        "Kāore i taea te whakamōhio aunoa i ngā ratonga ohotata, waea atu ki 111",
+    "Ensure to keep communication lines open with emergency services":
+        "Kia tuwhera tonu te whakawhitiwhiti kōrero ki ngā ratonga ohotata",
+    "This is a CRITICAL situation - act immediately": "He āhuatanga TINO NUI tēnei - mahia wawetia",
+    "Contact emergency services directly": "Whakapā tōtika atu ki ngā ratonga ohotata",
+    "Evacuate the building immediately": "Puta wawe i te whare",
+    "Call 911 if not already done": "Waea atu ki 911 mēnā kāore anō kia pērā",
+    "Move to a safe distance": "Nuku atu ki tētahi wāhi haumaru",
+    "Do not re-enter until cleared by authorities": "Kaua e hoki ki roto kia whakaaetia rā anō e ngā mana whakahaere",
+    "Stay in a safe location": "Noho ki tētahi wāhi haumaru",
+    "Cooperate with authorities": "Mahi tahi me ngā mana whakahaere",
+    "Document any relevant details": "Tuhia ngā kōrero whai take katoa",
+    "Stay on the line with emergency services": "Kaua e whakairi i te waea ki ngā ratonga ohotata",
+    "Follow first aid instructions if provided": "Whāia ngā tohutohu whakaora tuatahi mēnā ka hoatu",
+    "Clear a path for emergency responders": "Whakawāteatia he ara mō ngā kaiurupare ohotata",
+    "Have medical information ready if available": "Kia rite ngā kōrero hauora mēnā kei a koe",
+    "Stay on the line with the crisis counselor": "Kaua e whakairi i te waea ki te kaitohutohu",
+    "Remove any dangerous objects from vicinity": "Tangohia ngā taonga mōrearea i te takiwā",
+    "Focus on breathing and grounding techniques": "Aro atu ki te hā me ngā tikanga whakatau",
+    "Have a trusted person join if possible": "Mēnā ka taea, karangatia mai tētahi tangata e whakawhirinakitia ana",
+    "Document current food supplies": "Tuhia ngā kai kei a koe ināianei",
+    "Identify dietary restrictions": "Tautuhia ngā here kai",
+    "Prepare for delivery or pickup instructions": "Kia rite mō ngā tohutohu tuku, tiki rānei",
+    "Keep the patient still and warm": "Kia noho tātika, kia mahana te tūroro",
+    "Clear an open landing area if you can do so safely": "Mēnā he haumaru, whakawāteatia he wāhi tau mō te waka rererangi",
+    "Stay with the vessel or anything that floats": "Noho tata ki te waka, ki tētahi mea e mānu ana rānei",
+    "Put on a life jacket if you have one": "Kuhuna he koti whakaora mēnā kei a koe",
+    "Keep your phone dry and switched on": "Kia maroke, kia kā tonu tō waea",
+    "Signal rescuers with a light or bright clothing": "Tohua ngā kaiwhakaora ki te rama, ki ngā kākahu kanapa rānei",
+    "Stay where you are unless it is unsafe": "Noho ki tōu wāhi ki te kore he mōrearea",
+    "Keep warm and sheltered from the weather": "Kia mahana, kia whakamarumarutia i te huarere",
+    "Save your phone battery": "Tiakina te pūhiko o tō waea",
+    "Make yourself visible to rescuers": "Kia kitea koe e ngā kaiwhakaora",
+    "Move upwind and away from the substance": "Nuku atu ki te hau whakawhiti, ki tawhiti i te matū",
+    "Do not touch or breathe in the substance": "Kaua e pā, e hā rānei i te matū",
+    "Keep other people away from the area": "Kia noho mamao ētahi atu i te wāhi",
+    "Remove contaminated clothing if safe to do so": "Mēnā he haumaru, tangohia ngā kākahu kua poke",
+    "Keep a safe distance from the animal": "Kia noho mamao i te kararehe",
+    "Keep children and pets away": "Kia noho mamao ngā tamariki me ngā mōkai",
+    "Do not try to catch or feed the animal": "Kaua e ngana ki te hopu, ki te whāngai rānei i te kararehe",
+    "Follow instructions from civil defence": "Whāia ngā tohutohu a te Rākau Whakamarumaru",
+    "Move to higher ground or a safe area": "Nuku atu ki te whenua teitei, ki tētahi wāhi haumaru rānei",
+    "Check on neighbours if safe to do so": "Mēnā he haumaru, tirohia ō hoa noho tata",
+    "Keep your emergency kit with you": "Kia mau tonu ki tō kete ohotata",
+    "Stay somewhere safe and warm for now": "Noho ki tētahi wāhi haumaru, mahana hoki mō nāianei",
+    "Bring identification and any medication": "Mauria mai he tuakiri me ō rongoā",
+    "Prepare for pickup or directions to the shelter": "Kia rite mō te tiki, mō ngā tohutohu ki te whare noho rānei",
+    "Stay calm": "Kia mārie",
+    "Follow instructions from authorities": "Whāia ngā tohutohu a ngā mana whakahaere",
+    "Document the situation": "Tuhia te āhuatanga",
+}
+PHRASEBOOK_EN = {maori: english for english, maori in PHRASEBOOK_MI.items()}
+
+# Sentences with a variable part: (English pattern, Māori template, whether the variable is known)
+TEMPLATES_MI = [
+    (re.compile(r"^(.+) services have been alerted$", re.IGNORECASE),
+     lambda m: f"Kua whakamōhiotia ngā ratonga {SERVICE_NAMES_MI.get(m.group(1).lower())}",
+     lambda m: m.group(1).lower() in SERVICE_NAMES_MI),
+    (re.compile(r"^(.+) services are already responding to this incident$", re.IGNORECASE),
+     lambda m: f"Kei te urupare kē ngā ratonga {SERVICE_NAMES_MI.get(m.group(1).lower())} ki tēnei aitua",
+     lambda m: m.group(1).lower() in SERVICE_NAMES_MI),
+    (re.compile(r"^Estimated response time: (.+)$", re.IGNORECASE),
+     lambda m: f"Te wā tae mai: {RESPONSE_TIMES_MI.get(m.group(1))}",
+     lambda m: m.group(1) in RESPONSE_TIMES_MI),
+]
+
+SENTENCE = re.compile(r"(?<=[.!?])\s+")
+
+
+def _translate_sentence(sentence: str, target: str) -> Optional[str]:
+    body = sentence.strip()
+    ending = body[-1] if body and body[-1] in ".!?" else ""
+    body = body.rstrip(".!? ")
+    if target == MAORI:
+        if body in PHRASEBOOK_MI:
+            return PHRASEBOOK_MI[body] + ending
+        for pattern, template, applies in TEMPLATES_MI:
+            match = pattern.match(body)
+            if match and applies(match):
+                return template(match) + ending
+    elif target == ENGLISH and body in PHRASEBOOK_EN:
+        return PHRASEBOOK_EN[body] + ending
+    return None
+
+
+def phrasebook_translate(text: str, target_language: str) -> Optional[str]:
+    """
+    Translate text made entirely of known phrases and templates
+
+    Args:
+        text (str): Text to translate, one or more sentences
+        target_language (str): "mi" or "en"
+
+    Returns:
+        str: The translation, or None if any sentence is not covered
+    """
+    sentences = [s for s in SENTENCE.split((text or "").strip()) if s]
+    if not sentences:
+        return None
+    translated = [_translate_sentence(sentence, target_language) for sentence in sentences]
+    if any(t is None for t in translated):
+        return None
+    return " ".join(translated)
+
+
+def translate_local(text: str, target_language: str) -> Optional[Tuple[str, str]]:
+    """
+    Translate without the LLM where possible
+
+    Args:
+        text (str): Text to translate
+        target_language (str): Target language name or code
+
+    Returns:
+        Tuple[str, str]: (translated text, source) where source is
+        "identity", "phrasebook" or "cache"; None if the LLM is needed
+    """
+    target = normalize_language(target_language)
+    if target is not None:
+        if detect_language(text) == target:
+            return text, "identity"
+        translated = phrasebook_translate(text, target)
+        if translated is not None:
+            return translated, "phrasebook"
+    cached = translation_cache.get(translation_cache_key(text, target or target_language.strip().lower()))
+    if cached is not None:
+        return cached, "cache"
+    return None
+
+
+def remember_translation(text: str, target_language: str, translated_text: str):
+    """Cache an LLM translation of free text"""
+    target = normalize_language(target_language) or target_language.strip().lower()
+    translation_cache.set(translation_cache_key(text, target), translated_text)
+
+
+def localize_steps(steps: List[str], language: str) -> List[str]:
+    """Translate fixed next-step strings, keeping any without a phrasebook entry as they are"""
+    if language != MAORI:
+        return list(steps)
+    return [phrasebook_translate(step, MAORI) or step for step in steps]
@@ -0,0 +1,194 @@
+import os
+import re
+from typing import Dict, List, Optional
+from pydantic import BaseModel
+from services.tools import EmergencyServiceType
+
+# Local rule-based pre-classifier.
+# Maps clear-cut transcripts ("house on fire at 12 X St") to a service type
+# and severity without an LLM round trip. Anything ambiguous - no keyword
+# hit, several competing services, questions - gets a low confidence and is
+# left to the agent. One generic word ("fire", "smoke", "injured") is not
+# enough to dispatch on: with the default threshold a transcript needs two
+# distinct service cues, or one plus a critical cue ("not breathing",
+# "people inside"). Those generic words are both service and high-severity
+# keywords, so only critical severity adds confidence and they never count
+# twice.
+
+SERVICE_KEYWORDS = {
+    EmergencyServiceType.FIRE: [
+        "fire", "on fire", "smoke", "burning", "flames", "blaze", "house fire", "bushfire", "scrub fire"
+    ],
+    EmergencyServiceType.AMBULANCE: [
+        "ambulance", "heart attack", "not breathing", "unconscious", "bleeding", "chest pain",
+        "overdose", "stroke", "seizure", "collapsed", "choking", "broken leg", "broken arm",
+        "injured", "hurt badly", "allergic reaction", "giving birth"
+    ],
+    EmergencyServiceType.POLICE: [
+        "police", "robbery", "burglar", "burglary", "break-in", "breaking in", "intruder", "stolen",
+        "assault", "assaulted", "gun", "knife", "weapon", "stabbed", "shooting", "domestic violence",
+        "being followed", "threatening me"
+    ],
+    EmergencyServiceType.MEDEVAC: [
+        "medevac", "airlift", "helicopter", "rescue helicopter"
+    ],
+    EmergencyServiceType.COASTGUARD: [
+        "coastguard", "drowning", "capsized", "overboard", "boat sinking", "swept out", "rip current",
+        "stranded at sea"
+    ],
+    EmergencyServiceType.MOUNTAIN_RESCUE: [
+        "mountain rescue", "lost on the mountain", "lost hiking", "lost tramping", "tramping",
+        "avalanche", "fallen climber", "stuck on the track", "lost in the bush"
+    ],
+    EmergencyServiceType.HAZMAT: [
+        "hazmat", "gas leak", "chemical spill", "chemical", "toxic fumes", "fumes", "leaking tanker",
+        "smell gas"
+    ],
+    EmergencyServiceType.MENTAL_HEALTH: [
+        "suicide", "suicidal", "kill myself", "end my life", "self harm", "self-harm",
+        "panic attack", "mental health", "can't cope", "hopeless"
+    ],
+    EmergencyServiceType.ANIMAL_CONTROL: [
+        "dog attack", "attacked by a dog", "stray dog", "loose dog", "wandering stock", "dangerous animal"
+    ],
+    EmergencyServiceType.DISASTER_RESPONSE: [
+        "flood", "flooding", "flooded", "earthquake", "landslide", "slip", "tsunami", "cyclone",
+        "storm damage", "tornado"
+    ],
+    EmergencyServiceType.FOOD_BANK: [
+        "foodbank", "food bank", "food parcel", "no food", "hungry", "can't afford food", "starving"
+    ],
+    EmergencyServiceType.SHELTER: [
+        "shelter", "homeless", "nowhere to sleep", "nowhere to stay", "evicted", "emergency housing"
+    ],
+}
+
+SEVERITY_KEYWORDS = {
+    "critical": [
+        "not breathing", "unconscious", "trapped", "dying", "heart attack", "gun", "shooting", "stabbed",
+        "kill myself", "suicide", "end my life", "explosion", "drowning", "house on fire",
+        "on fire", "spreading", "can't breathe", "cannot breathe", "right now", "people inside",
+        "children inside", "kids inside"
+    ],
+    "high": [
+        "bleeding", "fire", "smoke", "assault", "assaulted", "intruder", "chest pain", "broken",
+        "injured", "hurt badly", "gas leak", "flooding", "flooded", "collapsed", "overdose", "seizure",
+        "urgent", "help me", "emergency"
+    ],
+    "low": [
+        "no food", "food parcel", "hungry", "stray", "wandering stock", "nowhere to sleep",
+        "not urgent", "when you can"
+    ],
+}
+
+# Severity used when the transcript names a service but not how bad it is
+DEFAULT_SEVERITY = {
+    EmergencyServiceType.FIRE: "high",
+    EmergencyServiceType.AMBULANCE: "high",
+    EmergencyServiceType.POLICE: "high",
+    EmergencyServiceType.MEDEVAC: "critical",
+    EmergencyServiceType.COASTGUARD: "critical",
+    EmergencyServiceType.MOUNTAIN_RESCUE: "high",
+    EmergencyServiceType.HAZMAT: "high",
+    EmergencyServiceType.MENTAL_HEALTH: "high",
+    EmergencyServiceType.ANIMAL_CONTROL: "medium",
+    EmergencyServiceType.DISASTER_RESPONSE: "high",
+    EmergencyServiceType.FOOD_BANK: "low",
+    EmergencyServiceType.SHELTER: "medium",
+}
+
+SEVERITY_ORDER = ["critical", "high", "medium", "low"]
+
+# Questions and hypotheticals are not reports of an emergency in progress
+_QUESTION_PATTERN = re.compile(r"^\s*(what|how|should|can|could|is it|where|why|when)\b|\bwhat if\b|\bif there\b|\?", re.IGNORECASE)
+_NEGATION_PATTERN = re.compile(r"\b(no|not|isn't|wasn't|without)\s+(a\s+|any\s+)?$", re.IGNORECASE)
+
+
+def _compile(keywords: List[str]) -> re.Pattern:
+    alternatives = sorted((re.escape(k) for k in keywords), key=len, reverse=True)
+    return re.compile(r"\b(?:" + "|".join(alternatives) + r")\b", re.IGNORECASE)
+
+
+_SERVICE_PATTERNS = {service: _compile(words) for service, words in SERVICE_KEYWORDS.items()}
+_SEVERITY_PATTERNS = {severity: _compile(words) for severity, words in SEVERITY_KEYWORDS.items()}
+
+
+class TriageResult(BaseModel):
+    emergency_type: EmergencyServiceType
+    severity: str
+    confidence: float
+    matched_keywords: List[str] = []
+
+
+class FastTriage:
+    """Deterministic keyword classifier over EmergencyServiceType and severity"""
+
+    def __init__(self, threshold: Optional[float] = None):
+        self.threshold = threshold if threshold is not None else float(os.getenv("FAST_TRIAGE_THRESHOLD", "0.8"))
+
+    @staticmethod
+    def _matches(pattern: re.Pattern, text: str) -> List[str]:
+        """Return keyword hits in text, ignoring negated mentions such as "no fire" """
+        hits = []
+        for match in pattern.finditer(text):
+            if _NEGATION_PATTERN.search(text[max(0, match.start() - 12):match.start()]):
+                continue
+            hits.append(match.group(0).lower())
+        return hits
+
+    def classify(self, transcript: str) -> TriageResult:
+        """
+        Classify a transcript by keyword matching
+
+        Args:
+            transcript (str): The transcript text from emergency call/message
+
+        Returns:
+            TriageResult: Best service type, severity and a confidence in [0, 1]
+        """
+        text = transcript or ""
+        service_hits: Dict[EmergencyServiceType, List[str]] = {}
+        for service, pattern in _SERVICE_PATTERNS.items():
+            hits = self._matches(pattern, text)
+            if hits:
+                service_hits[service] = hits
+
+        if not service_hits:
+            return TriageResult(emergency_type=EmergencyServiceType.OTHER, severity="unknown", confidence=0.0)
+
+        ranked = sorted(service_hits.items(), key=lambda item: len(item[1]), reverse=True)
+        emergency_type, hits = ranked[0]
+
+        severity = None
+        severity_hits: List[str] = []
+        for level in SEVERITY_ORDER:
+            pattern = _SEVERITY_PATTERNS.get(level)
+            if pattern is None:
+                continue
+            severity_hits = self._matches(pattern, text)
+            if severity_hits:
+                severity = level
+                break
+
+        if len(ranked) == 1:
+            confidence = 0.6 + 0.15 * min(len(set(hits)), 2)
+            if severity == "critical":
+                confidence += 0.1
+        else:
+            # Competing services: confidence shrinks with the runner-up's share
+            total = sum(len(h) for _, h in ranked)
+            confidence = 0.6 * len(hits) / total
+
+        if _QUESTION_PATTERN.search(text):
+            confidence *= 0.5
+
+        return TriageResult(
+            emergency_type=emergency_type,
+            severity=severity or DEFAULT_SEVERITY.get(emergency_type, "medium"),
+            confidence=round(min(confidence, 0.95), 2),
+            matched_keywords=sorted(set(hits + severity_hits))
+        )
+
+    def is_confident(self, result: TriageResult) -> bool:
+        """Whether a result is certain enough to skip the LLM agent"""
+        return result.confidence >= self.threshold